@@ -0,0 +1,192 @@
+"""
+Control de admisión de la ingesta (POST /guardar-analisis/...).
+
+La decisión se toma solo con los headers, antes de leer el cuerpo: un bot con un bug o una
+tormenta de reintentos no llega a ocupar memoria ni un hilo con audios de 50 MB.
+
+- Token bucket por cliente y por usuario. Sin tokens: 429 con Retry-After (los segundos hasta el
+  próximo token). El cliente es la dirección de la conexión (scope['client']), no un header que
+  elige el cliente: detrás de un proxy hay que confiar en él con forwarded_allow_ips de
+  gunicorn/uvicorn para que esa dirección sea la del cliente real. El usuario es el header
+  X-User-Id, que la API exige igual al user_id que se guarda (ver main.py); sin header, el bucket
+  de usuario se cobra a la dirección del cliente.
+- Presupuesto de bytes en vuelo por worker: la suma de los Content-Length de las solicitudes
+  aceptadas que todavía no terminaron. Sin presupuesto: 503 con Retry-After.
+- Content-Length mayor que INGEST_MAX_BODY_BYTES: 413. Sin Content-Length (chunked) se reserva
+  el máximo, y en los dos casos se cuentan los bytes que de verdad llegan: al pasar el máximo se
+  corta la lectura con 413 (BodyTooLarge).
+
+Los buckets y el presupuesto son por worker: con gunicorn el límite efectivo es por worker.
+
+Variables de entorno (una tasa de 0 desactiva ese limitador):
+    INGEST_USER_RATE / INGEST_USER_BURST       solicitudes por segundo y ráfaga por usuario (0.5 / 5)
+    INGEST_CLIENT_RATE / INGEST_CLIENT_BURST   solicitudes por segundo y ráfaga por cliente (20 / 40)
+    INGEST_MAX_INFLIGHT_BYTES                  bytes en vuelo por worker (256 MiB; 0 desactiva)
+    INGEST_MAX_BODY_BYTES                      tamaño máximo de una solicitud (50 MiB)
+    INGEST_BUSY_RETRY_AFTER                    Retry-After de los 503, en segundos (2)
+"""
+
+import json
+import math
+import os
+import time
+from collections import OrderedDict
+
+from starlette.exceptions import HTTPException
+
+import metrics
+
+INGEST_PATH_PREFIX = '/guardar-analisis/'
+INGEST_USER_RATE = float(os.getenv('INGEST_USER_RATE', '0.5'))
+INGEST_USER_BURST = float(os.getenv('INGEST_USER_BURST', '5'))
+INGEST_CLIENT_RATE = float(os.getenv('INGEST_CLIENT_RATE', '20'))
+INGEST_CLIENT_BURST = float(os.getenv('INGEST_CLIENT_BURST', '40'))
+INGEST_MAX_INFLIGHT_BYTES = int(os.getenv('INGEST_MAX_INFLIGHT_BYTES', str(256 * 1024 * 1024)))
+INGEST_MAX_BODY_BYTES = int(os.getenv('INGEST_MAX_BODY_BYTES', str(50 * 1024 * 1024)))
+INGEST_BUSY_RETRY_AFTER = int(os.getenv('INGEST_BUSY_RETRY_AFTER', '2'))
+# Claves recordadas por limitador; la menos usada se descarta (equivale a un bucket lleno)
+BUCKET_MAX_KEYS = 100000
+
+
+class TokenBuckets:
+    """
+    Un token bucket por clave, con recarga perezosa al consultar. Corre en el event loop del
+    worker, así que no necesita locks.
+    """
+
+    def __init__(self, rate, burst, max_keys=BUCKET_MAX_KEYS):
+        self.rate = rate
+        self.burst = max(1.0, burst)
+        self.max_keys = max_keys
+        self.buckets = OrderedDict()  # clave -> (tokens, último instante)
+
+    def take(self, key, now=None):
+        """Consume un token. Devuelve 0 si se admitió, o los segundos hasta que haya uno."""
+        if self.rate <= 0:
+            return 0
+        now = time.monotonic() if now is None else now
+        tokens, updated = self.buckets.pop(key, (self.burst, now))
+        tokens = min(self.burst, tokens + (now - updated) * self.rate)
+        wait = 0 if tokens >= 1 else (1 - tokens) / self.rate
+        if not wait:
+            tokens -= 1
+        self.buckets[key] = (tokens, now)
+        if len(self.buckets) > self.max_keys:
+            self.buckets.popitem(last=False)
+        return wait
+
+
+class ByteBudget:
+    """Bytes de cuerpo en vuelo. Una solicitud sola siempre entra, aunque supere el límite."""
+
+    def __init__(self, limit):
+        self.limit = limit
+        self.in_flight = 0
+
+    def try_acquire(self, size):
+        if self.limit > 0 and self.in_flight and self.in_flight + size > self.limit:
+            return False
+        self.in_flight += size
+        metrics.INGEST_INFLIGHT_BYTES.inc(size)
+        return True
+
+    def release(self, size):
+        self.in_flight -= size
+        metrics.INGEST_INFLIGHT_BYTES.dec(size)
+
+
+class BodyTooLarge(HTTPException):
+    """
+    El cuerpo recibido superó INGEST_MAX_BODY_BYTES. Es un HTTPException para que FastAPI y
+    Request.form() lo dejen pasar tal cual y el handler de excepciones responda 413.
+    """
+
+    def __init__(self):
+        super().__init__(413, f"El cuerpo supera el máximo de {INGEST_MAX_BODY_BYTES} bytes", {'Connection': 'close'})
+
+
+def limit_body(receive):
+    """Envuelve receive: cuenta los bytes de cuerpo recibidos y lanza BodyTooLarge al pasar el máximo."""
+    received = 0
+
+    async def limited_receive():
+        nonlocal received
+        if received > INGEST_MAX_BODY_BYTES:
+            raise BodyTooLarge()
+        message = await receive()
+        if message['type'] == 'http.request':
+            received += len(message.get('body', b''))
+            if received > INGEST_MAX_BODY_BYTES:
+                metrics.ADMISSION_REJECTED.labels('too_large').inc()
+                raise BodyTooLarge()
+        return message
+
+    return limited_receive
+
+
+class AdmissionMiddleware:
+    """Middleware ASGI: aplica los limitadores a las solicitudes de ingesta antes de que se lea el cuerpo."""
+
+    def __init__(self, app):
+        self.app = app
+        self.users = TokenBuckets(INGEST_USER_RATE, INGEST_USER_BURST)
+        self.clients = TokenBuckets(INGEST_CLIENT_RATE, INGEST_CLIENT_BURST)
+        self.budget = ByteBudget(INGEST_MAX_INFLIGHT_BYTES)
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http' or scope['method'] != 'POST' or not scope['path'].startswith(INGEST_PATH_PREFIX):
+            await self.app(scope, receive, send)
+            return
+        headers = dict(scope.get('headers', ()))
+        content_length = headers.get(b'content-length')
+        size = int(content_length) if content_length and content_length.isdigit() else INGEST_MAX_BODY_BYTES
+        if size > INGEST_MAX_BODY_BYTES:
+            await reject(send, 413, 'too_large', f"El cuerpo supera el máximo de {INGEST_MAX_BODY_BYTES} bytes")
+            return
+
+        client_id = (scope.get('client') or ('desconocido',))[0]
+        wait = self.clients.take(client_id)
+        if wait:
+            await reject(send, 429, 'client_rate', "Demasiadas solicitudes de este cliente", wait)
+            return
+        user_id = headers.get(b'x-user-id', b'').decode('latin-1')
+        wait = self.users.take(f"user:{user_id}" if user_id else f"client:{client_id}")
+        if wait:
+            await reject(send, 429, 'user_rate', "Demasiadas solicitudes para este usuario", wait)
+            return
+
+        if not self.budget.try_acquire(size):
+            await reject(send, 503, 'busy', "El servidor está procesando demasiados datos, reintentar más tarde", INGEST_BUSY_RETRY_AFTER)
+            return
+        response_started = False
+
+        async def tracked_send(message):
+            nonlocal response_started
+            response_started = response_started or message['type'] == 'http.response.start'
+            await send(message)
+
+        try:
+            # Content-Length puede faltar (chunked) o no coincidir: se limita lo que llega
+            await self.app(scope, limit_body(receive), tracked_send)
+        except BodyTooLarge as e:
+            # Normalmente lo responde el handler de excepciones; esto cubre lecturas fuera de la ruta
+            if response_started:
+                raise
+            await reject(send, 413, None, e.detail)
+        finally:
+            self.budget.release(size)
+
+
+async def reject(send, status, reason, detail, retry_after=None):
+    """
+    Responde sin leer el cuerpo, con el mismo formato {'detail': ...} que HTTPException. reason es
+    la etiqueta de clutch_admission_rejected_total (None si ya se contó).
+    """
+    if reason is not None:
+        metrics.ADMISSION_REJECTED.labels(reason).inc()
+    body = json.dumps({'detail': detail}, ensure_ascii=False).encode('utf-8')
+    headers = [(b'content-type', b'application/json'), (b'content-length', str(len(body)).encode()), (b'connection', b'close')]
+    if retry_after is not None:
+        headers.append((b'retry-after', str(max(1, math.ceil(retry_after))).encode()))
+    await send({'type': 'http.response.start', 'status': status, 'headers': headers})
+    await send({'type': 'http.response.body', 'body': body})
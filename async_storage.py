@@ -0,0 +1,548 @@
+"""
+Acceso asíncrono a S3 y DynamoDB para los handlers de la API (aiobotocore).
+
+Con boto3 cada operación ocupa un hilo del executor de asyncio mientras espera la red, y el hilo
+retiene el audio del request: con pocos hilos los requests hacen cola y con muchos se dispara la
+memoria. Acá las subidas, los HEAD y las operaciones de DynamoDB son corutinas que corren en el
+event loop; un worker puede tener cientos en vuelo. AWS_ASYNC_MAX_CONCURRENCY acota las llamadas
+a AWS simultáneas por worker (y el tamaño del pool de conexiones de aiohttp).
+
+Los clientes se crean en el lifespan de main.py (start/close). Sin aiobotocore instalado, o con
+AWS_ASYNC=false, la capa queda inactiva y la API sigue usando dynamodb_config/s3_config en hilos.
+Los nombres de archivo, las keys, el cache de keys existentes y el formato del item son los mismos
+de s3_config y dynamodb_config: ambos caminos escriben exactamente lo mismo.
+"""
+
+import asyncio
+import os
+import uuid
+from contextlib import AsyncExitStack
+from typing import Dict
+
+import aws_clients
+import dynamodb_config
+import metrics
+import text_compression
+from log_config import get_logger
+from s3_config import (COLD_AUDIO_PREFIX, COLD_STORAGE_CLASS, MULTIPART_CONCURRENCY, MULTIPART_PART_SIZE,
+                       MULTIPART_THRESHOLD, WARM_UP_KEY, is_not_found, s3_manager,
+                       warm_up_reached)
+from tracing import traced
+
+logger = get_logger('async_storage')
+
+AWS_ASYNC = os.getenv('AWS_ASYNC', 'true').lower() == 'true'
+AWS_ASYNC_MAX_CONCURRENCY = max(1, int(os.getenv('AWS_ASYNC_MAX_CONCURRENCY', '256')))
+
+_exit_stack = None
+_s3 = None
+_dynamodb = None
+_limit = None
+_serializer = None
+_deserializer = None
+
+
+async def start():
+    """
+    Crea los clientes asíncronos del worker (sin llamadas de red). Devuelve True si la capa quedó
+    activa; con False la API usa el camino con hilos.
+    """
+    global _exit_stack, _s3, _dynamodb, _limit, _serializer, _deserializer
+    if not AWS_ASYNC or _exit_stack is not None:
+        return active()
+    exit_stack = AsyncExitStack()
+    try:
+        from boto3.dynamodb.types import TypeDeserializer, TypeSerializer
+        if s3_manager.available:
+            _s3 = await aws_clients.create_async_client('s3', s3_manager.region, exit_stack, AWS_ASYNC_MAX_CONCURRENCY)
+        if dynamodb_config.DYNAMODB_REGION and dynamodb_config.DYNAMODB_TABLE_NAME:
+            _dynamodb = await aws_clients.create_async_client('dynamodb', dynamodb_config.DYNAMODB_REGION, exit_stack, AWS_ASYNC_MAX_CONCURRENCY)
+    except ImportError:
+        logger.warning("aiobotocore no está instalado: la API usa boto3 en hilos.")
+        await exit_stack.aclose()
+        _s3 = _dynamodb = None
+        return False
+    _serializer, _deserializer = TypeSerializer(), TypeDeserializer()
+    _limit = asyncio.Semaphore(AWS_ASYNC_MAX_CONCURRENCY)
+    _exit_stack = exit_stack
+    logger.info("Capa asíncrona de AWS activa", extra={'s3': _s3 is not None, 'dynamodb': _dynamodb is not None,
+                                                      'max_concurrency': AWS_ASYNC_MAX_CONCURRENCY})
+    return active()
+
+
+async def close():
+    """Cierra los clientes y sus conexiones (apagado del worker)."""
+    global _exit_stack, _s3, _dynamodb
+    if _exit_stack is not None:
+        await _exit_stack.aclose()
+    _exit_stack = _s3 = _dynamodb = None
+
+
+def active():
+    return _s3 is not None or _dynamodb is not None
+
+
+async def _call(client, operation, **params):
+    async with _limit:
+        return await getattr(client, operation)(**params)
+
+
+async def _warm_up_s3():
+    response = await _call(_s3, 'get_object', Bucket=s3_manager.bucket_name, Key=WARM_UP_KEY, Range='bytes=0-0')
+    async with response['Body'] as body:
+        await body.read()
+
+
+async def warm_up():
+    """GET de s3_config.WARM_UP_KEY y DescribeTable: resuelve credenciales y deja una conexión abierta por servicio."""
+    checks = []
+    if _s3 is not None:
+        checks.append(_warm_up_s3())
+    if _dynamodb is not None:
+        checks.append(_call(_dynamodb, 'describe_table', TableName=dynamodb_config.DYNAMODB_TABLE_NAME))
+    ok = True
+    for outcome in await asyncio.gather(*checks, return_exceptions=True):
+        if isinstance(outcome, Exception) and not warm_up_reached(outcome):
+            logger.error("Error en el warm-up de la capa asíncrona de AWS: %s", outcome)
+            ok = False
+    return ok
+
+
+# --- S3 ---
+
+async def head_audio(key):
+    """Como S3Manager.head_audio: {'size', 'content_type'} o None si no existe o no se pudo consultar."""
+    if _s3 is None:
+        return None
+    try:
+        response = await _call(_s3, 'head_object', Bucket=s3_manager.bucket_name, Key=key)
+        return {'size': response.get('ContentLength', 0), 'content_type': response.get('ContentType', '')}
+    except Exception as e:
+        logger.error("Error checking S3 object %s: %s", key, e)
+        return None
+
+
+async def object_exists(key):
+    """HEAD con el mismo cache de keys confirmadas que S3Manager.object_exists (y, como ella, solo un 404 es False)."""
+    if _s3 is None:
+        return False
+    if s3_manager.is_known_existing(key):
+        return True
+    try:
+        await _call(_s3, 'head_object', Bucket=s3_manager.bucket_name, Key=key)
+    except Exception as e:
+        if is_not_found(e):
+            return False
+        logger.error("Error checking S3 object %s: %s", key, e)
+        raise
+    s3_manager.remember_existing(key)
+    return True
+
+
+async def find_existing_audio(data, user_id, extension):
+    """Como S3Manager.find_existing_audio. El sha256 de un audio grande se calcula en un hilo (hashlib libera el GIL)."""
+    filename = await metrics.to_thread(s3_manager.content_filename, data, extension)
+    return filename, await object_exists(s3_manager.audio_key(user_id, filename))
+
+
+async def upload_audio_deduplicated(data, user_id, filename=None, content_type='audio/mpeg', extension='mp3', known_absent=False):
+    """Como S3Manager.upload_audio_deduplicated. Devuelve (url, key, subido)."""
+    if _s3 is None:
+        return '', '', False
+    filename = filename or await metrics.to_thread(s3_manager.content_filename, data, extension)
+    key = s3_manager.audio_key(user_id, filename)
+    if not known_absent and await object_exists(key):
+        return s3_manager.object_url(key), key, False
+    if not await _upload_object(key, data, content_type):
+        return '', '', False
+    s3_manager.remember_existing(key)
+    return s3_manager.object_url(key), key, True
+
+
+async def upload_original_audio(data, user_id, filename, content_type='audio/mpeg'):
+    """Como S3Manager.upload_original_audio: guarda el original en el prefijo frío."""
+    if _s3 is None:
+        return ''
+    key = f"{COLD_AUDIO_PREFIX}/{user_id}/{filename}"
+    if await object_exists(key):
+        return s3_manager.object_url(key)
+    if not await _upload_object(key, data, content_type, storage_class=COLD_STORAGE_CLASS):
+        return ''
+    s3_manager.remember_existing(key)
+    return s3_manager.object_url(key)
+
+
+async def put_bytes(key, data, content_type='application/octet-stream'):
+    """Como S3Manager.put_bytes: sube un objeto chico en un solo PUT. Devuelve True si se subió."""
+    if _s3 is None:
+        return False
+    try:
+        await _call(_s3, 'put_object', Bucket=s3_manager.bucket_name, Key=key, Body=data, ContentType=content_type)
+        s3_manager.remember_existing(key)
+        return True
+    except Exception as e:
+        logger.error("Error uploading %s to S3: %s", key, e)
+        return False
+
+
+async def get_bytes(key):
+    """Como S3Manager.get_bytes: el objeto completo, o None si no existe o no se pudo leer."""
+    if _s3 is None:
+        return None
+    try:
+        response = await _call(_s3, 'get_object', Bucket=s3_manager.bucket_name, Key=key)
+        async with response['Body'] as body:
+            return await body.read()
+    except Exception as e:
+        if getattr(e, 'response', {}).get('Error', {}).get('Code') not in ('NoSuchKey', '404'):
+            logger.error("Error downloading %s from S3: %s", key, e)
+        return None
+
+
+async def _upload_object(key, data, content_type, storage_class=None):
+    extra_args = {'ContentType': content_type}
+    if storage_class:
+        extra_args['StorageClass'] = storage_class
+    try:
+        if len(data) <= MULTIPART_THRESHOLD:
+            await _call(_s3, 'put_object', Bucket=s3_manager.bucket_name, Key=key, Body=data, **extra_args)
+        else:
+            await _multipart_upload(key, data, extra_args)
+        return True
+    except Exception as e:
+        logger.error("Error uploading to S3: %s", e)
+        return False
+
+
+async def _multipart_upload(key, data, extra_args):
+    """Partes de MULTIPART_PART_SIZE, hasta MULTIPART_CONCURRENCY en vuelo por subida (solo se copian las partes en vuelo)."""
+    bucket = s3_manager.bucket_name
+    upload = await _call(_s3, 'create_multipart_upload', Bucket=bucket, Key=key, **extra_args)
+    upload_id = upload['UploadId']
+    view = memoryview(data)
+    part_slots = asyncio.Semaphore(MULTIPART_CONCURRENCY)
+
+    async def upload_part(part_number, offset):
+        async with part_slots:
+            response = await _call(_s3, 'upload_part', Bucket=bucket, Key=key, UploadId=upload_id,
+                                   PartNumber=part_number, Body=view[offset:offset + MULTIPART_PART_SIZE].tobytes())
+        return {'PartNumber': part_number, 'ETag': response['ETag']}
+
+    tasks = [asyncio.ensure_future(upload_part(number, offset))
+             for number, offset in enumerate(range(0, len(data), MULTIPART_PART_SIZE), start=1)]
+    try:
+        completed = await asyncio.gather(*tasks)
+        await _call(_s3, 'complete_multipart_upload', Bucket=bucket, Key=key, UploadId=upload_id,
+                    MultipartUpload={'Parts': completed})
+    except BaseException:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        try:
+            await _call(_s3, 'abort_multipart_upload', Bucket=bucket, Key=key, UploadId=upload_id)
+        except Exception as abort_error:
+            logger.error("Error aborting multipart upload for %s: %s", key, abort_error)
+        raise
+
+
+# --- DynamoDB ---
+
+def _serialize_item(item):
+    return {key: _serializer.serialize(value) for key, value in item.items()}
+
+
+def _deserialize_item(item):
+    return {key: _deserializer.deserialize(value) for key, value in item.items()}
+
+
+async def _upload_role_audio(role, user_id, audio_key, audio_data, audio_filename, content_type, audio_format):
+    """Sube (o referencia) el audio de un rol como en save_analysis_complete. Devuelve (url, key)."""
+    if _s3 is not None and audio_key:
+        url = s3_manager.object_url(audio_key)
+        logger.debug("Audio del %s ya está en S3: %s", role, url)
+        return url, audio_key
+    if _s3 is None or not audio_data:
+        return '', audio_key
+    # Un audio_filename viene de find_existing_audio, que ya lo encontró ausente
+    url, key, uploaded = await upload_audio_deduplicated(audio_data, user_id, audio_filename, content_type, audio_format,
+                                                         known_absent=bool(audio_filename))
+    if not url:
+        logger.warning("No se pudo subir audio del %s a S3.", role)
+    elif uploaded:
+        logger.info("Audio del %s subido a S3: %s", role, url)
+    else:
+        logger.info("Audio del %s ya existía en S3, se reutiliza: %s", role, url)
+    return url, key
+
+
+async def _upload_original(role, user_id, original_data):
+    filename = await metrics.to_thread(s3_manager.content_filename, original_data, 'mp3')
+    url = await upload_original_audio(original_data, user_id, filename)
+    if url:
+        logger.info("Audio original del %s guardado en almacenamiento frío: %s", role, url)
+    else:
+        logger.warning("No se pudo guardar el audio original del %s.", role)
+    return url
+
+
+async def prepare_analysis_item(
+    user_id: str,
+    analysis_text: str,
+    player_audio_data: bytes,
+    coach_audio_data: bytes,
+    base_filename: str,
+    transcription: str,
+    tts_preferences: dict,
+    user_personality_test: list,
+    wpm: float = 0.0,
+    wmp_by_segment: dict = None,
+    loudness_by_second: list = None,
+    player_audio_key: str = None,
+    coach_audio_key: str = None,
+    analysis_id: str = None,
+    audio_format: str = 'mp3',
+    player_original_audio_data: bytes = None,
+    coach_original_audio_data: bytes = None,
+    player_audio_filename: str = None,
+    coach_audio_filename: str = None,
+    structured_analysis: str = None,
+    username: str = None,
+    fecha_analisis: str = None
+) -> Dict:
+    """
+    Versión asíncrona de dynamodb_config.prepare_analysis_item: sube los audios del jugador y del
+    coach, y los originales, en paralelo y arma el item (con los textos comprimidos) sin escribirlo.
+    """
+    analysis_id = analysis_id or str(uuid.uuid4())
+    content_type = dynamodb_config.AUDIO_CONTENT_TYPES.get(audio_format, 'audio/mpeg')
+
+    uploads = [
+        _upload_role_audio('jugador', user_id, player_audio_key, player_audio_data, player_audio_filename, content_type, audio_format),
+        _upload_role_audio('coach', user_id, coach_audio_key, coach_audio_data, coach_audio_filename, content_type, audio_format),
+    ]
+    original_roles = []
+    if _s3 is not None:
+        for role, original_data in (('player', player_original_audio_data), ('coach', coach_original_audio_data)):
+            if original_data:
+                original_roles.append(role)
+                uploads.append(_upload_original(role, user_id, original_data))
+    outcomes = await asyncio.gather(*uploads, return_exceptions=True)
+    for position, outcome in enumerate(outcomes):
+        if isinstance(outcome, Exception):
+            logger.warning("Error subiendo audio a S3: %s", outcome)
+            outcomes[position] = ('', None) if position < 2 else ''
+    (player_s3_url, player_audio_key), (coach_s3_url, coach_audio_key) = outcomes[:2]
+    original_urls = {role: url for role, url in zip(original_roles, outcomes[2:]) if url}
+    item = dynamodb_config.build_analysis_item(
+        analysis_id=analysis_id,
+        user_id=user_id,
+        analysis_text=analysis_text,
+        transcription=transcription,
+        tts_preferences=tts_preferences,
+        user_personality_test=user_personality_test,
+        wpm=wpm,
+        wmp_by_segment=wmp_by_segment,
+        loudness_by_second=loudness_by_second,
+        player_s3_url=player_s3_url,
+        coach_s3_url=coach_s3_url,
+        player_audio_key=player_audio_key,
+        coach_audio_key=coach_audio_key,
+        original_urls=original_urls,
+        structured_analysis=structured_analysis,
+        username=username,
+        fecha_analisis=fecha_analisis
+    )
+    overflow = text_compression.encode_item_texts(item)
+    stored = await asyncio.gather(*(put_bytes(key, blob) for _, key, blob in overflow))
+    for (field, _, blob), ok in zip(overflow, stored):
+        if not ok:
+            logger.warning("No se pudo guardar %s en S3, queda en el item", field, extra={'analysis_id': analysis_id})
+            item[field] = blob
+    return item
+
+
+@traced('save_analysis_complete')
+async def save_analysis_complete(
+    user_id: str,
+    analysis_text: str,
+    player_audio_data: bytes,
+    coach_audio_data: bytes,
+    base_filename: str,
+    transcription: str,
+    tts_preferences: dict,
+    user_personality_test: list,
+    wpm: float = 0.0,
+    wmp_by_segment: dict = None,
+    loudness_by_second: list = None,
+    player_audio_key: str = None,
+    coach_audio_key: str = None,
+    analysis_id: str = None,
+    audio_format: str = 'mp3',
+    player_original_audio_data: bytes = None,
+    coach_original_audio_data: bytes = None,
+    player_audio_filename: str = None,
+    coach_audio_filename: str = None,
+    structured_analysis: str = None,
+    username: str = None,
+    fecha_analisis: str = None,
+    idempotent: bool = False
+) -> Dict:
+    """
+    Versión asíncrona de dynamodb_config.save_analysis_complete (mismos argumentos y resultado).
+    Los audios se suben en paralelo (prepare_analysis_item).
+    """
+    result = {
+        'success': False,
+        'analysis_id': "local-" + str(uuid.uuid4()),
+        'player_s3_url': '',
+        'coach_s3_url': '',
+        'error': '',
+        # Echo back for debugging
+        'echo_user_preferences': tts_preferences or {}
+    }
+    analysis_id = analysis_id or str(uuid.uuid4())
+    item = await prepare_analysis_item(
+        user_id=user_id,
+        analysis_text=analysis_text,
+        player_audio_data=player_audio_data,
+        coach_audio_data=coach_audio_data,
+        base_filename=base_filename,
+        transcription=transcription,
+        tts_preferences=tts_preferences,
+        user_personality_test=user_personality_test,
+        wpm=wpm,
+        wmp_by_segment=wmp_by_segment,
+        loudness_by_second=loudness_by_second,
+        player_audio_key=player_audio_key,
+        coach_audio_key=coach_audio_key,
+        analysis_id=analysis_id,
+        audio_format=audio_format,
+        player_original_audio_data=player_original_audio_data,
+        coach_original_audio_data=coach_original_audio_data,
+        player_audio_filename=player_audio_filename,
+        coach_audio_filename=coach_audio_filename,
+        structured_analysis=structured_analysis,
+        username=username,
+        fecha_analisis=fecha_analisis
+    )
+    result['player_s3_url'] = item['player_audio_url'] or ''
+    result['coach_s3_url'] = item['coach_audio_url'] or ''
+
+    if _dynamodb is None:
+        result['error'] = 'DynamoDB no está disponible.'
+        logger.warning("DynamoDB no disponible, análisis no guardado en la nube.")
+        return result
+
+    try:
+        await _call(_dynamodb, 'put_item', TableName=dynamodb_config.DYNAMODB_TABLE_NAME, Item=_serialize_item(item),
+                    **dynamodb_config.conditional_put_arguments(idempotent))
+        result['success'] = True
+        result['analysis_id'] = analysis_id
+        logger.info("Análisis guardado en DynamoDB", extra={'analysis_id': analysis_id, 'user_id': user_id})
+    except Exception as e:
+        if idempotent and dynamodb_config.is_conditional_check_failed(e):
+            try:
+                response = await _call(_dynamodb, 'get_item', TableName=dynamodb_config.DYNAMODB_TABLE_NAME,
+                                       Key={'id': {'S': analysis_id}}, ConsistentRead=True)
+                return dynamodb_config.existing_analysis_result(_deserialize_item(response.get('Item', {})), analysis_id, user_id)
+            except Exception as read_error:
+                e = read_error
+        result['error'] = f"Error al guardar en DynamoDB: {e}"
+        logger.error("Error guardando análisis en DynamoDB: %s", e, extra={'analysis_id': analysis_id, 'user_id': user_id})
+    return result
+
+
+async def _write_chunk(chunk):
+    """Un BatchWriteItem (hasta 25 items), reenviando los UnprocessedItems con backoff."""
+    table = dynamodb_config.DYNAMODB_TABLE_NAME
+    request = {table: [{'PutRequest': {'Item': _serialize_item(item)}} for item in chunk]}
+    for attempt in range(dynamodb_config.BATCH_MAX_ATTEMPTS):
+        if attempt:
+            await asyncio.sleep(dynamodb_config.BATCH_RETRY_BASE_DELAY * 2 ** attempt)
+        response = await _call(_dynamodb, 'batch_write_item', RequestItems=request)
+        request = response.get('UnprocessedItems')
+        if not request:
+            return
+    raise RuntimeError("DynamoDB dejó items sin escribir después de varios reintentos")
+
+
+@traced('write_analysis_items')
+async def write_analysis_items(items) -> Dict:
+    """
+    Versión asíncrona de dynamodb_config.write_analysis_items: los BatchWriteItem de 25 items
+    se envían en paralelo (acotados por AWS_ASYNC_MAX_CONCURRENCY).
+    """
+    if _dynamodb is None:
+        return {'success': False, 'errors': ['DynamoDB no está disponible.'] * len(items)}
+    size = dynamodb_config.BATCH_WRITE_SIZE
+    chunks = [items[start:start + size] for start in range(0, len(items), size)]
+    outcomes = await asyncio.gather(*(_write_chunk(chunk) for chunk in chunks), return_exceptions=True)
+    errors = []
+    for chunk, outcome in zip(chunks, outcomes):
+        if isinstance(outcome, Exception):
+            logger.error("Error guardando un lote de análisis en DynamoDB: %s", outcome, extra={'items': len(chunk)})
+            errors.extend([f"Error al guardar en DynamoDB: {outcome}"] * len(chunk))
+        else:
+            errors.extend([''] * len(chunk))
+    logger.info("Lote de análisis guardado en DynamoDB", extra={'items': len(items), 'failed': sum(1 for error in errors if error)})
+    return {'success': not any(errors), 'errors': errors}
+
+
+async def _get_chunk(analysis_ids):
+    table = dynamodb_config.DYNAMODB_TABLE_NAME
+    request = {table: {'Keys': [{'id': {'S': analysis_id}} for analysis_id in analysis_ids], 'ConsistentRead': True}}
+    found = []
+    for attempt in range(dynamodb_config.BATCH_MAX_ATTEMPTS):
+        if attempt:
+            await asyncio.sleep(dynamodb_config.BATCH_RETRY_BASE_DELAY * 2 ** attempt)
+        response = await _call(_dynamodb, 'batch_get_item', RequestItems=request)
+        found.extend(_deserialize_item(item) for item in response.get('Responses', {}).get(table, []))
+        request = response.get('UnprocessedKeys')
+        if not request:
+            return found
+    raise RuntimeError("DynamoDB dejó ids sin leer después de varios reintentos")
+
+
+@traced('get_existing_analyses')
+async def get_existing_analyses(analysis_ids) -> Dict:
+    """Versión asíncrona de dynamodb_config.get_existing_analyses (BatchGetItem en paralelo)."""
+    if _dynamodb is None:
+        return {'success': False, 'error': 'DynamoDB no está disponible.'}
+    size = dynamodb_config.BATCH_GET_SIZE
+    try:
+        chunks = await asyncio.gather(*(_get_chunk(analysis_ids[start:start + size])
+                                        for start in range(0, len(analysis_ids), size)))
+        return {'success': True, 'data': {item['id']: item for chunk in chunks for item in chunk}}
+    except Exception as e:
+        error_message = f"Error al leer análisis de DynamoDB: {e}"
+        logger.error(error_message)
+        return {'success': False, 'error': error_message}
+
+
+@traced('get_analyses_by_user')
+async def get_analyses_by_user(user_id: str) -> Dict:
+    """
+    Versión asíncrona de dynamodb_config.get_analyses_by_user (misma consulta al índice
+    user_id-index, con los textos ya descomprimidos).
+    """
+    if _dynamodb is None:
+        return {'success': False, 'error': 'DynamoDB no está disponible.'}
+    try:
+        response = await _call(
+            _dynamodb, 'query',
+            TableName=dynamodb_config.DYNAMODB_TABLE_NAME,
+            IndexName='user_id-index',
+            KeyConditionExpression='user_id = :user_id',
+            ExpressionAttributeValues={':user_id': {'S': user_id}}
+        )
+        items = [_deserialize_item(item) for item in response.get('Items', [])]
+        # Textos comprimidos: se descomprimen acá; los que están en S3 se descargan en paralelo
+        pending = [(item, field, key) for item in items for field, key in text_compression.decode_item_texts(item)]
+        blobs = await asyncio.gather(*(get_bytes(key) for _, _, key in pending))
+        for (item, field, key), blob in zip(pending, blobs):
+            text_compression.resolve_overflow(item, field, key, blob)
+        return {'success': True, 'data': items}
+    except Exception as e:
+        error_message = f"Error al obtener análisis de DynamoDB: {e}"
+        logger.error(error_message)
+        return {'success': False, 'error': error_message}
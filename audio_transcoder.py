@@ -0,0 +1,83 @@
+"""
+Transcodificación opcional de audio a Opus mono para almacenamiento y reproducción.
+
+El audio de los jugadores llega como MP3 estéreo 48 kHz / 128 kbps, que es excesivo
+para una sola voz. Con AUDIO_TRANSCODE_OPUS=true la API lo convierte a Opus mono a
+bitrate de voz antes de subirlo a S3. La conversión usa ffmpeg dentro de un pool de
+procesos para no bloquear el event loop.
+"""
+
+import asyncio
+import os
+import subprocess
+from concurrent.futures import ProcessPoolExecutor
+
+from log_config import get_logger
+
+TRANSCODE_ENABLED = os.getenv('AUDIO_TRANSCODE_OPUS', 'false').lower() == 'true'
+# Guardar también el MP3 original en el prefijo frío de S3
+KEEP_ORIGINAL = os.getenv('AUDIO_KEEP_ORIGINAL', 'false').lower() == 'true'
+OPUS_BITRATE = os.getenv('AUDIO_OPUS_BITRATE', '24k')
+TRANSCODE_WORKERS = max(1, int(os.getenv('AUDIO_TRANSCODE_WORKERS', '2')))
+TRANSCODE_TIMEOUT = int(os.getenv('AUDIO_TRANSCODE_TIMEOUT', '120'))
+FFMPEG_BIN = os.getenv('FFMPEG_BIN', 'ffmpeg')
+
+OPUS_EXTENSION = 'ogg'
+OPUS_CONTENT_TYPE = 'audio/ogg'
+
+_pool = None
+logger = get_logger('transcoder')
+
+
+def transcode_to_opus(audio_bytes: bytes, bitrate: str = OPUS_BITRATE):
+    """
+    Convierte audio (cualquier formato que entienda ffmpeg) a Opus mono en contenedor Ogg.
+    Devuelve los bytes resultantes o None si ffmpeg no está disponible o falla.
+    """
+    if not audio_bytes:
+        return None
+    command = [
+        FFMPEG_BIN, '-hide_banner', '-loglevel', 'error',
+        '-i', 'pipe:0',
+        '-vn', '-ac', '1',
+        '-c:a', 'libopus', '-b:a', bitrate,
+        '-application', 'voip', '-vbr', 'on', '-compression_level', '10',
+        '-map_metadata', '-1', '-fflags', '+bitexact',
+        '-f', 'ogg', 'pipe:1'
+    ]
+    try:
+        completed = subprocess.run(command, input=audio_bytes, capture_output=True, timeout=TRANSCODE_TIMEOUT)
+    except (OSError, subprocess.TimeoutExpired) as e:
+        logger.warning("No se pudo transcodificar a Opus: %s", e)
+        return None
+    if completed.returncode != 0 or not completed.stdout:
+        logger.warning("ffmpeg falló transcodificando a Opus: %s", completed.stderr.decode('utf-8', 'replace').strip())
+        return None
+    return completed.stdout
+
+
+def get_transcode_pool() -> ProcessPoolExecutor:
+    """Pool de procesos compartido por el worker, creado en el primer uso."""
+    global _pool
+    if _pool is None:
+        _pool = ProcessPoolExecutor(max_workers=TRANSCODE_WORKERS)
+    return _pool
+
+
+async def transcode_to_opus_async(audio_bytes: bytes):
+    """Ejecuta transcode_to_opus en el pool de procesos sin bloquear el event loop."""
+    if not audio_bytes:
+        return None
+    loop = asyncio.get_running_loop()
+    try:
+        return await loop.run_in_executor(get_transcode_pool(), transcode_to_opus, audio_bytes)
+    except Exception as e:
+        logger.error("Error en el pool de transcodificación: %s", e)
+        return None
+
+
+def shutdown_transcode_pool():
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
@@ -0,0 +1,98 @@
+"""
+Clientes de AWS compartidos por s3_config y dynamodb_config.
+
+Todos salen de una misma boto3.Session (las credenciales se resuelven una sola vez por proceso)
+con una configuración afinada para la API: pool de conexiones del tamaño del thread pool,
+reintentos adaptativos y TCP keepalive para que las conexiones ociosas no se caigan entre picos.
+
+Los módulos que instrumentan clientes (metrics, tracing) se registran con on_client_created y
+reciben cada cliente apenas se crea, sin importar si eso ocurre en el arranque o en el primer uso.
+
+boto3 y botocore se importan al crear la primera Session/Config: importar este módulo es gratis
+para los scripts que no siempre llegan a hablar con AWS. create_async_client hace lo mismo con
+aiobotocore para la capa asíncrona de la API (async_storage.py).
+"""
+
+import os
+import threading
+
+AWS_MAX_POOL_CONNECTIONS = int(os.getenv('AWS_MAX_POOL_CONNECTIONS', '50'))
+AWS_RETRY_MODE = os.getenv('AWS_RETRY_MODE', 'adaptive')
+AWS_MAX_ATTEMPTS = int(os.getenv('AWS_MAX_ATTEMPTS', '5'))
+AWS_CONNECT_TIMEOUT = float(os.getenv('AWS_CONNECT_TIMEOUT', '5'))
+AWS_READ_TIMEOUT = float(os.getenv('AWS_READ_TIMEOUT', '30'))
+AWS_TCP_KEEPALIVE = os.getenv('AWS_TCP_KEEPALIVE', 'true').lower() == 'true'
+
+_session = None
+_session_lock = threading.Lock()
+_client_hooks = []
+
+
+def _config_options(max_pool_connections):
+    return {
+        'max_pool_connections': max_pool_connections,
+        'retries': {'mode': AWS_RETRY_MODE, 'total_max_attempts': AWS_MAX_ATTEMPTS},
+        'connect_timeout': AWS_CONNECT_TIMEOUT,
+        'read_timeout': AWS_READ_TIMEOUT,
+        'tcp_keepalive': AWS_TCP_KEEPALIVE,
+    }
+
+
+def client_config():
+    from botocore.config import Config
+    return Config(**_config_options(AWS_MAX_POOL_CONNECTIONS))
+
+
+def get_session():
+    """boto3.Session del proceso. Crear clientes desde una Session no es thread-safe: se hace bajo lock."""
+    global _session
+    if _session is None:
+        import boto3
+        _session = boto3.Session(
+            aws_access_key_id=os.getenv('AWS_ACCESS_KEY_ID'),
+            aws_secret_access_key=os.getenv('AWS_SECRET_ACCESS_KEY'),
+        )
+    return _session
+
+
+def on_client_created(hook):
+    """Registra hook(client), que se llama con cada cliente creado por este módulo."""
+    _client_hooks.append(hook)
+
+
+def _run_hooks(client):
+    for hook in _client_hooks:
+        hook(client)
+
+
+def create_client(service, region):
+    with _session_lock:
+        client = get_session().client(service, region_name=region, config=client_config())
+    _run_hooks(client)
+    return client
+
+
+def create_resource(service, region):
+    with _session_lock:
+        resource = get_session().resource(service, region_name=region, config=client_config())
+    _run_hooks(resource.meta.client)
+    return resource
+
+
+async def create_async_client(service, region, exit_stack, max_pool_connections=AWS_MAX_POOL_CONNECTIONS):
+    """
+    Cliente de aiobotocore con la misma configuración y los mismos hooks que los de boto3. El cliente
+    queda abierto hasta que se cierre exit_stack (un contextlib.AsyncExitStack del llamador).
+    Lanza ImportError si aiobotocore no está instalado.
+    """
+    from aiobotocore.config import AioConfig
+    from aiobotocore.session import get_session as get_aio_session
+    client = await exit_stack.enter_async_context(get_aio_session().create_client(
+        service,
+        region_name=region,
+        aws_access_key_id=os.getenv('AWS_ACCESS_KEY_ID'),
+        aws_secret_access_key=os.getenv('AWS_SECRET_ACCESS_KEY'),
+        config=AioConfig(**_config_options(max_pool_connections)),
+    ))
+    _run_hooks(client)
+    return client
@@ -0,0 +1,346 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Benchmark de extremo a extremo de la ingesta de la API (POST /guardar-analisis/ o, con --batch,
+POST /guardar-analisis/batch).
+
+Levanta un servidor moto local como reemplazo de S3 y DynamoDB, arranca main:app con uvicorn
+(AWS_ENDPOINT_URL apunta a moto) y reproduce subidas multipart como las del bot, con concurrencia
+y tamaños de audio configurables. Reporta RPS, latencias p50/p95/p99, RSS máximo por worker
+(VmHWM de /proc, solo Linux) y los bytes que la API copió hacia S3/DynamoDB por cada byte de audio
+recibido, y guarda el resultado en JSON para comparar entre versiones.
+
+Requiere moto[server] y uvicorn (no forman parte de requirements.txt).
+
+Uso:
+    python benchmarks/bench_api_ingest.py --requests 200 --concurrency 8 --sizes 256k,1m,4m --workers 2
+    python benchmarks/bench_api_ingest.py ... --compare benchmarks/results/api_ingest-base.json
+    python benchmarks/bench_api_ingest.py --requests 500 --sizes 64k --batch 50
+"""
+
+import argparse
+import json
+import os
+import random
+import socket
+import struct
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+import boto3
+import requests
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULTS_DIR = os.path.join(ROOT, 'benchmarks', 'results')
+
+BUCKET = 'clutch-bench'
+TABLE = 'clutch-bench-analyses'
+REGION = 'us-east-1'
+SIZE_UNITS = {'k': 1024, 'm': 1024 * 1024}
+
+
+def parse_size(text):
+    text = text.strip().lower()
+    if text and text[-1] in SIZE_UNITS:
+        return int(float(text[:-1]) * SIZE_UNITS[text[-1]])
+    return int(text)
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    if not ordered:
+        return 0.0
+    index = min(len(ordered) - 1, max(0, round(fraction * (len(ordered) - 1))))
+    return ordered[index]
+
+
+class CountingApp:
+    """Middleware WSGI que cuenta solicitudes y bytes de cuerpo recibidos por el reemplazo de AWS."""
+
+    def __init__(self, app):
+        self.app = app
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.bytes = 0
+
+    def __call__(self, environ, start_response):
+        with self.lock:
+            self.requests += 1
+            self.bytes += int(environ.get('CONTENT_LENGTH') or 0)
+        return self.app(environ, start_response)
+
+    def snapshot(self):
+        with self.lock:
+            return self.requests, self.bytes
+
+
+def start_aws_standin():
+    """Servidor moto en un hilo con el bucket y la tabla (con el GSI user_id-index) que usa la API."""
+    from moto.server import DomainDispatcherApplication, create_backend_app
+    from werkzeug.serving import WSGIRequestHandler, make_server
+
+    class QuietHandler(WSGIRequestHandler):
+        def log_request(self, *args, **kwargs):
+            pass
+
+    counter = CountingApp(DomainDispatcherApplication(create_backend_app))
+    server = make_server('127.0.0.1', 0, counter, threaded=True, request_handler=QuietHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    endpoint = f"http://127.0.0.1:{server.server_address[1]}"
+    session = boto3.session.Session(aws_access_key_id='bench', aws_secret_access_key='bench', region_name=REGION)
+    session.client('s3', endpoint_url=endpoint).create_bucket(Bucket=BUCKET)
+    session.client('dynamodb', endpoint_url=endpoint).create_table(
+        TableName=TABLE, BillingMode='PAY_PER_REQUEST',
+        AttributeDefinitions=[{'AttributeName': 'id', 'AttributeType': 'S'}, {'AttributeName': 'user_id', 'AttributeType': 'S'}],
+        KeySchema=[{'AttributeName': 'id', 'KeyType': 'HASH'}],
+        GlobalSecondaryIndexes=[{'IndexName': 'user_id-index', 'KeySchema': [{'AttributeName': 'user_id', 'KeyType': 'HASH'}],
+                                 'Projection': {'ProjectionType': 'ALL'}}],
+    )
+    return server, counter, endpoint, session
+
+
+def start_api(endpoint, workers, port, extra_env):
+    env = dict(
+        os.environ,
+        AWS_ENDPOINT_URL=endpoint, AWS_REGION=REGION, AWS_DEFAULT_REGION=REGION,
+        AWS_ACCESS_KEY_ID='bench', AWS_SECRET_ACCESS_KEY='bench',
+        S3_BUCKET_NAME=BUCKET, DYNAMODB_TABLE_NAME=TABLE,
+        # Sin límites de tasa: se mide el throughput de la ingesta, no admission.py (--env los reactiva)
+        **{'INGEST_USER_RATE': '0', 'INGEST_CLIENT_RATE': '0', **extra_env}
+    )
+    process = subprocess.Popen(
+        [sys.executable, '-m', 'uvicorn', 'main:app', '--host', '127.0.0.1', '--port', str(port),
+         '--workers', str(workers), '--log-level', 'warning'],
+        cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    base_url = f"http://127.0.0.1:{port}"
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise SystemExit(f"uvicorn terminó con código {process.returncode}")
+        try:
+            if requests.get(f"{base_url}/", timeout=1).ok:
+                return process, base_url
+        except requests.RequestException:
+            pass
+        time.sleep(0.2)
+    process.terminate()
+    raise SystemExit("La API no respondió a tiempo")
+
+
+def worker_pids(master_pid):
+    """PIDs que atienden solicitudes: los hijos del proceso uvicorn, o el propio proceso si no hay hijos."""
+    children = []
+    for entry in os.listdir('/proc'):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat") as stat_file:
+                fields = stat_file.read().rsplit(')', 1)[1].split()
+        except OSError:
+            continue
+        if int(fields[1]) == master_pid:
+            children.append(int(entry))
+    # multiprocessing agrega un proceso resource_tracker; no atiende solicitudes
+    workers = [pid for pid in children if 'resource_tracker' not in _cmdline(pid)]
+    return workers or [master_pid]
+
+
+def _cmdline(pid):
+    try:
+        with open(f"/proc/{pid}/cmdline", 'rb') as cmdline_file:
+            return cmdline_file.read().replace(b'\0', b' ').decode('utf-8', 'replace')
+    except OSError:
+        return ''
+
+
+def peak_rss_mb(pid):
+    """RSS máximo (VmHWM) de un proceso en MB, o None si no se puede leer."""
+    try:
+        with open(f"/proc/{pid}/status") as status_file:
+            for line in status_file:
+                if line.startswith('VmHWM:'):
+                    return round(int(line.split()[1]) / 1024, 1)
+    except OSError:
+        pass
+    return None
+
+
+def make_audio(size, index, seed):
+    """Audio sintético único por solicitud (las keys son por contenido: bytes repetidos no se volverían a subir)."""
+    body = random.Random(seed * 7919 + size).randbytes(size)
+    return struct.pack('>q', index) + body[8:]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--requests', type=int, default=100)
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--sizes', default='256k,1m,4m', help='Tamaños del audio del jugador, repartidos en ronda')
+    parser.add_argument('--coach-size', default='0', help='Tamaño del audio del coach (0 = sin audio del coach)')
+    parser.add_argument('--workers', type=int, default=1, help='Workers de uvicorn')
+    parser.add_argument('--warmup', type=int, default=5)
+    parser.add_argument('--batch', type=int, default=1, help='Análisis por solicitud a /guardar-analisis/batch (1 = /guardar-analisis/)')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--env', action='append', default=[], metavar='NOMBRE=VALOR', help='Variables extra para la API')
+    parser.add_argument('--label', default='', help='Etiqueta guardada en el resultado')
+    parser.add_argument('--output', help='Archivo JSON de salida (por defecto benchmarks/results/api_ingest-<fecha>.json)')
+    parser.add_argument('--compare', help='Resultado JSON anterior con el que comparar')
+    args = parser.parse_args()
+
+    sizes = [parse_size(size) for size in args.sizes.split(',') if size.strip()]
+    coach_size = parse_size(args.coach_size)
+    extra_env = dict(item.split('=', 1) for item in args.env)
+
+    aws_server, aws_counter, endpoint, session = start_aws_standin()
+    api_process, base_url = start_api(endpoint, args.workers, free_port(), extra_env)
+    local = threading.local()
+
+    def analysis(index):
+        """Campos y audios del análisis número index (como los manda el bot)."""
+        size = sizes[index % len(sizes)]
+        audio = {'player_audio': (f"bench_{index}.mp3", make_audio(size, index, args.seed), 'audio/mpeg')}
+        sent = size
+        if coach_size:
+            audio['coach_audio'] = ('coach.mp3', make_audio(coach_size, index + 1_000_000, args.seed), 'audio/mpeg')
+            sent += coach_size
+        fields = {
+            'user_id': f"bench-user-{index % 50}",
+            'analysis_text': 'Buena comunicación general; mejora los callouts en B.',
+            'transcription': 'dos en B, uno bajo, voy a rotar',
+            'tts_preferences': json.dumps({'elevenlabs_voice': 'bench', 'tts_speed': 'Normal'}),
+            'user_personality_test': json.dumps([3] * 10),
+        }
+        return fields, audio, sent
+
+    def post(task):
+        """Una solicitud: un análisis, o con --batch un lote multipart de hasta --batch análisis. Devuelve (segundos, guardados, status, bytes)."""
+        if not hasattr(local, 'session'):
+            local.session = requests.Session()
+        if args.batch > 1:
+            lines, files, sent = [], [], 0
+            for index in range(task * args.batch, min((task + 1) * args.batch, args.requests)):
+                fields, audio, size = analysis(index)
+                for role, part in audio.items():
+                    fields[role] = f"{role}_{index}"
+                    files.append((fields[role], part))
+                lines.append(json.dumps(fields))
+                sent += size
+            files.append(('manifest', ('manifest.ndjson', '\n'.join(lines).encode('utf-8'), 'application/x-ndjson')))
+            url, data = f"{base_url}/guardar-analisis/batch", None
+        else:
+            data, files, sent = analysis(task)
+            url = f"{base_url}/guardar-analisis/"
+        started = time.perf_counter()
+        try:
+            response = local.session.post(url, data=data, files=files, timeout=300)
+            status = response.status_code
+            body = response.json() if status == 200 else {}
+            saved = body.get('saved', 0) if args.batch > 1 else int(bool(body.get('success', False)))
+        except requests.RequestException:
+            saved, status = 0, None
+        return time.perf_counter() - started, saved, status, sent
+
+    try:
+        with ThreadPoolExecutor(max_workers=max(1, args.concurrency)) as executor:
+            list(executor.map(post, range(-args.warmup, 0)))
+            tasks = -(-args.requests // args.batch) if args.batch > 1 else args.requests
+            pids = worker_pids(api_process.pid)
+            aws_requests_before, aws_bytes_before = aws_counter.snapshot()
+            started = time.perf_counter()
+            results = list(executor.map(post, range(tasks)))
+            wall = time.perf_counter() - started
+        aws_requests, aws_bytes = aws_counter.snapshot()
+        aws_requests -= aws_requests_before
+        aws_bytes -= aws_bytes_before
+        workers = [{'pid': pid, 'peak_rss_mb': peak_rss_mb(pid)} for pid in pids]
+    finally:
+        api_process.terminate()
+        api_process.wait(timeout=30)
+
+    stored = 0
+    paginator = session.client('s3', endpoint_url=endpoint).get_paginator('list_objects_v2')
+    for page in paginator.paginate(Bucket=BUCKET):
+        stored += sum(obj['Size'] for obj in page.get('Contents', []))
+    aws_server.shutdown()
+
+    latencies = [elapsed for elapsed, _, _, _ in results]
+    succeeded = sum(saved for _, saved, _, _ in results)
+    bytes_sent = sum(sent for _, _, _, sent in results)
+    status_counts = {}
+    for _, _, status, _ in results:
+        status_counts[str(status)] = status_counts.get(str(status), 0) + 1
+
+    result = {
+        'benchmark': 'api_ingest',
+        'label': args.label,
+        'timestamp': datetime.now(timezone.utc).isoformat(),
+        'git_commit': subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, capture_output=True, text=True).stdout.strip(),
+        'config': {
+            'requests': args.requests, 'concurrency': args.concurrency, 'sizes': sizes, 'coach_size': coach_size,
+            'workers': args.workers, 'batch': args.batch, 'env': extra_env,
+        },
+        'results': {
+            # Análisis guardados por segundo (con --batch, cada solicitud lleva varios)
+            'rps': round(args.requests / wall, 2),
+            'http_requests': tasks,
+            'succeeded': succeeded,
+            'failed': args.requests - succeeded,
+            'status_counts': status_counts,
+            'latency_ms': {
+                'p50': round(percentile(latencies, 0.5) * 1000, 1),
+                'p95': round(percentile(latencies, 0.95) * 1000, 1),
+                'p99': round(percentile(latencies, 0.99) * 1000, 1),
+                'max': round(max(latencies) * 1000, 1),
+                'mean': round(sum(latencies) / len(latencies) * 1000, 1),
+            },
+            'bytes_sent': bytes_sent,
+            'bytes_stored': stored,
+            'aws_requests': aws_requests,
+            'bytes_to_aws': aws_bytes,
+            # Bytes enviados a S3/DynamoDB por cada byte de audio recibido
+            'copy_amplification': round(aws_bytes / bytes_sent, 2) if bytes_sent else None,
+            'peak_rss_mb_max': max((worker['peak_rss_mb'] or 0) for worker in workers),
+            'workers': workers,
+        },
+    }
+
+    output = args.output or os.path.join(RESULTS_DIR, f"api_ingest-{datetime.now().strftime('%Y%m%d-%H%M%S')}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w', encoding='utf-8') as output_file:
+        json.dump(result, output_file, indent=2, ensure_ascii=False)
+
+    summary = result['results']
+    latency = summary['latency_ms']
+    print(f"análisis: {args.requests}  solicitudes: {tasks}  concurrencia: {args.concurrency}  workers: {args.workers}  ok: {succeeded}")
+    print(f"RPS: {summary['rps']}  latencia (ms): p50 {latency['p50']}  p95 {latency['p95']}  p99 {latency['p99']}  máx {latency['max']}")
+    print(f"RSS máximo por worker (MB): {[worker['peak_rss_mb'] for worker in workers]}")
+    print(f"bytes enviados: {bytes_sent}  copiados a AWS: {aws_bytes} en {aws_requests} llamadas "
+          f"({summary['copy_amplification']}x)  en S3 al terminar: {stored}")
+    print(f"resultado guardado en {output}")
+
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as baseline_file:
+            baseline = json.load(baseline_file)['results']
+        print(f"\ncomparación con {args.compare}:")
+        rows = [('RPS', baseline['rps'], summary['rps'])]
+        rows += [(f"{name} (ms)", baseline['latency_ms'][name], latency[name]) for name in ('p50', 'p95', 'p99')]
+        rows += [('RSS máx (MB)', baseline['peak_rss_mb_max'], summary['peak_rss_mb_max']),
+                 ('amplificación', baseline['copy_amplification'], summary['copy_amplification'])]
+        for name, old, new in rows:
+            change = f"{(new - old) / old * 100:+.1f}%" if old else 'n/a'
+            print(f"  {name:<15} {old:>10} -> {new:>10}  {change}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,253 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Micro-benchmarks de las funciones que corren por cada grabación.
+
+Mide ops/seg (mejor de varias repeticiones) y memoria por operación (pico y bytes retenidos,
+con tracemalloc) para las métricas de esports_processor_simple.py, el perfil Big Five y la
+conversión a Decimal de dynamodb_config.py, y la extracción/limpieza de texto y el diezmado de
+gráficos de pdf_report.py, con entradas sintéticas de tamaño realista y extremo.
+
+Con --save el resultado se agrega a benchmarks/results/hot_paths.jsonl (con el commit de git);
+cada corrida se compara con la última guardada y --max-regression hace fallar la corrida si
+algún caso quedó más lento que el umbral.
+
+Uso:
+    python benchmarks/bench_hot_paths.py [--filter wpm] [--min-time 0.2] [--save] [--max-regression 0.15]
+"""
+
+import argparse
+import contextlib
+import json
+import os
+import random
+import subprocess
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timezone
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+HISTORY_PATH = os.path.join(ROOT, 'benchmarks', 'results', 'hot_paths.jsonl')
+
+with open(os.devnull, 'w') as _devnull, contextlib.redirect_stderr(_devnull):
+    import dynamodb_config  # noqa: E402
+    import esports_processor_simple as processor  # noqa: E402
+    import pdf_report  # noqa: E402
+
+VOCABULARY = [
+    'la', 'comunicación', 'del', 'equipo', 'fue', 'buena', 'pero', 'hubo', 'frustración', 'en',
+    'los', 'callout', 'de', 'rotación', '**clave**', '*rápido*', '`B-site`', 'coordinación', '—', '…',
+    'soluciones', 'jugador', 'enemigo', 'punto', 'A', 'ronda', '¿dónde?', '¡vamos!', 'excelente', 'bien',
+]
+KEYWORDS = ['comunicación', 'callout', 'equipo', 'frustración', 'soluciones', 'coordinación']
+PROFILES = ['E_alto__A_medio__N_bajo__C_alto__O_medio', 'E_bajo__A_alto__N_alto__C_bajo__O_alto', '', 'basura']
+
+CASES = []
+
+
+def case(name, size):
+    """Registra un caso: la función decorada prepara la entrada y devuelve el callable a medir."""
+    def register(setup):
+        CASES.append((f"{name}[{size}]", setup))
+        return setup
+    return register
+
+
+def words(count, seed=1):
+    rng = random.Random(seed)
+    return ' '.join(rng.choice(VOCABULARY) for _ in range(count))
+
+
+def segments(minutes, seed=2):
+    """Segmentos estilo Whisper verbose_json: ~1 cada 4 s con 6-14 palabras."""
+    rng = random.Random(seed)
+    result, start = [], 0.0
+    while start < minutes * 60:
+        end = start + rng.uniform(2.0, 6.0)
+        result.append({'start': start, 'end': end, 'text': words(rng.randint(6, 14), rng.random())})
+        start = end
+    return result
+
+
+def structured_text(items, seed=3):
+    rng = random.Random(seed)
+    improve = '\n'.join(f"- {words(rng.randint(8, 20), rng.random())}" for _ in range(items))
+    howto = '\n'.join(f"- {words(rng.randint(8, 20), rng.random())}" for _ in range(items))
+    return f'"Aspectos a mejorar":\n\n{improve}\n\n"Cómo mejorarlos":\n\n{howto}'
+
+
+def analysis_text(count, seed=4):
+    rng = random.Random(seed)
+    sentences = []
+    while count > 0:
+        length = min(count, rng.randint(8, 25))
+        opener = rng.choice(['Excelente', 'Muy bien', 'Buen trabajo', 'Hubo', 'Intenta'])
+        sentences.append(f"{opener} {words(length, rng.random())}.")
+        count -= length
+    return ' '.join(sentences)
+
+
+for _count in (500, 5000, 50000):
+    @case('calculate_wpm', f"{_count} palabras")
+    def _(count=_count):
+        text = words(count)
+        return lambda: processor.calculate_wpm(text, count / 2.2)
+
+for _minutes in (10, 60, 600):
+    @case('calculate_wpm_by_segment', f"{_minutes} min")
+    def _(minutes=_minutes):
+        data = segments(minutes)
+        return lambda: processor.calculate_wpm_by_segment(data)
+
+    @case('to_decimal_map', f"{_minutes} min")
+    def _(minutes=_minutes):
+        wpm = {f"Minuto {i + 1}": random.Random(i).randint(0, 200) for i in range(minutes)}
+        return lambda: dynamodb_config.to_decimal_map(wpm)
+
+
+@case('parse_profile_id', 'mixto')
+def _():
+    return lambda: [processor.parse_profile_id(profile) for profile in PROFILES]
+
+
+@case('build_personality_based_system_prompt', 'mixto')
+def _():
+    return lambda: [processor.build_personality_based_system_prompt('Valorant', profile) for profile in PROFILES]
+
+
+@case('calculate_profile_id', '10 respuestas')
+def _():
+    answers = [5, 1, 3, 3, 2, 4, 5, 5, 1, 1]
+    return lambda: dynamodb_config.calculate_profile_id(answers)
+
+
+for _count in (500, 5000, 20000):
+    @case('extract_fortalezas', f"{_count} palabras")
+    def _(count=_count):
+        text = analysis_text(count)
+        return lambda: pdf_report.extract_fortalezas(text)
+
+    @case('clean_text_for_pdf', f"{_count} palabras")
+    def _(count=_count):
+        text = analysis_text(count)
+        return lambda: pdf_report.clean_text_for_pdf(text)
+
+    @case('highlight_keywords', f"{_count} palabras")
+    def _(count=_count):
+        text = pdf_report.clean_text_for_pdf(analysis_text(count))
+        return lambda: pdf_report.highlight_keywords(text, KEYWORDS)
+
+for _items in (3, 300):
+    @case('extract_mejoras+recomendaciones', f"{_items} puntos")
+    def _(items=_items):
+        text = structured_text(items)
+        return lambda: (pdf_report.extract_mejoras(text), pdf_report.extract_recomendaciones(text))
+
+for _seconds in (600, 3600, 36000):
+    @case('decimate_min_max', f"{_seconds} s")
+    def _(seconds=_seconds):
+        rng = random.Random(seconds)
+        loudness = [rng.uniform(-60, 0) for _ in range(seconds)]
+        return lambda: pdf_report.decimate_min_max(loudness)
+
+
+def measure_speed(func, min_time, repeat):
+    """Mejor de `repeat` rondas; cada ronda ejecuta func suficientes veces para durar ~min_time."""
+    number = 1
+    while True:
+        started = time.perf_counter()
+        for _ in range(number):
+            func()
+        elapsed = time.perf_counter() - started
+        if elapsed >= min_time / 4 or number >= 1 << 24:
+            break
+        number *= 4
+    number = max(1, int(number * min_time / max(elapsed, 1e-9)))
+    best = float('inf')
+    for _ in range(repeat):
+        started = time.perf_counter()
+        for _ in range(number):
+            func()
+        best = min(best, (time.perf_counter() - started) / number)
+    return 1.0 / best
+
+
+def measure_memory(func):
+    """Pico de memoria asignada durante una llamada y bytes que siguen vivos mientras exista el resultado."""
+    tracemalloc.start()
+    try:
+        tracemalloc.reset_peak()
+        before, _ = tracemalloc.get_traced_memory()
+        result = func()
+        current, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    del result
+    return peak - before, current - before
+
+
+def load_last_run():
+    try:
+        with open(HISTORY_PATH, encoding='utf-8') as history:
+            lines = [line for line in history if line.strip()]
+    except FileNotFoundError:
+        return None
+    return json.loads(lines[-1]) if lines else None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--filter', default='', help='Solo casos cuyo nombre contenga este texto')
+    parser.add_argument('--min-time', type=float, default=0.2, help='Segundos por ronda de medición')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--save', action='store_true', help=f"Agregar el resultado a {os.path.relpath(HISTORY_PATH, ROOT)}")
+    parser.add_argument('--max-regression', type=float, help='Falla (código 1) si algún caso pierde más de esta fracción de ops/seg')
+    args = parser.parse_args()
+
+    previous = load_last_run()
+    previous_cases = previous['cases'] if previous else {}
+    results = {}
+    regressions = []
+
+    print(f"{'caso':<52} {'ops/seg':>12} {'pico KB':>9} {'retenido KB':>12} {'vs. anterior':>13}")
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stderr(devnull):
+        for name, setup in CASES:
+            if args.filter not in name:
+                continue
+            func = setup()
+            ops = measure_speed(func, args.min_time, args.repeat)
+            peak, retained = measure_memory(func)
+            results[name] = {'ops_per_sec': round(ops, 2), 'alloc_peak_bytes': peak, 'alloc_retained_bytes': retained}
+            change = ''
+            if name in previous_cases:
+                ratio = ops / previous_cases[name]['ops_per_sec'] - 1
+                change = f"{ratio * 100:+.1f}%"
+                if args.max_regression is not None and ratio < -args.max_regression:
+                    regressions.append((name, ratio))
+            print(f"{name:<52} {ops:>12,.1f} {peak / 1024:>9.1f} {retained / 1024:>12.1f} {change:>13}", file=sys.stdout)
+
+    if previous:
+        print(f"\ncomparado con {previous.get('git_commit') or '?'} ({previous.get('timestamp')})")
+
+    if args.save:
+        record = {
+            'timestamp': datetime.now(timezone.utc).isoformat(),
+            'git_commit': subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, capture_output=True, text=True).stdout.strip(),
+            'python': sys.version.split()[0],
+            'cases': results,
+        }
+        os.makedirs(os.path.dirname(HISTORY_PATH), exist_ok=True)
+        with open(HISTORY_PATH, 'a', encoding='utf-8') as history:
+            history.write(json.dumps(record, ensure_ascii=False) + '\n')
+        print(f"resultado agregado a {HISTORY_PATH}")
+
+    if regressions:
+        for name, ratio in regressions:
+            print(f"[REGRESIÓN] {name}: {ratio * 100:+.1f}% ops/seg", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Benchmark de esports_processor_simple.py (process_audio_stream) contra el stub de OpenAI.
+
+Levanta benchmarks/openai_stub.py en un hilo, lanza el procesador como lo hace el bot (un proceso
+por grabación, audio por stdin) con OPENAI_BASE_URL apuntando al stub, y reporta throughput,
+latencias p50/p95/p99 y cuántas solicitudes extra generaron los reintentos.
+
+Uso: python benchmarks/bench_processor.py [--runs 40] [--concurrency 4] [--error-rate 0.1]
+         [--latency transcriptions=lognormal:900:0.35] [--latency chat=uniform:150:450]
+"""
+
+import argparse
+import json
+import os
+import random
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from openai_stub import add_stub_arguments, make_server, stub_kwargs  # noqa: E402
+
+PROCESSOR = os.path.join(ROOT, 'esports_processor_simple.py')
+PREFERENCES = json.dumps({'game': 'Valorant', 'profile_id': 'E_medio__A_medio__N_medio__C_medio__O_medio'})
+# Llamadas a la API por grabación sin errores: transcripción, análisis y estructuración
+CALLS_PER_RUN = 3
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    if not ordered:
+        return 0.0
+    index = min(len(ordered) - 1, max(0, round(fraction * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def run_once(index, audio, env):
+    started = time.perf_counter()
+    completed = subprocess.run(
+        [sys.executable, PROCESSOR, f"bench-{index}", f"bench{index}", str(index), PREFERENCES],
+        input=audio, capture_output=True, env=env, cwd=ROOT
+    )
+    elapsed = time.perf_counter() - started
+    try:
+        result = json.loads(completed.stdout.decode('utf-8'))
+        ok = completed.returncode == 0 and 'error' not in result
+    except (UnicodeDecodeError, json.JSONDecodeError):
+        ok = False
+    return elapsed, ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--runs', type=int, default=40)
+    parser.add_argument('--concurrency', type=int, default=4)
+    parser.add_argument('--audio', help='MP3 a usar como entrada (por defecto bytes sintéticos; el stub no decodifica)')
+    parser.add_argument('--audio-kb', type=int, default=512)
+    add_stub_arguments(parser)
+    args = parser.parse_args()
+
+    server = make_server(**stub_kwargs(args))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    host, port = server.server_address[:2]
+
+    env = dict(os.environ, OPENAI_BASE_URL=f"http://{host}:{port}/v1", OPENAI_API_KEY='stub')
+    audios = []
+    for index in range(args.runs):
+        if args.audio:
+            with open(args.audio, 'rb') as audio_file:
+                audios.append(audio_file.read())
+        else:
+            # Bytes distintos por grabación: el stub deriva respuesta y errores del cuerpo
+            audios.append(random.Random(args.seed * 100003 + index).randbytes(args.audio_kb * 1024))
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=max(1, args.concurrency)) as executor:
+        results = list(executor.map(lambda item: run_once(item[0], item[1], env), enumerate(audios)))
+    wall = time.perf_counter() - started
+    server.shutdown()
+
+    latencies = [elapsed for elapsed, _ in results]
+    succeeded = sum(1 for _, ok in results if ok)
+    stats = server.state.snapshot()
+    requests_made = sum(endpoint['requests'] for endpoint in stats.values())
+    injected = sum(sum(endpoint['errors'].values()) for endpoint in stats.values())
+
+    print(f"grabaciones: {args.runs}  concurrencia: {args.concurrency}  ok: {succeeded}  fallidas: {args.runs - succeeded}")
+    print(f"throughput: {args.runs / wall:.2f} grabaciones/s  ({wall:.2f}s en total)")
+    print(f"latencia (s): p50 {percentile(latencies, 0.5):.3f}  p95 {percentile(latencies, 0.95):.3f}  "
+          f"p99 {percentile(latencies, 0.99):.3f}  máx {max(latencies):.3f}")
+    print(f"solicitudes al stub: {requests_made} (mínimo {args.runs * CALLS_PER_RUN})  errores inyectados: {injected}")
+    for name, endpoint in stats.items():
+        print(f"  {name:<15} {endpoint['requests']:>5} solicitudes  errores {endpoint['errors']}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Tiempo de arranque de los scripts que lanza clutch.js (uno por grabación o comando).
+
+Para cada entry point mide, en procesos nuevos, cuánto tarda `python -c "import <módulo>"` por
+encima de un intérprete vacío (`python -c pass`), que es lo que cuesta cada spawn antes de
+hacer trabajo útil. Con --profile muestra además el resumen de `python -X importtime`: los
+paquetes que más tiempo propio suman dentro del import del entry point.
+
+Cada entry point tiene un presupuesto en ms (--budget nombre=ms lo cambia); si alguno lo
+supera la corrida termina con código 1. Con --save el resultado se agrega a
+benchmarks/results/startup.jsonl (con el commit de git).
+
+Uso:
+    python benchmarks/bench_startup.py [--runs 15] [--profile] [--top 10] [--budget pdf_generator=80] [--save]
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+from collections import defaultdict
+from datetime import datetime, timezone
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+HISTORY_PATH = os.path.join(ROOT, 'benchmarks', 'results', 'startup.jsonl')
+
+# Presupuesto en ms por encima del intérprete vacío
+ENTRY_POINTS = {
+    'esports_processor_simple': 60,
+    'preferences_manager': 60,
+    'pdf_generator': 60,
+}
+
+
+def run_python(args, env):
+    started = time.perf_counter()
+    completed = subprocess.run([sys.executable, *args], cwd=ROOT, env=env, capture_output=True, text=True)
+    elapsed = time.perf_counter() - started
+    if completed.returncode != 0:
+        raise RuntimeError(f"python {' '.join(args)} terminó con código {completed.returncode}:\n{completed.stderr}")
+    return elapsed, completed.stderr
+
+
+def measure_wall(args, runs, env):
+    """Mediana de varias corridas, después de una de calentamiento (bytecode y caché del sistema de archivos)."""
+    run_python(args, env)
+    return statistics.median(run_python(args, env)[0] for _ in range(runs))
+
+
+def parse_importtime(stderr):
+    """Líneas de -X importtime como (profundidad, self_us, cumulative_us, módulo)."""
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        depth = (len(name) - len(name.lstrip())) // 2
+        rows.append((depth, int(self_us), int(cumulative_us), name.strip()))
+    return rows
+
+
+def import_profile(module, env):
+    """Devuelve (cumulative_us del entry point, {paquete: self_us}) de los imports que hace ese módulo."""
+    _, stderr = run_python(['-X', 'importtime', '-c', f'import {module}'], env)
+    rows = parse_importtime(stderr)
+    end = next(i for i, row in enumerate(rows) if row[0] == 0 and row[3] == module)
+    # -X importtime imprime los hijos antes que el padre: el subárbol del entry point empieza
+    # después de la última línea de nivel 0 anterior (site y compañía)
+    start = max((i for i in range(end) if rows[i][0] == 0), default=-1) + 1
+    by_package = defaultdict(int)
+    for _, self_us, _, name in rows[start:end + 1]:
+        by_package[name.split('.')[0]] += self_us
+    return rows[end][2], dict(by_package)
+
+
+def parse_budgets(values):
+    budgets = dict(ENTRY_POINTS)
+    for value in values:
+        name, _, ms = value.partition('=')
+        if name not in budgets:
+            raise SystemExit(f"entry point desconocido: {name} (opciones: {', '.join(ENTRY_POINTS)})")
+        budgets[name] = float(ms)
+    return budgets
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--runs', type=int, default=15)
+    parser.add_argument('--filter', default='', help='Solo entry points cuyo nombre contenga este texto')
+    parser.add_argument('--profile', action='store_true', help='Mostrar el resumen de -X importtime')
+    parser.add_argument('--top', type=int, default=10, help='Paquetes a mostrar con --profile')
+    parser.add_argument('--budget', action='append', default=[], metavar='NOMBRE=MS', help='Cambia el presupuesto de un entry point')
+    parser.add_argument('--save', action='store_true', help=f"Agregar el resultado a {os.path.relpath(HISTORY_PATH, ROOT)}")
+    args = parser.parse_args()
+
+    budgets = parse_budgets(args.budget)
+    env = dict(os.environ, PYTHONPATH=ROOT)
+    baseline = measure_wall(['-c', 'pass'], args.runs, env)
+    print(f"intérprete vacío: {baseline * 1000:.1f} ms (mediana de {args.runs})\n")
+    print(f"{'entry point':<28} {'arranque ms':>12} {'imports ms':>11} {'presupuesto':>12}")
+
+    results = {}
+    over_budget = []
+    for module, budget in budgets.items():
+        if args.filter not in module:
+            continue
+        startup_ms = (measure_wall(['-c', f'import {module}'], args.runs, env) - baseline) * 1000
+        cumulative_us, by_package = import_profile(module, env)
+        results[module] = {'startup_ms': round(startup_ms, 2), 'import_ms': round(cumulative_us / 1000, 2), 'budget_ms': budget}
+        flag = '' if startup_ms <= budget else '  EXCEDIDO'
+        print(f"{module:<28} {startup_ms:>12.1f} {cumulative_us / 1000:>11.1f} {budget:>12.0f}{flag}")
+        if startup_ms > budget:
+            over_budget.append((module, startup_ms, budget))
+        if args.profile:
+            for package, self_us in sorted(by_package.items(), key=lambda item: -item[1])[:args.top]:
+                print(f"    {package:<32} {self_us / 1000:>8.1f} ms")
+
+    if args.save:
+        record = {
+            'timestamp': datetime.now(timezone.utc).isoformat(),
+            'git_commit': subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, capture_output=True, text=True).stdout.strip(),
+            'python': sys.version.split()[0],
+            'baseline_ms': round(baseline * 1000, 2),
+            'entry_points': results,
+        }
+        os.makedirs(os.path.dirname(HISTORY_PATH), exist_ok=True)
+        with open(HISTORY_PATH, 'a', encoding='utf-8') as history:
+            history.write(json.dumps(record, ensure_ascii=False) + '\n')
+        print(f"\nresultado agregado a {HISTORY_PATH}")
+
+    if over_budget:
+        for module, startup_ms, budget in over_budget:
+            print(f"[PRESUPUESTO] {module}: {startup_ms:.1f} ms > {budget:.0f} ms", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Benchmark del procesamiento de texto de pdf_report.py.
+
+Compara las implementaciones anteriores (un re.sub por palabra clave y cinco sustituciones
+en clean_text_for_pdf) con el pipeline precompilado actual, sobre análisis largos.
+Verifica además que clean_text_for_pdf produzca exactamente el mismo resultado.
+
+Uso: python benchmarks/bench_text_processing.py [--words 5000] [--repeat 20]
+"""
+
+import argparse
+import os
+import random
+import re
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pdf_report import clean_text_for_pdf, highlight_keywords  # noqa: E402
+
+KEYWORDS = ['comunicación', 'callout', 'equipo', 'frustración', 'soluciones', 'coordinación']
+
+VOCABULARY = [
+    'la', 'comunicación', 'del', 'equipo', 'fue', 'buena', 'pero', 'hubo', 'frustración', 'en',
+    'los', 'callout', 'de', 'rotación', '**clave**', '*rápido*', '`B-site`', 'coordinación', '—', '…',
+    'soluciones', 'jugador', 'enemigo', 'punto', 'A', 'ronda', '¿dónde?', '¡vamos!', 'ñandú', '🎯',
+]
+
+
+def legacy_highlight_keywords(text, keywords):
+    for kw in keywords:
+        text = re.sub(rf'({kw})', r'<b>\1</b>', text, flags=re.IGNORECASE)
+    return text
+
+
+def legacy_clean_text_for_pdf(text):
+    if not text:
+        return ""
+    text = text.replace('…', '...').replace('—', '-').replace('–', '-')
+    text = re.sub(r'\*\*(.*?)\*\*', r'\1', text)
+    text = re.sub(r'\*(.*?)\*', r'\1', text)
+    text = re.sub(r'`(.*?)`', r'\1', text)
+    text = re.sub(r'[^\w\s\.,;:!?¿¡()\-"\'áéíóúñüÁÉÍÓÚÑÜ✅⭐]', '', text)
+    return text.strip()
+
+
+def synthetic_analysis(words, seed=42):
+    rng = random.Random(seed)
+    lines = []
+    for start in range(0, words, 40):
+        lines.append(' '.join(rng.choice(VOCABULARY) for _ in range(min(40, words - start))))
+    return '\n'.join(lines)
+
+
+def best_of(func, repeat, number):
+    return min(timeit.repeat(func, repeat=repeat, number=number)) / number
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--words', type=int, nargs='+', default=[500, 5000, 20000])
+    parser.add_argument('--repeat', type=int, default=7)
+    parser.add_argument('--number', type=int, default=20)
+    args = parser.parse_args()
+
+    print(f"{'palabras':>9} {'función':<22} {'anterior (ms)':>14} {'actual (ms)':>12} {'speedup':>8}")
+    for words in args.words:
+        text = synthetic_analysis(words)
+        assert clean_text_for_pdf(text) == legacy_clean_text_for_pdf(text), "clean_text_for_pdf cambió su salida"
+        cleaned = clean_text_for_pdf(text)
+        cases = [
+            ('clean_text_for_pdf', lambda: legacy_clean_text_for_pdf(text), lambda: clean_text_for_pdf(text)),
+            ('highlight_keywords', lambda: legacy_highlight_keywords(cleaned, KEYWORDS), lambda: highlight_keywords(cleaned, KEYWORDS)),
+            ('clean + highlight',
+             lambda: legacy_highlight_keywords(legacy_clean_text_for_pdf(text), KEYWORDS),
+             lambda: highlight_keywords(clean_text_for_pdf(text), KEYWORDS)),
+        ]
+        for name, legacy, current in cases:
+            legacy_time = best_of(legacy, args.repeat, args.number)
+            current_time = best_of(current, args.repeat, args.number)
+            print(f"{words:>9} {name:<22} {legacy_time * 1000:>14.3f} {current_time * 1000:>12.3f} {legacy_time / current_time:>7.1f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,239 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Servidor stub de la API de OpenAI para medir el pipeline sin gastar créditos ni depender de la red.
+
+Implementa POST /v1/audio/transcriptions y POST /v1/chat/completions con latencia configurable,
+tasa de errores (429/5xx) y respuestas fijas. Tanto la respuesta como la latencia y los errores
+inyectados dependen solo de (semilla, endpoint, cuerpo de la solicitud, número de intento), así que
+una corrida se puede repetir aunque las solicitudes lleguen en otro orden. GET /stats devuelve los
+contadores por endpoint (solicitudes, errores inyectados por código).
+
+Latencias: fixed:MS | uniform:MIN_MS:MAX_MS | lognormal:MEDIANA_MS:SIGMA | none
+
+Uso:
+    python benchmarks/openai_stub.py --port 8765 \\
+        --latency transcriptions=lognormal:900:0.35 --latency chat=uniform:150:450 \\
+        --error-rate 0.05 --error-statuses 429,500,503
+    OPENAI_BASE_URL=http://127.0.0.1:8765/v1 OPENAI_API_KEY=stub python esports_processor_simple.py ...
+"""
+
+import argparse
+import hashlib
+import json
+import math
+import random
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+ENDPOINTS = {
+    '/v1/audio/transcriptions': 'transcriptions',
+    '/v1/chat/completions': 'chat',
+}
+
+TRANSCRIPT_LINES = [
+    "dos en B, dos en B, uno bajo",
+    "voy a rotar a A, cúbranme la escalera",
+    "tengo la bomba, entro por mid",
+    "enemigo en el techo, está con poca vida",
+    "guarden la utilidad para el retake",
+    "buena ronda, cabros, sigamos así",
+    "me quedé sin balas, necesito apoyo",
+    "flanco por la izquierda, ojo con el conector",
+]
+
+ANALYSIS_TEXT = (
+    "Hola, revisé tu partida. Tus callouts son claros y llegan a tiempo, lo que ayuda mucho al equipo. "
+    "Intenta mantener la calma después de perder una ronda y prioriza informar la posición de los enemigos "
+    "antes que comentar la jugada. Vas por buen camino."
+)
+
+STRUCTURED_TEXT = (
+    '"Aspectos a mejorar":\n\n'
+    '- Mantener la calma tras perder una ronda\n'
+    '- Priorizar la posición de los enemigos en los avisos\n'
+    '- Coordinar el uso de utilidad con el equipo\n\n'
+    '"Cómo mejorarlos":\n\n'
+    '- Respirar y resumir la ronda en una frase antes de la siguiente\n'
+    '- Usar el formato cantidad + lugar + estado ("dos en B, uno bajo")\n'
+    '- Acordar antes de cada ronda quién guarda la utilidad para el retake'
+)
+
+
+def parse_latency(spec):
+    """'lognormal:900:0.35' -> función rng -> segundos."""
+    kind, *params = spec.split(':')
+    values = [float(value) for value in params]
+    if kind == 'none':
+        return lambda rng: 0.0
+    if kind == 'fixed' and len(values) == 1:
+        return lambda rng: values[0] / 1000
+    if kind == 'uniform' and len(values) == 2:
+        return lambda rng: rng.uniform(values[0], values[1]) / 1000
+    if kind == 'lognormal' and len(values) == 2:
+        mu = math.log(values[0])
+        return lambda rng: rng.lognormvariate(mu, values[1]) / 1000
+    raise argparse.ArgumentTypeError(f"Latencia inválida: {spec}")
+
+
+class StubState:
+    """Configuración y contadores compartidos por todos los hilos del servidor."""
+
+    def __init__(self, latencies, error_rate, error_statuses, seed, retry_after):
+        self.latencies = latencies
+        self.error_rate = error_rate
+        self.error_statuses = error_statuses
+        self.seed = seed
+        self.retry_after = retry_after
+        self.lock = threading.Lock()
+        self.attempts = {}
+        self.stats = {name: {'requests': 0, 'errors': {}} for name in ENDPOINTS.values()}
+
+    def next_attempt(self, endpoint, digest):
+        with self.lock:
+            attempt = self.attempts.get((endpoint, digest), 0)
+            self.attempts[(endpoint, digest)] = attempt + 1
+            self.stats[endpoint]['requests'] += 1
+            return attempt
+
+    def record_error(self, endpoint, status):
+        with self.lock:
+            errors = self.stats[endpoint]['errors']
+            errors[str(status)] = errors.get(str(status), 0) + 1
+
+    def snapshot(self):
+        with self.lock:
+            return json.loads(json.dumps(self.stats))
+
+
+def transcription_response(body, digest):
+    rng = random.Random(digest)
+    lines = [rng.choice(TRANSCRIPT_LINES) for _ in range(rng.randint(6, 18))]
+    text = '. '.join(lines) + '.'
+    if b'verbose_json' not in body:
+        return {'text': text}
+    segments = [{'id': index, 'start': index * 5.0, 'end': index * 5.0 + 4.5, 'text': line} for index, line in enumerate(lines)]
+    return {'text': text, 'language': 'spanish', 'duration': len(lines) * 5.0, 'segments': segments}
+
+
+def chat_response(body, digest):
+    try:
+        request = json.loads(body.decode('utf-8'))
+    except (UnicodeDecodeError, json.JSONDecodeError):
+        request = {}
+    prompt = json.dumps(request.get('messages', []), ensure_ascii=False)
+    content = STRUCTURED_TEXT if 'estructur' in prompt.lower() else ANALYSIS_TEXT
+    return {
+        'id': f"chatcmpl-stub-{digest[:12]}",
+        'object': 'chat.completion',
+        'created': 0,
+        'model': request.get('model', 'gpt-4o-mini'),
+        'choices': [{'index': 0, 'message': {'role': 'assistant', 'content': content}, 'finish_reason': 'stop'}],
+        'usage': {'prompt_tokens': len(prompt) // 4, 'completion_tokens': len(content) // 4, 'total_tokens': (len(prompt) + len(content)) // 4},
+    }
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    server_version = 'OpenAIStub/1.0'
+
+    def log_message(self, format, *args):
+        if not self.server.quiet:
+            super().log_message(format, *args)
+
+    def _send_json(self, status, payload, headers=None):
+        data = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        if self.path == '/stats':
+            self._send_json(200, self.server.state.snapshot())
+        else:
+            self._send_json(404, {'error': {'message': 'not found'}})
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get('Content-Length') or 0))
+        endpoint = ENDPOINTS.get(self.path.split('?', 1)[0])
+        if endpoint is None:
+            self._send_json(404, {'error': {'message': f"Unknown endpoint {self.path}"}})
+            return
+        state = self.server.state
+        digest = hashlib.sha256(body).hexdigest()
+        attempt = state.next_attempt(endpoint, digest)
+        rng = random.Random(f"{state.seed}:{endpoint}:{digest}:{attempt}")
+        time.sleep(state.latencies[endpoint](rng))
+        if state.error_statuses and rng.random() < state.error_rate:
+            status = rng.choice(state.error_statuses)
+            state.record_error(endpoint, status)
+            headers = {'Retry-After': str(state.retry_after)} if status == 429 else None
+            self._send_json(status, {'error': {'message': f"Injected {status}", 'type': 'stub_error'}}, headers)
+            return
+        if endpoint == 'transcriptions':
+            self._send_json(200, transcription_response(body, digest))
+        else:
+            self._send_json(200, chat_response(body, digest))
+
+
+def make_server(host='127.0.0.1', port=0, latencies=None, error_rate=0.0, error_statuses=(429, 500, 503),
+                seed=0, retry_after=0, quiet=True):
+    """Crea (sin iniciar) el servidor stub. port=0 elige un puerto libre: ver server.server_address."""
+    defaults = {'transcriptions': parse_latency('none'), 'chat': parse_latency('none')}
+    defaults.update(latencies or {})
+    server = ThreadingHTTPServer((host, port), StubHandler)
+    server.daemon_threads = True
+    server.quiet = quiet
+    server.state = StubState(defaults, error_rate, list(error_statuses), seed, retry_after)
+    return server
+
+
+def add_stub_arguments(parser):
+    parser.add_argument('--latency', action='append', default=[], metavar='ENDPOINT=DIST',
+                        help="Latencia por endpoint (transcriptions|chat), p. ej. chat=uniform:150:450")
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Probabilidad de responder con error (0-1)')
+    parser.add_argument('--error-statuses', default='429,500,503', help='Códigos de error a inyectar')
+    parser.add_argument('--retry-after', type=int, default=0, help='Segundos en Retry-After de las respuestas 429')
+    parser.add_argument('--seed', type=int, default=0)
+
+
+def stub_kwargs(args):
+    latencies = {}
+    for item in args.latency:
+        endpoint, _, spec = item.partition('=')
+        if endpoint not in ENDPOINTS.values():
+            raise SystemExit(f"Endpoint desconocido en --latency: {endpoint}")
+        latencies[endpoint] = parse_latency(spec)
+    statuses = [int(status) for status in args.error_statuses.split(',') if status.strip()]
+    return {'latencies': latencies, 'error_rate': args.error_rate, 'error_statuses': statuses,
+            'seed': args.seed, 'retry_after': args.retry_after}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--quiet', action='store_true', help='No registrar cada solicitud')
+    add_stub_arguments(parser)
+    args = parser.parse_args()
+
+    server = make_server(args.host, args.port, quiet=args.quiet, **stub_kwargs(args))
+    host, port = server.server_address[:2]
+    sys.stderr.write(f"[OK] Stub de OpenAI escuchando en http://{host}:{port}/v1\n")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        sys.stderr.write(f"[STATS] {json.dumps(server.state.snapshot())}\n")
+
+
+if __name__ == '__main__':
+    main()
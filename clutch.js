@@ -8,6 +8,7 @@ const fs = require('fs');
 const path = require('path');
 const ffmpeg = require('fluent-ffmpeg');
 const { spawn } = require('child_process');
+const crypto = require('crypto');
 const { ElevenLabsClient } = require('@elevenlabs/elevenlabs-js');
 const { PythonShell } = require('python-shell');
 
@@ -30,6 +31,62 @@ const client = new Client({
 
 // Objeto para mantener el seguimiento de las grabaciones activas
 const activeRecordings = new Map();
+
+// Trazas (W3C traceparent): una traza por grabación. El contexto se pasa al procesador (argumento),
+// al servidor de PDFs (campo del trabajo) y a la API (header). Los spans del bot se agregan al mismo
+// archivo OTLP/JSON que los de Python (TRACE_EXPORT_FILE, ver tracing.py).
+const TRACE_EXPORT_FILE = process.env.TRACE_EXPORT_FILE;
+
+// Reintentos de sendToFastAPI: seguros gracias al header Idempotency-Key (ver idempotency.py)
+const FASTAPI_MAX_ATTEMPTS = parseInt(process.env.FASTAPI_MAX_ATTEMPTS || '5', 10);
+const FASTAPI_RETRY_STATUS = new Set([429, 500, 502, 503, 504]);
+
+function nowUnixNano() {
+    return BigInt(Math.round((performance.timeOrigin + performance.now()) * 1e6)).toString();
+}
+
+function startSpan(name, parent = null, attributes = {}) {
+    const span = {
+        name,
+        traceId: parent ? parent.traceId : crypto.randomBytes(16).toString('hex'),
+        spanId: crypto.randomBytes(8).toString('hex'),
+        parentSpanId: parent ? parent.spanId : undefined,
+        startTimeUnixNano: nowUnixNano(),
+        attributes
+    };
+    span.traceparent = `00-${span.traceId}-${span.spanId}-01`;
+    return span;
+}
+
+function endSpan(span, error = null) {
+    if (!TRACE_EXPORT_FILE) return;
+    const attributes = Object.entries(span.attributes)
+        .filter(([, value]) => value !== undefined && value !== null)
+        .map(([key, value]) => ({
+            key,
+            value: Number.isInteger(value) ? { intValue: String(value) } : typeof value === 'number' ? { doubleValue: value } : { stringValue: String(value) }
+        }));
+    const otlpSpan = {
+        traceId: span.traceId,
+        spanId: span.spanId,
+        parentSpanId: span.parentSpanId,
+        name: span.name,
+        kind: 1,
+        startTimeUnixNano: span.startTimeUnixNano,
+        endTimeUnixNano: nowUnixNano(),
+        attributes,
+        status: error ? { code: 2, message: String(error.message || error).slice(0, 500) } : { code: 0 }
+    };
+    const line = JSON.stringify({
+        resourceSpans: [{
+            resource: { attributes: [{ key: 'service.name', value: { stringValue: 'clutch-bot' } }] },
+            scopeSpans: [{ scope: { name: 'clutch.tracing' }, spans: [otlpSpan] }]
+        }]
+    });
+    fs.appendFile(TRACE_EXPORT_FILE, line + '\n', (err) => {
+        if (err) console.error('⚠️ No se pudo exportar el span:', err.message);
+    });
+}
 const token = process.env.DISCORD_TOKEN;
 
 client.on('error', error => console.error('Discord client error:', error));
@@ -221,6 +278,7 @@ client.on('messageCreate', async message => {
 });
 
 async function processRecording(userId, recording, message) {
+    const trace = startSpan('processRecording', null, { 'clutch.user_id': userId });
     try {
         const pcmBuffer = Buffer.concat(recording.pcmChunks);
         console.log(`✅ Procesando ${recording.username}. PCM bytes: ${pcmBuffer.length}`);
@@ -241,9 +299,9 @@ async function processRecording(userId, recording, message) {
         const userPreferences = await collectUserPreferences(userId, message);
         console.log(`🐛 DEBUG: Preferencias obtenidas en processRecording:`, JSON.stringify(userPreferences, null, 2));
         
-        const analysisResult = await spawnPythonAndAnalyze(mp3Buffer, recording.username, userId, recording.timestamp, userPreferences);
+        const analysisResult = await spawnPythonAndAnalyze(mp3Buffer, recording.username, userId, recording.timestamp, userPreferences, trace.traceparent);
         if (analysisResult.analysis) {
-            const { analysis, structured_analysis, transcription, wpm, wpm_by_segment } = analysisResult;
+            const { analysis, structured_analysis, transcription, wpm, wpm_by_segment, loudness_by_second } = analysisResult;
             await sendFeedbackToUser(
                 userId, 
                 analysis, 
@@ -252,14 +310,18 @@ async function processRecording(userId, recording, message) {
                 structured_analysis,
                 mp3Buffer, // Pasar el buffer del audio del jugador
                 recording.username,
-                recording.timestamp
+                recording.timestamp,
+                { wpm, wpm_by_segment, loudness_by_second },
+                trace.traceparent
             );
         } else {
             throw new Error('No se recibió análisis del script de Python');
         }
+        endSpan(trace);
 
     } catch (error) {
         console.error(`❌ Error procesando ${recording.username}:`, error);
+        endSpan(trace, error);
         throw error;
     }
 }
@@ -331,15 +393,17 @@ async function convertPcmToMp3(pcmBuffer) {
     });
 }
 
-async function spawnPythonAndAnalyze(audioBuffer, username, userId, timestamp, userPreferences) {
+async function spawnPythonAndAnalyze(audioBuffer, username, userId, timestamp, userPreferences, traceparent = null) {
     return new Promise((resolve, reject) => {
-        const pythonProcess = spawn('python3', [
+        const args = [
             './esports_processor_simple.py',
             userId,
             username,
             timestamp,
             JSON.stringify(userPreferences)
-        ], { stdio: ['pipe', 'pipe', 'pipe'], encoding: 'utf-8' });
+        ];
+        if (traceparent) args.push(traceparent);
+        const pythonProcess = spawn('python3', args, { stdio: ['pipe', 'pipe', 'pipe'], encoding: 'utf-8' });
 
         let stdoutData = '';
         let stderrData = '';
@@ -681,7 +745,7 @@ function getDefaultPreferencesElevenLabs() {
 }
 
 // Solo se envía el análisis una vez, después de recolectar todas las preferencias y generar el audio
-async function sendFeedbackToUser(userId, analysis, userPreferences = null, transcription = null, structuredAnalysis = null, playerAudioBuffer = null, username = null, timestamp = null) {
+async function sendFeedbackToUser(userId, analysis, userPreferences = null, transcription = null, structuredAnalysis = null, playerAudioBuffer = null, username = null, timestamp = null, metrics = null, traceparent = null) {
     try {
         const user = await client.users.fetch(userId);
         const dmChannel = await user.createDM();
@@ -704,7 +768,7 @@ async function sendFeedbackToUser(userId, analysis, userPreferences = null, tran
         // 2. Generar y enviar PDF del análisis
         let pdfBuffer;
         try {
-            pdfBuffer = await generateAnalysisPDF(analysis, structuredAnalysis, user.username, userId, fechaAnalisis);
+            pdfBuffer = await generateAnalysisPDF(analysis, structuredAnalysis, user.username, userId, fechaAnalisis, metrics, traceparent);
             if (pdfBuffer) {
                 await dmChannel.send({
                     files: [{
@@ -738,46 +802,141 @@ async function sendFeedbackToUser(userId, analysis, userPreferences = null, tran
         });
 
         // 5. Enviar a FastAPI SOLO aquí, con todas las preferencias
-        await sendToFastAPI(userId, analysis, transcription, userPreferences, playerAudioBuffer, ttsAudioBuffer, user.username, timestamp);
+        await sendToFastAPI(userId, analysis, transcription, userPreferences, playerAudioBuffer, ttsAudioBuffer, user.username, timestamp, { structuredAnalysis, fechaAnalisis, metrics }, traceparent);
     } catch (error) {
         console.error(`❌ Error enviando feedback a ${userId}:`, error);
     }
 }
 
-async function sendToFastAPI(userId, analysis, transcription, userPreferences, playerAudioBuffer, coachAudioBuffer, username, timestamp) {    try {
+const FASTAPI_URL = process.env.FASTAPI_URL || 'http://clutch-backend-env.eba-7z3q9wis.us-east-2.elasticbeanstalk.com';
+
+// Sube los audios directamente a S3 usando las políticas de /upload-slots/.
+// Las keys van por sha256 del audio: si el mismo audio ya está en S3 no se vuelve a subir.
+// Devuelve { analysisId, keys } o null si no fue posible (el llamador envía los bytes a la API).
+async function uploadAudiosDirectToS3(userId, buffers, traceparent = null) {
+    const names = Object.keys(buffers).filter(name => buffers[name]);
+    if (names.length === 0) return null;
+    try {
+        const fetch = require('node-fetch');
+        const FormData = require('form-data');
+        const crypto = require('crypto');
+        const sha256 = {};
+        for (const name of names) {
+            sha256[name] = crypto.createHash('sha256').update(buffers[name]).digest('hex');
+        }
+        const slotsResponse = await fetch(`${FASTAPI_URL}/upload-slots/`, {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json', ...(traceparent ? { traceparent } : {}) },
+            body: JSON.stringify({ user_id: userId, files: names, sha256 })
+        });
+        if (!slotsResponse.ok) {
+            console.error(`⚠️ No se obtuvieron upload slots (HTTP ${slotsResponse.status}), enviando audio a la API.`);
+            return null;
+        }
+        const { analysis_id, slots } = await slotsResponse.json();
+        const keys = {};
+        await Promise.all(names.map(async (name) => {
+            const slot = slots[name];
+            if (slot.exists) {
+                keys[name] = slot.key;
+                return;
+            }
+            const s3Form = new FormData();
+            for (const [field, value] of Object.entries(slot.fields)) {
+                s3Form.append(field, value);
+            }
+            // El archivo debe ser el último campo del formulario
+            s3Form.append('file', buffers[name], { filename: slot.key.split('/').pop(), contentType: slot.fields['Content-Type'] });
+            const s3Response = await fetch(slot.url, { method: 'POST', body: s3Form, headers: s3Form.getHeaders() });
+            if (!s3Response.ok) {
+                throw new Error(`S3 respondió HTTP ${s3Response.status} para ${name}`);
+            }
+            keys[name] = slot.key;
+        }));
+        console.log(`☁️ Audios subidos directo a S3: ${Object.values(keys).join(', ')}`);
+        return { analysisId: analysis_id, keys };
+    } catch (error) {
+        console.error('⚠️ Error subiendo audio directo a S3, enviando audio a la API:', error);
+        return null;
+    }
+}
+
+async function sendToFastAPI(userId, analysis, transcription, userPreferences, playerAudioBuffer, coachAudioBuffer, username, timestamp, report = null, traceparent = null) {    try {
         // userPreferences = { tts_preferences, user_personality_test }
         console.log(`📤 Enviando datos a FastAPI para ${username}`);
         console.log(`📋 Preferencias completas:`, JSON.stringify(userPreferences, null, 2));
         const FormData = require('form-data');
-        const form = new FormData();
-        // Datos principales
-        form.append('user_id', userId);
-        form.append('analysis_text', analysis);
-        form.append('transcription', transcription);
-        // Preferencias TTS
-        form.append('tts_preferences', JSON.stringify(userPreferences.tts_preferences));
-        // Test de personalidad
-        form.append('user_personality_test', JSON.stringify(userPreferences.user_personality_test));
-        // Archivos de audio
-        if (playerAudioBuffer) {
-            form.append('player_audio', playerAudioBuffer, {
-                filename: `player_${username}_${timestamp}.mp3`,
-                contentType: 'audio/mpeg'
-            });
-        }
-        if (coachAudioBuffer) {
-            form.append('coach_audio', coachAudioBuffer, {
-                filename: `coach_${username}_${timestamp}.mp3`,
-                contentType: 'audio/mpeg'
-            });
-        }
-        // Enviar a tu API FastAPI
         const fetch = require('node-fetch');
-        const response = await fetch('http://clutch-backend-env.eba-7z3q9wis.us-east-2.elasticbeanstalk.com/guardar-analisis/', {
-            method: 'POST',
-            body: form,
-            headers: form.getHeaders()
-        });
+        // Archivos de audio: se suben directo a S3 y solo se envían las keys.
+        // Si la subida directa falla, se envían los bytes a la API como antes.
+        const uploaded = await uploadAudiosDirectToS3(userId, { player: playerAudioBuffer, coach: coachAudioBuffer }, traceparent);
+        // El cuerpo multipart es un stream: se arma de nuevo en cada intento
+        const buildForm = () => {
+            const form = new FormData();
+            // Datos principales
+            form.append('user_id', userId);
+            form.append('analysis_text', analysis);
+            form.append('transcription', transcription);
+            // Preferencias TTS
+            form.append('tts_preferences', JSON.stringify(userPreferences.tts_preferences));
+            // Test de personalidad
+            form.append('user_personality_test', JSON.stringify(userPreferences.user_personality_test));
+            // Datos del reporte PDF: permiten volver a servirlo desde GET /reports/{analysis_id}.pdf
+            if (username) form.append('username', username);
+            if (report && report.structuredAnalysis) form.append('structured_analysis', report.structuredAnalysis);
+            if (report && report.fechaAnalisis) form.append('fecha_analisis', report.fechaAnalisis);
+            // Métricas de audio del PDF (wpm, wpm por minuto y volumen por segundo)
+            const metrics = (report && report.metrics) || {};
+            if (metrics.wpm != null) form.append('wpm', String(metrics.wpm));
+            if (metrics.wpm_by_segment) form.append('wpm_by_segment', JSON.stringify(metrics.wpm_by_segment));
+            if (metrics.loudness_by_second) form.append('loudness_by_second', JSON.stringify(metrics.loudness_by_second));
+            if (uploaded) {
+                form.append('analysis_id', uploaded.analysisId);
+                if (uploaded.keys.player) form.append('player_audio_key', uploaded.keys.player);
+                if (uploaded.keys.coach) form.append('coach_audio_key', uploaded.keys.coach);
+            } else {
+                if (playerAudioBuffer) {
+                    form.append('player_audio', playerAudioBuffer, {
+                        filename: `player_${username}_${timestamp}.mp3`,
+                        contentType: 'audio/mpeg'
+                    });
+                }
+                if (coachAudioBuffer) {
+                    form.append('coach_audio', coachAudioBuffer, {
+                        filename: `coach_${username}_${timestamp}.mp3`,
+                        contentType: 'audio/mpeg'
+                    });
+                }
+            }
+            return form;
+        };
+        // Una clave por grabación: la API guarda un solo análisis aunque el envío se reintente
+        const idempotencyKey = `${userId}:${timestamp}`;
+        let response = null;
+        for (let attempt = 1; ; attempt++) {
+            const form = buildForm();
+            try {
+                response = await fetch(`${FASTAPI_URL}/guardar-analisis/`, {
+                    method: 'POST',
+                    body: form,
+                    headers: {
+                        ...form.getHeaders(),
+                        'X-User-Id': userId,
+                        'Idempotency-Key': idempotencyKey,
+                        ...(traceparent ? { traceparent } : {})
+                    }
+                });
+            } catch (error) {
+                if (attempt >= FASTAPI_MAX_ATTEMPTS) throw error;
+                response = null;
+            }
+            if ((response && !FASTAPI_RETRY_STATUS.has(response.status)) || attempt >= FASTAPI_MAX_ATTEMPTS) break;
+            // Retry-After de la API (429/503) o backoff exponencial con jitter
+            const retryAfter = response ? Number(response.headers.get('retry-after')) : NaN;
+            const delay = retryAfter > 0 ? retryAfter * 1000 : Math.min(30000, 500 * 2 ** (attempt - 1)) * (0.5 + Math.random() / 2);
+            console.warn(`⏳ FastAPI respondió ${response ? response.status : 'sin conexión'}, reintento ${attempt + 1}/${FASTAPI_MAX_ATTEMPTS} en ${Math.round(delay)} ms`);
+            await new Promise((resolve) => setTimeout(resolve, delay));
+        }
         const result = await response.json();
         if (result && result.echo_tts_preferences) {
             console.log('🧩 Echo tts_preferences desde backend:', JSON.stringify(result.echo_tts_preferences, null, 2));
@@ -790,7 +949,7 @@ async function sendToFastAPI(userId, analysis, transcription, userPreferences, p
             console.log(`🔗 Player audio URL: ${result.player_s3_url || 'No disponible'}`);
             console.log(`🔗 Coach audio URL: ${result.coach_s3_url || 'No disponible'}`);
         } else {
-            console.error(`❌ Error en FastAPI: ${result.error}`);
+            console.error(`❌ Error en FastAPI: ${result.error || result.detail}`);
         }
         return result;
     } catch (error) {
@@ -964,35 +1123,162 @@ const elevenLabsVoiceLabels = {
     // Agrega aquí más voces si tienes
 };
 
-async function generateAnalysisPDF(analysis, structuredAnalysis, username, userId, fechaAnalisis) {
+// Servidor residente de PDFs (pdf_generator.py --serve): estilos y logo se cargan una sola vez.
+// Protocolo: cada mensaje es un marco de 4 bytes big-endian con el largo + payload.
+let pdfRenderer = null;
+// Plazo por reporte del servidor residente; al vencer ese reporte usa un proceso propio, y el
+// servidor solo se reinicia si en todo el plazo no entregó ningún marco (está colgado)
+const PDF_RENDER_TIMEOUT_MS = parseInt(process.env.PDF_RENDER_TIMEOUT_MS || '60000', 10);
+
+function getPdfRenderer() {
+    if (pdfRenderer) return pdfRenderer;
+    const pythonProcess = spawn('python', ['pdf_generator.py', '--serve'], {
+        stdio: ['pipe', 'pipe', 'pipe']
+    });
+    const renderer = {
+        process: pythonProcess, pending: new Map(), nextId: 1, chunks: [], buffered: 0, header: null,
+        lastFrameAt: Date.now()
+    };
+    pythonProcess.stdout.on('data', (data) => {
+        renderer.chunks.push(data);
+        renderer.buffered += data.length;
+        drainPdfFrames(renderer);
+    });
+    pythonProcess.stderr.on('data', (data) => {
+        console.log(`[PDF SERVER] ${data.toString().trim()}`);
+    });
+    const fail = (reason) => {
+        if (pdfRenderer === renderer) pdfRenderer = null;
+        for (const { resolve } of renderer.pending.values()) resolve({ ok: false, error: reason });
+        renderer.pending.clear();
+    };
+    pythonProcess.on('close', (code) => fail(`pdf_generator.py --serve terminó con código ${code}`));
+    pythonProcess.on('error', (error) => fail(error.message));
+    // Descarta el servidor (p. ej. colgado): los renders pendientes caen al respaldo de un proceso
+    renderer.reset = (reason) => {
+        fail(reason);
+        pythonProcess.kill();
+    };
+    // Vence el plazo de un reporte: solo ese reporte cae al respaldo (su respuesta tardía se ignora).
+    // Si además el servidor no entregó ningún marco desde que se envió, no avanzó con ninguno de
+    // los pendientes en todo el plazo y se descarta
+    renderer.expire = (id, reason) => {
+        const waiter = renderer.pending.get(id);
+        if (!waiter) return;
+        renderer.pending.delete(id);
+        waiter.resolve({ ok: false, error: reason });
+        if (renderer.lastFrameAt <= waiter.sentAt) {
+            renderer.reset(`${reason}; sin respuestas del servidor, se reinicia`);
+        }
+    };
+    // Si el servidor murió, escribir en stdin da EPIPE como evento 'error': sin este listener tumba el bot
+    pythonProcess.stdin.on('error', (error) => renderer.reset(`Error escribiendo al servidor de PDF: ${error.message}`));
+    pdfRenderer = renderer;
+    return renderer;
+}
+
+function readPdfFrame(renderer) {
+    // Espera a tener el marco completo antes de unir chunks: una sola copia por marco,
+    // no una por cada evento 'data' (que era cuadrático con PDFs grandes)
+    if (renderer.buffered < 4) return null;
+    if (renderer.chunks[0].length < 4) {
+        renderer.chunks = [Buffer.concat(renderer.chunks, renderer.buffered)];
+    }
+    const length = renderer.chunks[0].readUInt32BE(0);
+    if (renderer.buffered < 4 + length) return null;
+    const buffer = renderer.chunks.length === 1 ? renderer.chunks[0] : Buffer.concat(renderer.chunks, renderer.buffered);
+    const frame = buffer.subarray(4, 4 + length);
+    const rest = buffer.subarray(4 + length);
+    renderer.chunks = rest.length ? [rest] : [];
+    renderer.buffered = rest.length;
+    return frame;
+}
+
+function drainPdfFrames(renderer) {
+    let frame;
+    while ((frame = readPdfFrame(renderer)) !== null) {
+        renderer.lastFrameAt = Date.now();
+        if (!renderer.header) {
+            renderer.header = JSON.parse(frame.toString('utf-8'));
+            continue;
+        }
+        const header = renderer.header;
+        renderer.header = null;
+        const waiter = renderer.pending.get(header.id);
+        if (waiter) {
+            renderer.pending.delete(header.id);
+            waiter.resolve({ ok: header.ok, error: header.error, pdf: frame });
+        }
+    }
+}
+
+async function generateAnalysisPDF(analysis, structuredAnalysis, username, userId, fechaAnalisis, metrics = null, traceparent = null) {
     /**
-     * Genera un PDF del análisis usando el script Python pdf_generator.py
+     * Genera un PDF del análisis usando el servidor residente de pdf_generator.py.
+     * Si el servidor falla, usa un proceso por reporte como respaldo.
+     */
+    const pdfData = {
+        analysis_text: analysis,
+        structured_analysis: structuredAnalysis || '',
+        username: username,
+        user_id: userId,
+        fecha_analisis: fechaAnalisis,
+        // WPM por minuto y volumen por segundo para los gráficos del reporte
+        metrics: metrics || {}
+    };
+    // Contexto de traza de la grabación: el render queda como span hijo (no forma parte de la clave del cache)
+    if (traceparent) pdfData.traceparent = traceparent;
+    try {
+        const renderer = getPdfRenderer();
+        const id = renderer.nextId++;
+        const payload = Buffer.from(JSON.stringify({ ...pdfData, id }), 'utf-8');
+        const header = Buffer.alloc(4);
+        header.writeUInt32BE(payload.length, 0);
+        let timer = null;
+        const result = await new Promise((resolve) => {
+            renderer.pending.set(id, { resolve, sentAt: Date.now() });
+            // Un reporte trabado no debe bloquear el DM: pasado el plazo se usa el respaldo
+            timer = setTimeout(() => {
+                renderer.expire(id, `El servidor de PDF no respondió en ${PDF_RENDER_TIMEOUT_MS} ms`);
+            }, PDF_RENDER_TIMEOUT_MS);
+            renderer.process.stdin.write(Buffer.concat([header, payload]));
+        });
+        clearTimeout(timer);
+        if (result.ok && result.pdf && result.pdf.length > 0) {
+            console.log(`[PDF DEBUG] PDF renderizado por el servidor residente: ${result.pdf.length} bytes`);
+            return result.pdf;
+        }
+        console.error(`❌ Servidor de PDF no pudo generar el reporte: ${result.error}`);
+    } catch (error) {
+        console.error('[PDF DEBUG] Error usando el servidor de PDF:', error);
+    }
+    return generateAnalysisPDFOneShot(pdfData);
+}
+
+async function generateAnalysisPDFOneShot(pdfData) {
+    /**
+     * Genera un PDF lanzando pdf_generator.py para un solo reporte.
      */
     return new Promise((resolve) => {
         try {
-            const { spawn } = require('child_process');
-            // Datos para enviar al script Python
-            const pdfData = {
-                analysis_text: analysis,
-                structured_analysis: structuredAnalysis || '',
-                username: username,
-                user_id: userId,
-                fecha_analisis: fechaAnalisis
-            };
             const pythonProcess = spawn('python', ['pdf_generator.py'], {
                 stdio: ['pipe', 'pipe', 'pipe']
             });
-            let pdfBuffer = Buffer.alloc(0);
+            // Los chunks se guardan y se unen una sola vez al terminar
+            const pdfChunks = [];
+            let pdfLength = 0;
             let errorOutput = '';
             pythonProcess.stdin.write(JSON.stringify(pdfData));
             pythonProcess.stdin.end();
             pythonProcess.stdout.on('data', (data) => {
-                pdfBuffer = Buffer.concat([pdfBuffer, data]);
+                pdfChunks.push(data);
+                pdfLength += data.length;
             });
             pythonProcess.stderr.on('data', (data) => {
                 errorOutput += data.toString();
             });
             pythonProcess.on('close', (code) => {
+                const pdfBuffer = Buffer.concat(pdfChunks, pdfLength);
                 console.log(`[PDF DEBUG] python exit code: ${code}`);
                 console.log(`[PDF DEBUG] stderr: ${errorOutput.trim()}`);
                 console.log(`[PDF DEBUG] pdfBuffer length: ${pdfBuffer.length}`);
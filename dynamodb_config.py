@@ -1,15 +1,24 @@
 import boto3
+import json
 import uuid
 from datetime import datetime
+import logging
 import os
-import sys
+import threading
+import time
 from typing import Dict
 from dotenv import load_dotenv
+import aws_clients
+import text_compression
 from decimal import Decimal
+from log_config import get_logger
+from tracing import traced
 
 # Cargar variables de entorno
 load_dotenv()
 
+logger = get_logger('dynamodb')
+
 # Intentar importar S3 manager
 try:
     from s3_config import s3_manager
@@ -18,183 +27,569 @@ except ImportError:
     S3_AVAILABLE = False
     s3_manager = None
 
+# Content-Type con el que se guarda cada formato de audio en S3
+AUDIO_CONTENT_TYPES = {'mp3': 'audio/mpeg', 'ogg': 'audio/ogg'}
+
 # Configuración de DynamoDB
 DYNAMODB_REGION = os.getenv('AWS_REGION')
 DYNAMODB_TABLE_NAME = os.getenv('DYNAMODB_TABLE_NAME')
+# Máximos de DynamoDB por BatchWriteItem y por BatchGetItem
+BATCH_WRITE_SIZE = 25
+BATCH_GET_SIZE = 100
+# Reintentos de los UnprocessedKeys/UnprocessedItems (con backoff exponencial desde la base, en segundos)
+BATCH_MAX_ATTEMPTS = 5
+BATCH_RETRY_BASE_DELAY = 0.05
 
 dynamodb = None
 DYNAMODB_AVAILABLE = False
+_initialized = False
+_init_lock = threading.Lock()
+# Tras un error al conectar se reintenta en una operación posterior, con backoff exponencial
+INIT_RETRY_BASE_DELAY = 1.0
+INIT_RETRY_MAX_DELAY = 60.0
+_init_failures = 0
+_init_retry_at = 0.0
 
-if DYNAMODB_REGION and DYNAMODB_TABLE_NAME:
-    try:
-        dynamodb = boto3.resource(
-            'dynamodb',
-            region_name=DYNAMODB_REGION,
-            aws_access_key_id=os.getenv('AWS_ACCESS_KEY_ID'),
-            aws_secret_access_key=os.getenv('AWS_SECRET_ACCESS_KEY')
-        )
-        table = dynamodb.Table(DYNAMODB_TABLE_NAME)
-        table.load() # Verifica que la tabla existe y se puede acceder
-        DYNAMODB_AVAILABLE = True
-        sys.stderr.write(f"✅ Conectado a DynamoDB en región: {DYNAMODB_REGION}\n")
-    except Exception as e:
-        sys.stderr.write(f"❌ Error conectando a DynamoDB: {e}\n")
-        dynamodb = None
-else:
-    sys.stderr.write("⚠️  DynamoDB no configurado. AWS_REGION y DYNAMODB_TABLE_NAME son necesarios.\n")
 
+def init_dynamodb():
+    """
+    Crea el recurso de DynamoDB (una vez por proceso) y verifica la tabla con DescribeTable, que además
+    resuelve credenciales y deja una conexión abierta en el pool. La API lo llama al arrancar
+    (lifespan de main.py); el resto de los usuarios del módulo lo inicializan en la primera operación.
+    Si la conexión falla, las operaciones siguientes lo reintentan (backoff de INIT_RETRY_BASE_DELAY
+    hasta INIT_RETRY_MAX_DELAY segundos). Devuelve DYNAMODB_AVAILABLE.
+    """
+    global dynamodb, DYNAMODB_AVAILABLE, _initialized, _init_failures, _init_retry_at
+    if _initialized or time.monotonic() < _init_retry_at:
+        return DYNAMODB_AVAILABLE
+    with _init_lock:
+        if _initialized or time.monotonic() < _init_retry_at:
+            return DYNAMODB_AVAILABLE
+        if DYNAMODB_REGION and DYNAMODB_TABLE_NAME:
+            try:
+                resource = aws_clients.create_resource('dynamodb', DYNAMODB_REGION)
+                resource.Table(DYNAMODB_TABLE_NAME).load()  # Verifica que la tabla existe y se puede acceder
+                dynamodb = resource
+                DYNAMODB_AVAILABLE = True
+                _initialized = True
+                logger.info("Conectado a DynamoDB en región: %s", DYNAMODB_REGION)
+            except Exception as e:
+                # Un error transitorio no deja al worker sin DynamoDB: se reintenta más tarde
+                _init_failures += 1
+                delay = min(INIT_RETRY_MAX_DELAY, INIT_RETRY_BASE_DELAY * 2 ** (_init_failures - 1))
+                _init_retry_at = time.monotonic() + delay
+                logger.error("Error conectando a DynamoDB (se reintenta en %.0f s): %s", delay, e)
+        else:
+            logger.warning("DynamoDB no configurado. AWS_REGION y DYNAMODB_TABLE_NAME son necesarios.")
+            _initialized = True
+    return DYNAMODB_AVAILABLE
 
-def save_analysis_complete(
+def calculate_profile_id(answers):
+    """
+    Calcula el profile_id Big Five ("E_alto__A_medio__...") a partir de las 10 respuestas del test.
+    """
+    # Preguntas invertidas: 2,4,6,8,10 (índices 1,3,5,7,9)
+    invert_indices = [1,3,5,7,9]
+    scores = []
+    for i, val in enumerate(answers):
+        if i in invert_indices:
+            scores.append(6 - val if 1 <= val <= 5 else val)
+        else:
+            scores.append(val)
+    # Rasgos: E(0,1), A(2,3), N(4,5), C(6,7), O(8,9)
+    traits = {
+        'E': (scores[0] + scores[1]) / 2,
+        'A': (scores[2] + scores[3]) / 2,
+        'N': (scores[4] + scores[5]) / 2,
+        'C': (scores[6] + scores[7]) / 2,
+        'O': (scores[8] + scores[9]) / 2
+    }
+    def label(val):
+        if val >= 4.0:
+            return 'alto'
+        elif val <= 2.5:
+            return 'bajo'
+        else:
+            return 'medio'
+    profile_id = '__'.join([f"{k}_{label(v)}" for k,v in traits.items()])
+    return profile_id
+
+def to_decimal_map(values):
+    """
+    Convierte los valores numéricos de un dict (p. ej. wpm_by_segment) a Decimal, como exige DynamoDB.
+    Los valores no convertibles quedan en Decimal('0').
+    """
+    converted = {}
+    if values:
+        for k, v in values.items():
+            try:
+                converted[k] = Decimal(str(v))
+            except Exception:
+                converted[k] = Decimal('0')
+    return converted
+
+
+def decode_analysis_item(item):
+    """Devuelve el item con los textos comprimidos (o guardados en S3) como str."""
+    for field, key in text_compression.decode_item_texts(item):
+        text_compression.resolve_overflow(item, field, key, s3_manager.get_bytes(key) if s3_manager else None)
+    return item
+
+
+def build_analysis_item(
+    analysis_id: str,
     user_id: str,
     analysis_text: str,
-    player_audio_data: bytes,
-    coach_audio_data: bytes,
-    base_filename: str,
     transcription: str,
     tts_preferences: dict,
     user_personality_test: list,
     wpm: float = 0.0,
-    wmp_by_segment: dict = None # Añadir wmp por segmento
+    wmp_by_segment: dict = None,
+    loudness_by_second: list = None,
+    player_s3_url: str = '',
+    coach_s3_url: str = '',
+    player_audio_key: str = None,
+    coach_audio_key: str = None,
+    original_urls: dict = None,
+    structured_analysis: str = None,
+    username: str = None,
+    fecha_analisis: str = None
 ) -> Dict:
     """
-    Orquesta el proceso completo: sube audio del jugador y del coach a S3 y guarda el análisis en DynamoDB.
+    Arma el item de la tabla de análisis (números como Decimal, profile_id calculado del test).
+    Lo usan save_analysis_complete y su versión asíncrona en async_storage.py. Los textos se
+    guardan tal cual; prepare_analysis_item los comprime (text_compression.encode_item_texts).
+    loudness_by_second (un valor por segundo de partida) se guarda como texto JSON para que se
+    comprima igual que los textos largos; report_metrics lo devuelve como lista.
     """
-    result = {
-        'success': False,
-        'analysis_id': "local-" + str(uuid.uuid4()),
-        'player_s3_url': '',
-        'coach_s3_url': '',
+    timestamp = datetime.utcnow().isoformat()
+    # Log de preferencias recibidas antes de guardar
+    if logger.isEnabledFor(logging.DEBUG):
+        if isinstance(tts_preferences, dict):
+            logger.debug("tts_preferences keys: %s", list(tts_preferences))
+        else:
+            logger.debug("tts_preferences no es un dict serializable")
+
+    # Convertir wpm y los valores de wpm_by_segment a Decimal
+    wpm_decimal = Decimal(str(wpm)) if wpm is not None else Decimal('0')
+    wpm_by_segment_decimal = to_decimal_map(wmp_by_segment)
+
+    # Si user_personality_test es una lista de 10 elementos, calcula el profile_id
+    profile_id = None
+    if isinstance(user_personality_test, list) and len(user_personality_test) == 10:
+        profile_id = calculate_profile_id(user_personality_test)
+
+    item = {
+        'id': analysis_id,  # DynamoDB requiere este campo como clave primaria
+        'analysis_id': analysis_id,
+        'user_id': user_id,
+        'player_audio_url': player_s3_url,  # URL del audio del jugador
+        'coach_audio_url': coach_s3_url,    # URL del audio del coach
+        'player_audio_key': player_audio_key,  # Key en S3 (compartida si el audio se repite)
+        'coach_audio_key': coach_audio_key,
+        'analysis_text': analysis_text,
+        'transcription': transcription,
+        'timestamp': timestamp,
+        'tts_preferences': tts_preferences,
+        'user_personality_test': user_personality_test,
+        'profile_id': profile_id,
+        'wpm': wpm_decimal,
+        'wpm_by_segment': wpm_by_segment_decimal,
+    }
+    original_urls = original_urls or {}
+    if original_urls.get('player'):
+        item['player_audio_original_url'] = original_urls['player']
+    if original_urls.get('coach'):
+        item['coach_audio_original_url'] = original_urls['coach']
+    for field, value in (('structured_analysis', structured_analysis), ('username', username), ('fecha_analisis', fecha_analisis)):
+        if value:
+            item[field] = value
+    if loudness_by_second:
+        item['loudness_by_second'] = json.dumps([float(value) for value in loudness_by_second], separators=(',', ':'))
+    return item
+
+
+def _plain_number(value):
+    """Decimal de DynamoDB -> int si es entero, si no float (como los calculó el procesador)."""
+    return int(value) if value == value.to_integral_value() else float(value)
+
+
+def report_metrics(item):
+    """
+    Métricas del reporte PDF ({'wpm', 'wpm_by_segment', 'loudness_by_second'}) de un item ya
+    decodificado, con los mismos tipos que recibe el bot del procesador: así GET /reports arma la
+    misma clave de pdf_cache que el PDF enviado por Discord.
+    """
+    metrics = {}
+    if item.get('wpm') is not None:
+        metrics['wpm'] = _plain_number(Decimal(item['wpm']))
+    if item.get('wpm_by_segment'):
+        metrics['wpm_by_segment'] = {k: _plain_number(Decimal(v)) for k, v in item['wpm_by_segment'].items()}
+    loudness = item.get('loudness_by_second')
+    if loudness:
+        try:
+            metrics['loudness_by_second'] = json.loads(loudness)
+        except ValueError:
+            logger.warning("loudness_by_second inválido en el análisis %s", item.get('id'))
+    return metrics
+
+
+def conditional_put_arguments(idempotent):
+    """Argumentos extra de put_item: con idempotent=True no se pisa un análisis ya guardado."""
+    return {'ConditionExpression': 'attribute_not_exists(id)'} if idempotent else {}
+
+
+def is_conditional_check_failed(error):
+    return getattr(error, 'response', {}).get('Error', {}).get('Code') == 'ConditionalCheckFailedException'
+
+
+def duplicate_result(item, analysis_id):
+    """Resultado de save_analysis_complete para un reintento idempotente: el del guardado original."""
+    logger.info("Análisis ya guardado, reintento idempotente", extra={'analysis_id': analysis_id, 'user_id': item.get('user_id')})
+    return {
+        'success': True,
+        'duplicate': True,
+        'analysis_id': analysis_id,
+        'player_s3_url': item.get('player_audio_url') or '',
+        'coach_s3_url': item.get('coach_audio_url') or '',
         'error': '',
-        # Echo back for debugging
-        'echo_user_preferences': tts_preferences or {}
+        'echo_user_preferences': item.get('tts_preferences') or {}
     }
 
-    # 1. Subir audio del jugador a S3
+
+def existing_analysis_result(item, analysis_id, user_id):
+    """
+    Resultado cuando el put_item condicional encontró el analysis_id ya guardado: el del guardado
+    original si es del mismo usuario (un reintento), o un conflicto (main.py responde 409) si el
+    id pertenece a otro usuario. El item ajeno no se pisa ni se expone.
+    """
+    if item.get('user_id') != user_id:
+        logger.warning("analysis_id en uso por otro usuario", extra={'analysis_id': analysis_id, 'user_id': user_id})
+        return {
+            'success': False,
+            'conflict': True,
+            'analysis_id': analysis_id,
+            'player_s3_url': '',
+            'coach_s3_url': '',
+            'error': 'El analysis_id ya está en uso.',
+            'echo_user_preferences': {}
+        }
+    return duplicate_result(item, analysis_id)
+
+
+def prepare_analysis_item(
+    user_id: str,
+    analysis_text: str,
+    player_audio_data: bytes,
+    coach_audio_data: bytes,
+    base_filename: str,
+    transcription: str,
+    tts_preferences: dict,
+    user_personality_test: list,
+    wpm: float = 0.0,
+    wmp_by_segment: dict = None,
+    loudness_by_second: list = None,
+    player_audio_key: str = None,
+    coach_audio_key: str = None,
+    analysis_id: str = None,
+    audio_format: str = 'mp3',
+    player_original_audio_data: bytes = None,
+    coach_original_audio_data: bytes = None,
+    player_audio_filename: str = None,
+    coach_audio_filename: str = None,
+    structured_analysis: str = None,
+    username: str = None,
+    fecha_analisis: str = None
+) -> Dict:
+    """
+    Sube a S3 los audios de un análisis y arma su item, sin escribirlo en DynamoDB (mismos
+    argumentos que save_analysis_complete). Un audio que no se pudo subir queda con URL vacía.
+    La usan save_analysis_complete (put_item) y /guardar-analisis/batch (write_analysis_items).
+    """
     player_s3_url = ""
     coach_s3_url = ""
-    analysis_id = str(uuid.uuid4())
-    player_filename = f"player_{analysis_id}.mp3"
-    coach_filename = f"coach_{analysis_id}.mp3"
-    if S3_AVAILABLE and s3_manager and player_audio_data:
+    analysis_id = analysis_id or str(uuid.uuid4())
+    audio_content_type = AUDIO_CONTENT_TYPES.get(audio_format, 'audio/mpeg')
+    original_urls = {}
+
+    # 1. Subir audio del jugador a S3
+    if S3_AVAILABLE and s3_manager and player_audio_key:
+        player_s3_url = s3_manager.object_url(player_audio_key)
+        logger.debug("Audio del jugador ya está en S3: %s", player_s3_url)
+    elif S3_AVAILABLE and s3_manager and player_audio_data:
         try:
-            player_s3_url = s3_manager.upload_audio_from_bytes(player_audio_data, user_id, player_filename)
+            player_s3_url, player_audio_key, uploaded = s3_manager.upload_audio_deduplicated(
+                player_audio_data, user_id, player_audio_filename, audio_content_type, audio_format,
+                known_absent=bool(player_audio_filename)
+            )
             if player_s3_url:
-                result['player_s3_url'] = player_s3_url
-                sys.stderr.write(f"✅ Audio del jugador subido a S3: {player_s3_url}\n")
+                if uploaded:
+                    logger.info("Audio del jugador subido a S3: %s", player_s3_url)
+                else:
+                    logger.info("Audio del jugador ya existía en S3, se reutiliza: %s", player_s3_url)
             else:
-                sys.stderr.write("⚠️  No se pudo subir audio del jugador a S3.\n")
+                logger.warning("No se pudo subir audio del jugador a S3.")
         except Exception as e:
-            sys.stderr.write(f"⚠️  Error subiendo audio del jugador a S3: {e}\n")
+            logger.warning("Error subiendo audio del jugador a S3: %s", e)
     elif not S3_AVAILABLE:
-        sys.stderr.write("ℹ️ S3 no está disponible, omitiendo subida de audio del jugador.\n")
+        logger.debug("S3 no está disponible, omitiendo subida de audio del jugador.")
     elif not player_audio_data:
-        sys.stderr.write(f"⚠️  No hay datos de audio del jugador, no se puede subir a S3.\n")
+        logger.debug("No hay datos de audio del jugador, no se puede subir a S3.")
 
     # 2. Subir audio del coach a S3
-    if S3_AVAILABLE and s3_manager and coach_audio_data:
+    if S3_AVAILABLE and s3_manager and coach_audio_key:
+        coach_s3_url = s3_manager.object_url(coach_audio_key)
+        logger.debug("Audio del coach ya está en S3: %s", coach_s3_url)
+    elif S3_AVAILABLE and s3_manager and coach_audio_data:
         try:
-            coach_s3_url = s3_manager.upload_audio_from_bytes(coach_audio_data, user_id, coach_filename)
+            coach_s3_url, coach_audio_key, uploaded = s3_manager.upload_audio_deduplicated(
+                coach_audio_data, user_id, coach_audio_filename, audio_content_type, audio_format,
+                known_absent=bool(coach_audio_filename)
+            )
             if coach_s3_url:
-                result['coach_s3_url'] = coach_s3_url
-                sys.stderr.write(f"✅ Audio del coach subido a S3: {coach_s3_url}\n")
+                if uploaded:
+                    logger.info("Audio del coach subido a S3: %s", coach_s3_url)
+                else:
+                    logger.info("Audio del coach ya existía en S3, se reutiliza: %s", coach_s3_url)
             else:
-                sys.stderr.write("⚠️  No se pudo subir audio del coach a S3.\n")
+                logger.warning("No se pudo subir audio del coach a S3.")
         except Exception as e:
-            sys.stderr.write(f"⚠️  Error subiendo audio del coach a S3: {e}\n")
+            logger.warning("Error subiendo audio del coach a S3: %s", e)
     elif not S3_AVAILABLE:
-        sys.stderr.write("ℹ️ S3 no está disponible, omitiendo subida de audio del coach.\n")
+        logger.debug("S3 no está disponible, omitiendo subida de audio del coach.")
     elif not coach_audio_data:
-        sys.stderr.write(f"⚠️  No hay datos de audio del coach, no se puede subir a S3.\n")
+        logger.debug("No hay datos de audio del coach, no se puede subir a S3.")
+
+    # 2b. Conservar los originales (MP3) en el prefijo frío si se transcodificaron
+    if S3_AVAILABLE and s3_manager:
+        for role, original_data in (('player', player_original_audio_data), ('coach', coach_original_audio_data)):
+            if not original_data:
+                continue
+            try:
+                original_url = s3_manager.upload_original_audio(original_data, user_id, s3_manager.content_filename(original_data, 'mp3'))
+            except Exception as e:
+                logger.warning("Error guardando el audio original del %s: %s", role, e)
+                original_url = ''
+            if original_url:
+                original_urls[role] = original_url
+                logger.info("Audio original del %s guardado en almacenamiento frío: %s", role, original_url)
+            else:
+                logger.warning("No se pudo guardar el audio original del %s.", role)
+
+    item = build_analysis_item(
+        analysis_id=analysis_id,
+        user_id=user_id,
+        analysis_text=analysis_text,
+        transcription=transcription,
+        tts_preferences=tts_preferences,
+        user_personality_test=user_personality_test,
+        wpm=wpm,
+        wmp_by_segment=wmp_by_segment,
+        loudness_by_second=loudness_by_second,
+        player_s3_url=player_s3_url,
+        coach_s3_url=coach_s3_url,
+        player_audio_key=player_audio_key,
+        coach_audio_key=coach_audio_key,
+        original_urls=original_urls,
+        structured_analysis=structured_analysis,
+        username=username,
+        fecha_analisis=fecha_analisis
+    )
+    # Textos largos comprimidos; los que no entran en el item van a S3 (ver text_compression.py)
+    for field, key, blob in text_compression.encode_item_texts(item):
+        if not (S3_AVAILABLE and s3_manager and s3_manager.put_bytes(key, blob)):
+            logger.warning("No se pudo guardar %s en S3, queda en el item", field, extra={'analysis_id': analysis_id})
+            item[field] = blob
+    return item
+
+
+@traced('save_analysis_complete')
+def save_analysis_complete(
+    user_id: str,
+    analysis_text: str,
+    player_audio_data: bytes,
+    coach_audio_data: bytes,
+    base_filename: str,
+    transcription: str,
+    tts_preferences: dict,
+    user_personality_test: list,
+    wpm: float = 0.0,
+    wmp_by_segment: dict = None, # Añadir wmp por segmento
+    loudness_by_second: list = None,
+    player_audio_key: str = None,
+    coach_audio_key: str = None,
+    analysis_id: str = None,
+    audio_format: str = 'mp3',
+    player_original_audio_data: bytes = None,
+    coach_original_audio_data: bytes = None,
+    player_audio_filename: str = None,
+    coach_audio_filename: str = None,
+    structured_analysis: str = None,
+    username: str = None,
+    fecha_analisis: str = None,
+    idempotent: bool = False
+) -> Dict:
+    """
+    Orquesta el proceso completo: sube audio del jugador y del coach a S3 y guarda el análisis en DynamoDB.
+    Si se reciben player_audio_key/coach_audio_key, el audio ya fue subido directamente a S3
+    (ver /upload-slots/) y solo se referencia la key existente.
+    Con audio_format='ogg' el audio recibido ya está transcodificado a Opus; los *_original_audio_data
+    (MP3) se guardan opcionalmente en el prefijo frío de S3.
+    Los audios se guardan bajo keys direccionadas por contenido (sha256), por lo que un audio
+    repetido no se vuelve a subir. *_audio_filename es el nombre que find_existing_audio ya verificó
+    como ausente (el sha256 es del audio recibido, antes de transcodificar): se sube sin otro HEAD.
+    structured_analysis, username y fecha_analisis se guardan para poder regenerar el reporte PDF
+    (GET /reports/{analysis_id}.pdf).
+    Con idempotent=True (analysis_id recibido del cliente o derivado de un Idempotency-Key) el item
+    solo se escribe si no existe; si ya existía se devuelve el resultado del guardado original, o un
+    conflicto si es de otro usuario (ver existing_analysis_result).
+    """
+    result = {
+        'success': False,
+        'analysis_id': "local-" + str(uuid.uuid4()),
+        'player_s3_url': '',
+        'coach_s3_url': '',
+        'error': '',
+        # Echo back for debugging
+        'echo_user_preferences': tts_preferences or {}
+    }
+
+    analysis_id = analysis_id or str(uuid.uuid4())
+    item = prepare_analysis_item(
+        user_id=user_id,
+        analysis_text=analysis_text,
+        player_audio_data=player_audio_data,
+        coach_audio_data=coach_audio_data,
+        base_filename=base_filename,
+        transcription=transcription,
+        tts_preferences=tts_preferences,
+        user_personality_test=user_personality_test,
+        wpm=wpm,
+        wmp_by_segment=wmp_by_segment,
+        loudness_by_second=loudness_by_second,
+        player_audio_key=player_audio_key,
+        coach_audio_key=coach_audio_key,
+        analysis_id=analysis_id,
+        audio_format=audio_format,
+        player_original_audio_data=player_original_audio_data,
+        coach_original_audio_data=coach_original_audio_data,
+        player_audio_filename=player_audio_filename,
+        coach_audio_filename=coach_audio_filename,
+        structured_analysis=structured_analysis,
+        username=username,
+        fecha_analisis=fecha_analisis
+    )
+    result['player_s3_url'] = item['player_audio_url'] or ''
+    result['coach_s3_url'] = item['coach_audio_url'] or ''
 
     # 3. Guardar análisis en DynamoDB
-    if not DYNAMODB_AVAILABLE:
+    if not init_dynamodb():
         result['error'] = 'DynamoDB no está disponible.'
-        sys.stderr.write("⚠️  DynamoDB no disponible, análisis no guardado en la nube.\n")
+        logger.warning("DynamoDB no disponible, análisis no guardado en la nube.")
         return result
 
     try:
         table = dynamodb.Table(DYNAMODB_TABLE_NAME)
-        timestamp = datetime.utcnow().isoformat()
-        # Log de preferencias recibidas antes de guardar
-        try:
-            pref_keys = list((tts_preferences or {}).keys())
-            sys.stderr.write(f"🧩 tts_preferences keys: {pref_keys}\n")
-        except Exception:
-            sys.stderr.write("🧩 tts_preferences no es un dict serializable\n")
-
-        # Convertir wpm a Decimal
-        wpm_decimal = Decimal(str(wpm)) if wpm is not None else Decimal('0')
-        # Convertir los valores de wpm_by_segment a Decimal si existen
-        wpm_by_segment_decimal = {}
-        if wmp_by_segment:
-            for k, v in wmp_by_segment.items():
-                try:
-                    wpm_by_segment_decimal[k] = Decimal(str(v))
-                except Exception:
-                    wpm_by_segment_decimal[k] = Decimal('0')
-
-        # Calcular profile_id a partir de user_personality_test
-        def calculate_profile_id(answers):
-            # Preguntas invertidas: 2,4,6,8,10 (índices 1,3,5,7,9)
-            invert_indices = [1,3,5,7,9]
-            scores = []
-            for i, val in enumerate(answers):
-                if i in invert_indices:
-                    scores.append(6 - val if 1 <= val <= 5 else val)
-                else:
-                    scores.append(val)
-            # Rasgos: E(0,1), A(2,3), N(4,5), C(6,7), O(8,9)
-            traits = {
-                'E': (scores[0] + scores[1]) / 2,
-                'A': (scores[2] + scores[3]) / 2,
-                'N': (scores[4] + scores[5]) / 2,
-                'C': (scores[6] + scores[7]) / 2,
-                'O': (scores[8] + scores[9]) / 2
-            }
-            def label(val):
-                if val >= 4.0:
-                    return 'alto'
-                elif val <= 2.5:
-                    return 'bajo'
-                else:
-                    return 'medio'
-            profile_id = '__'.join([f"{k}_{label(v)}" for k,v in traits.items()])
-            return profile_id
-
-        # Si user_personality_test es una lista de 10 elementos, calcula el profile_id
-        profile_id = None
-        if isinstance(user_personality_test, list) and len(user_personality_test) == 10:
-            profile_id = calculate_profile_id(user_personality_test)
-
-        item = {
-            'id': analysis_id,  # DynamoDB requiere este campo como clave primaria
-            'analysis_id': analysis_id,
-            'user_id': user_id,
-            'player_audio_url': player_s3_url,  # URL del audio del jugador
-            'coach_audio_url': coach_s3_url,    # URL del audio del coach
-            'analysis_text': analysis_text,
-            'transcription': transcription,
-            'timestamp': timestamp,
-            'tts_preferences': tts_preferences,
-            'user_personality_test': user_personality_test,
-            'profile_id': profile_id,
-            'wpm': wpm_decimal,
-            'wpm_by_segment': wpm_by_segment_decimal,
-        }
-        table.put_item(Item=item)
+        table.put_item(Item=item, **conditional_put_arguments(idempotent))
         result['success'] = True
         result['analysis_id'] = analysis_id
-        sys.stderr.write(f"✅ Análisis guardado en DynamoDB. ID: {analysis_id}\n")
+        logger.info("Análisis guardado en DynamoDB", extra={'analysis_id': analysis_id, 'user_id': user_id})
     except Exception as e:
+        if idempotent and is_conditional_check_failed(e):
+            try:
+                existing = dynamodb.Table(DYNAMODB_TABLE_NAME).get_item(Key={'id': analysis_id}, ConsistentRead=True).get('Item')
+                return existing_analysis_result(existing or {}, analysis_id, user_id)
+            except Exception as read_error:
+                e = read_error
         result['error'] = f"Error al guardar en DynamoDB: {e}"
-        sys.stderr.write(f"❌ Error guardando análisis en DynamoDB: {e}\n")
+        logger.error("Error guardando análisis en DynamoDB: %s", e, extra={'analysis_id': analysis_id, 'user_id': user_id})
     return result
 
+@traced('write_analysis_items')
+def write_analysis_items(items) -> Dict:
+    """
+    Escribe varios items ya armados (prepare_analysis_item) con batch_writer, de a
+    BATCH_WRITE_SIZE por BatchWriteItem. batch_writer reenvía los UnprocessedItems; si un lote
+    falla, se marcan con error solo sus items.
+    Devuelve {'success': ..., 'errors': [...]} con un error ('' si se guardó) por item, en orden.
+    No admite condiciones: los reintentos idempotentes se filtran antes con get_existing_analyses.
+    """
+    if not init_dynamodb():
+        return {'success': False, 'errors': ['DynamoDB no está disponible.'] * len(items)}
+
+    table = dynamodb.Table(DYNAMODB_TABLE_NAME)
+    errors = []
+    for start in range(0, len(items), BATCH_WRITE_SIZE):
+        chunk = items[start:start + BATCH_WRITE_SIZE]
+        try:
+            with table.batch_writer() as writer:
+                for item in chunk:
+                    writer.put_item(Item=item)
+            errors.extend([''] * len(chunk))
+        except Exception as e:
+            logger.error("Error guardando un lote de análisis en DynamoDB: %s", e, extra={'items': len(chunk)})
+            errors.extend([f"Error al guardar en DynamoDB: {e}"] * len(chunk))
+    logger.info("Lote de análisis guardado en DynamoDB", extra={'items': len(items), 'failed': sum(1 for error in errors if error)})
+    return {'success': not any(errors), 'errors': errors}
+
+
+@traced('get_existing_analyses')
+def get_existing_analyses(analysis_ids) -> Dict:
+    """
+    Lee con BatchGetItem (lectura consistente, de a BATCH_GET_SIZE ids) los análisis que ya existen.
+    Devuelve {'success': True, 'data': {analysis_id: item}}; los ids que no existen no aparecen.
+    """
+    if not init_dynamodb():
+        return {'success': False, 'error': 'DynamoDB no está disponible.'}
+
+    found = {}
+    try:
+        for start in range(0, len(analysis_ids), BATCH_GET_SIZE):
+            request = {DYNAMODB_TABLE_NAME: {
+                'Keys': [{'id': analysis_id} for analysis_id in analysis_ids[start:start + BATCH_GET_SIZE]],
+                'ConsistentRead': True,
+            }}
+            for attempt in range(BATCH_MAX_ATTEMPTS):
+                if attempt:
+                    time.sleep(BATCH_RETRY_BASE_DELAY * 2 ** attempt)
+                response = dynamodb.batch_get_item(RequestItems=request)
+                for item in response.get('Responses', {}).get(DYNAMODB_TABLE_NAME, []):
+                    found[item['id']] = item
+                request = response.get('UnprocessedKeys')
+                if not request:
+                    break
+            else:
+                raise RuntimeError("DynamoDB dejó ids sin leer después de varios reintentos")
+        return {'success': True, 'data': found}
+    except Exception as e:
+        error_message = f"Error al leer análisis de DynamoDB: {e}"
+        logger.error(error_message)
+        return {'success': False, 'error': error_message}
+
+@traced('get_analysis_by_id')
+def get_analysis_by_id(analysis_id: str) -> Dict:
+    """
+    Obtiene un análisis por su id (clave primaria de la tabla).
+    """
+    if not init_dynamodb():
+        return {'success': False, 'error': 'DynamoDB no está disponible.'}
+
+    try:
+        table = dynamodb.Table(DYNAMODB_TABLE_NAME)
+        response = table.get_item(Key={'id': analysis_id})
+        item = response.get('Item')
+        return {'success': True, 'data': decode_analysis_item(item) if item else None}
+    except Exception as e:
+        error_message = f"Error al obtener el análisis de DynamoDB: {e}"
+        logger.error(error_message)
+        return {'success': False, 'error': error_message}
+
+@traced('get_analyses_by_user')
 def get_analyses_by_user(user_id: str) -> Dict:
     """
-    Obtiene todos los análisis de un usuario desde DynamoDB.
+    Obtiene todos los análisis de un usuario desde DynamoDB, con los textos ya descomprimidos.
     """
-    if not DYNAMODB_AVAILABLE:
+    if not init_dynamodb():
         return {'success': False, 'error': 'DynamoDB no está disponible.'}
 
     try:
@@ -203,8 +598,8 @@ def get_analyses_by_user(user_id: str) -> Dict:
             IndexName='user_id-index',  # Asumiendo que tienes un GSI en 'user_id'
             KeyConditionExpression=boto3.dynamodb.conditions.Key('user_id').eq(user_id)
         )
-        return {'success': True, 'data': response.get('Items', [])}
+        return {'success': True, 'data': [decode_analysis_item(item) for item in response.get('Items', [])]}
     except Exception as e:
         error_message = f"Error al obtener análisis de DynamoDB: {e}"
-        sys.stderr.write(f"❌ {error_message}\n")
+        logger.error(error_message)
         return {'success': False, 'error': error_message}
@@ -11,12 +11,32 @@ Uso: node | python esports_processor_simple.py <user_id> <username> <timestamp>
 import os
 import sys
 import json
-import requests
+import importlib.util
 import time
 import random
+import subprocess
 from pathlib import Path
 from dotenv import load_dotenv
 
+import tracing
+
+
+def _lazy_import(name):
+    """
+    Módulo que se carga recién al usar uno de sus atributos (importlib.util.LazyLoader).
+    requests tarda más que todo el resto del arranque y solo hace falta al llamar a OpenAI.
+    """
+    spec = importlib.util.find_spec(name)
+    loader = importlib.util.LazyLoader(spec.loader)
+    spec.loader = loader
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    loader.exec_module(module)
+    return module
+
+
+requests = _lazy_import('requests')
+
 # Importar módulos de AWS
 try:
     # from dynamodb_config import save_analysis_complete
@@ -29,10 +49,51 @@ load_dotenv()
 
 # Configuración de APIs
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
+# Permite apuntar a un servidor compatible (p. ej. benchmarks/openai_stub.py) en vez de OpenAI
+OPENAI_BASE_URL = os.getenv("OPENAI_BASE_URL", "https://api.openai.com/v1").rstrip('/')
+OPENAI_TIMEOUT = float(os.getenv("OPENAI_TIMEOUT", "120"))
+OPENAI_MAX_RETRIES = int(os.getenv("OPENAI_MAX_RETRIES", "2"))
+
+_openai_session = None
+
+def get_openai_session():
+    """
+    Sesión HTTP compartida para la API de OpenAI: reutiliza conexiones y reintenta 429/5xx
+    con backoff exponencial, respetando Retry-After.
+    """
+    global _openai_session
+    if _openai_session is None:
+        from requests.adapters import HTTPAdapter
+        from urllib3.util.retry import Retry
+        retry = Retry(
+            total=OPENAI_MAX_RETRIES,
+            connect=OPENAI_MAX_RETRIES,
+            read=0,
+            status=OPENAI_MAX_RETRIES,
+            status_forcelist=(429, 500, 502, 503, 504),
+            allowed_methods=frozenset(['POST']),
+            backoff_factor=0.5,
+            raise_on_status=False,
+        )
+        _openai_session = requests.Session()
+        _openai_session.mount('http://', HTTPAdapter(max_retries=retry))
+        _openai_session.mount('https://', HTTPAdapter(max_retries=retry))
+    return _openai_session
+
+def openai_post(path, **kwargs):
+    """POST a {OPENAI_BASE_URL}{path} con la sesión compartida y timeout por defecto (un span por llamada)."""
+    kwargs.setdefault('timeout', OPENAI_TIMEOUT)
+    url = f"{OPENAI_BASE_URL}{path}"
+    with tracing.span(f"POST {path}", kind=tracing.KIND_CLIENT, **{'http.request.method': 'POST', 'url.full': url}) as current:
+        response = get_openai_session().post(url, **kwargs)
+        current.set_attribute('http.response.status_code', response.status_code)
+        if response.status_code >= 400:
+            current.set_error(f"HTTP {response.status_code}")
+        return response
 
 def transcribe_with_whisper_from_bytes(audio_data, filename):
     """Transcribe audio desde bytes usando OpenAI Whisper."""
-    url = "https://api.openai.com/v1/audio/transcriptions"
+    url = "/audio/transcriptions"
     headers = {
         "Authorization": f"Bearer {OPENAI_API_KEY}"
     }
@@ -47,7 +108,7 @@ def transcribe_with_whisper_from_bytes(audio_data, filename):
     
     try:
         sys.stderr.write("[WHISPER] Transcribiendo audio desde bytes con Whisper...\n")
-        response = requests.post(url, headers=headers, files=files)
+        response = openai_post(url, headers=headers, files=files)
         response.raise_for_status()
         
         result = response.json()
@@ -108,9 +169,43 @@ def calculate_wpm_by_segment(segments: list) -> dict:
     sys.stderr.write(f"[METRICA POR MINUTO] Palabras por minuto: {words_per_minute}\n")
     return words_per_minute
 
+LOUDNESS_FLOOR_DB = -60.0
+
+@tracing.traced('calculate_loudness_by_second')
+def calculate_loudness_by_second(audio_data: bytes) -> list:
+    """
+    Calcula el volumen (RMS en dBFS) de cada segundo del audio usando el filtro astats de ffmpeg.
+    Devuelve una lista con un valor por segundo, o una lista vacía si ffmpeg no está disponible.
+    """
+    if not audio_data:
+        return []
+    command = [
+        os.getenv('FFMPEG_BIN', 'ffmpeg'), '-hide_banner', '-nostats', '-loglevel', 'error',
+        '-i', 'pipe:0', '-ac', '1', '-ar', '8000',
+        # Ventanas de 1 segundo (8000 muestras), estadísticas reiniciadas en cada una
+        '-af', 'asetnsamples=n=8000,astats=metadata=1:reset=1,ametadata=print:key=lavfi.astats.Overall.RMS_level:file=-',
+        '-f', 'null', '-'
+    ]
+    try:
+        completed = subprocess.run(command, input=audio_data, capture_output=True, timeout=120)
+    except (OSError, subprocess.TimeoutExpired) as e:
+        sys.stderr.write(f"[METRICA VOLUMEN] No se pudo calcular el volumen: {e}\n")
+        return []
+    loudness = []
+    for line in completed.stdout.decode('utf-8', 'replace').splitlines():
+        if line.startswith('lavfi.astats.Overall.RMS_level='):
+            try:
+                value = float(line.split('=', 1)[1])
+            except ValueError:
+                value = LOUDNESS_FLOOR_DB
+            # El silencio absoluto llega como -inf
+            loudness.append(round(max(value, LOUDNESS_FLOOR_DB), 1))
+    sys.stderr.write(f"[METRICA VOLUMEN] {len(loudness)} segundos medidos\n")
+    return loudness
+
 def transcribe_with_gpt4o_mini_from_bytes(audio_data, filename, game_name="Call of Duty"):
     """Transcribe audio desde bytes usando GPT-4o-mini Audio (más económico)."""
-    url = "https://api.openai.com/v1/chat/completions"
+    url = "/chat/completions"
     headers = {
         "Authorization": f"Bearer {OPENAI_API_KEY}",
         "Content-Type": "application/json"
@@ -154,7 +249,7 @@ def transcribe_with_gpt4o_mini_from_bytes(audio_data, filename, game_name="Call
     
     try:
         sys.stderr.write("[GPT-4O-MINI] Transcribiendo audio con GPT-4o-mini (económico)...\n")
-        response = requests.post(url, headers=headers, json=payload)
+        response = openai_post(url, headers=headers, json=payload)
         response.raise_for_status()
         
         result = response.json()
@@ -190,7 +285,7 @@ def transcribe_with_gpt4o_mini_from_bytes(audio_data, filename, game_name="Call
 
 def transcribe_with_gpt4o_transcribe_from_bytes(audio_data, filename, game_name="Call of Duty"):
     """Transcribe audio desde bytes usando gpt-4o-transcribe (modelo específico para transcripción)."""
-    url = "https://api.openai.com/v1/audio/transcriptions"
+    url = "/audio/transcriptions"
     headers = {
         "Authorization": f"Bearer {OPENAI_API_KEY}"
     }
@@ -212,7 +307,7 @@ def transcribe_with_gpt4o_transcribe_from_bytes(audio_data, filename, game_name=
     try:
         sys.stderr.write("[GPT-4O-TRANSCRIBE] Transcribiendo audio con gpt-4o-transcribe...\n")
         sys.stderr.write(f"[CONTEXTO] Juego: {game_name}, País: Chile\n")
-        response = requests.post(url, headers=headers, files=files)
+        response = openai_post(url, headers=headers, files=files)
         response.raise_for_status()
         
         result = response.json()
@@ -348,7 +443,7 @@ Tu análisis debe adaptarse completamente a este perfil de personalidad, asegura
 
 def analyze_text(text, segments, user_id, analysis_prefs):
     """Analiza texto transcrito usando GPT con personalización basada en Big Five."""
-    url = "https://api.openai.com/v1/chat/completions"
+    url = "/chat/completions"
     headers = {
         "Content-Type": "application/json",
         "Authorization": f"Bearer {OPENAI_API_KEY}"
@@ -394,7 +489,7 @@ Ahora, analiza la transcripción y genera tu feedback personalizado según el pe
     
     try:
         sys.stderr.write("[GPT] Analizando con GPT-4o-mini...\n")
-        response = requests.post(url, headers=headers, json=data)
+        response = openai_post(url, headers=headers, json=data)
         response.raise_for_status()
         result = response.json()
         
@@ -413,7 +508,7 @@ Ahora, analiza la transcripción y genera tu feedback personalizado según el pe
 
 def structure_analysis(raw_analysis):
     """Estructura el análisis usando GPT-4o-mini para darle formato organizado."""
-    url = "https://api.openai.com/v1/chat/completions"
+    url = "/chat/completions"
     headers = {
         "Content-Type": "application/json",
         "Authorization": f"Bearer {OPENAI_API_KEY}"
@@ -466,7 +561,7 @@ Análisis original:
     
     try:
         sys.stderr.write("[STRUCTURE] Estructurando análisis con GPT-4o-mini...\n")
-        response = requests.post(url, headers=headers, json=data)
+        response = openai_post(url, headers=headers, json=data)
         response.raise_for_status()
         result = response.json()
         
@@ -513,8 +608,18 @@ def get_user_preference(user_id):
     sys.stderr.write("[PREFS] No se encontraron preferencias, usando defaults\n")
     return {}
 
-def process_audio_stream(user_id, username, timestamp, user_prefs):
-    """Procesa un stream de audio desde stdin."""
+def process_audio_stream(user_id, username, timestamp, user_prefs, traceparent=None):
+    """
+    Procesa un stream de audio desde stdin.
+    traceparent (W3C) enlaza los spans de este proceso con la traza de la grabación iniciada por el bot.
+    """
+    with tracing.span('process_audio_stream', traceparent, **{'clutch.user_id': user_id}) as current:
+        result = _process_audio_stream(user_id, username, timestamp, user_prefs)
+        if result.get('error'):
+            current.set_error(result['error'])
+        return result
+
+def _process_audio_stream(user_id, username, timestamp, user_prefs):
     sys.stderr.write(f"[PROCESO] Procesando audio para {username} ({user_id})\n")
     
     # Leer audio desde stdin
@@ -553,6 +658,7 @@ def process_audio_stream(user_id, username, timestamp, user_prefs):
         # Calcular Palabras por Minuto (WPM)
         wpm = calculate_wpm(transcribed_text, duration_seconds)
         wpm_by_segment = calculate_wpm_by_segment(transcribed_segments)
+        loudness_by_second = calculate_loudness_by_second(audio_data)
         
           # Análisis con GPT (ya tenemos analysis_prefs de antes)
         analysis_content = analyze_text(transcribed_text, transcribed_segments, user_id, analysis_prefs)
@@ -584,7 +690,8 @@ def process_audio_stream(user_id, username, timestamp, user_prefs):
             "structured_analysis": structured_analysis,  # Análisis estructurado
             "transcription": transcribed_text,
             "wpm": wpm,  # Añadir WPM a la respuesta
-            "wpm_by_segment": wpm_by_segment # Añadir WPM por segmento a la respuesta
+            "wpm_by_segment": wpm_by_segment, # Añadir WPM por segmento a la respuesta
+            "loudness_by_second": loudness_by_second  # Volumen (dBFS) por segundo para el reporte PDF
         }
         
         return output_data
@@ -595,16 +702,18 @@ def process_audio_stream(user_id, username, timestamp, user_prefs):
 
 if __name__ == "__main__":
     try:
-        if len(sys.argv) != 5:
-            sys.stderr.write(f"[ERROR] Argumentos incorrectos. Recibidos: {len(sys.argv)-1}, esperados: 4\n")
+        if len(sys.argv) not in (5, 6):
+            sys.stderr.write(f"[ERROR] Argumentos incorrectos. Recibidos: {len(sys.argv)-1}, esperados: 4 o 5\n")
             sys.stderr.write(f"[ERROR] Argumentos recibidos: {sys.argv[1:] if len(sys.argv) > 1 else 'ninguno'}\n")
-            sys.stderr.write("Uso: <stdin> | python esports_processor_simple.py <user_id> <username> <timestamp> <user_preferences_json>\n")
+            sys.stderr.write("Uso: <stdin> | python esports_processor_simple.py <user_id> <username> <timestamp> <user_preferences_json> [traceparent]\n")
             sys.exit(1)
         
         user_id_arg = sys.argv[1]
         username_arg = sys.argv[2]
         timestamp_arg = sys.argv[3]
         user_prefs_json = sys.argv[4]
+        traceparent_arg = sys.argv[5] if len(sys.argv) > 5 else os.getenv('TRACEPARENT')
+        tracing.set_service_name('clutch-processor')
         
         try:
             user_prefs_arg = json.loads(user_prefs_json)
@@ -615,7 +724,7 @@ if __name__ == "__main__":
         sys.stderr.write(f"[ARGS] Procesando: user_id={user_id_arg}, username={username_arg}, timestamp={timestamp_arg}\n")
         sys.stderr.write(f"[PREFS] Preferencias recibidas: {user_prefs_arg}\n")
         
-        result = process_audio_stream(user_id_arg, username_arg, timestamp_arg, user_prefs_arg)
+        result = process_audio_stream(user_id_arg, username_arg, timestamp_arg, user_prefs_arg, traceparent_arg)
         
         # Imprimir resultado como JSON a stdout para que Node.js lo capture con UTF-8 correcto
         if result:
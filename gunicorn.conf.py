@@ -0,0 +1,24 @@
+"""
+Configuración de gunicorn (se carga sola desde el directorio de trabajo; ver Procfile).
+
+Prepara el directorio compartido de prometheus_client para que /metrics agregue los
+contadores de todos los workers, y limpia los archivos de los workers que terminan.
+"""
+
+import os
+import shutil
+import tempfile
+
+os.environ.setdefault('PROMETHEUS_MULTIPROC_DIR', os.path.join(tempfile.gettempdir(), 'clutch_prometheus'))
+
+
+def on_starting(server):
+    # Los valores de una ejecución anterior no deben sumarse a los de esta
+    multiproc_dir = os.environ['PROMETHEUS_MULTIPROC_DIR']
+    shutil.rmtree(multiproc_dir, ignore_errors=True)
+    os.makedirs(multiproc_dir, exist_ok=True)
+
+
+def child_exit(server, worker):
+    from prometheus_client import multiprocess
+    multiprocess.mark_process_dead(worker.pid)
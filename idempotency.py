@@ -0,0 +1,81 @@
+"""
+Escrituras idempotentes de /guardar-analisis/ con el header Idempotency-Key.
+
+El bot manda una clave estable por grabación (user_id:timestamp) y puede reintentar sin miedo:
+- El analysis_id se deriva de (user_id, clave) con uuid5, así todos los intentos escriben el
+  mismo item, y el put_item es condicional (attribute_not_exists(id)). Si el item ya existe se
+  devuelve el resultado original en vez de pisarlo (ver save_analysis_complete).
+- Cada worker recuerda por IDEMPOTENCY_CACHE_TTL segundos el resultado de las claves que ya
+  guardó: un reintento que cae en el mismo worker responde desde memoria, sin transcodificar
+  ni tocar S3. Un duplicado que llega mientras el original todavía corre espera ese resultado.
+
+Solo se recuerdan los resultados exitosos: un intento que falló se vuelve a ejecutar completo.
+"""
+
+import asyncio
+import os
+import time
+import uuid
+from collections import OrderedDict
+
+IDEMPOTENCY_CACHE_TTL = float(os.getenv('IDEMPOTENCY_CACHE_TTL', '600'))
+IDEMPOTENCY_CACHE_SIZE = int(os.getenv('IDEMPOTENCY_CACHE_SIZE', '10000'))
+# Máximo aceptado para el header (la clave termina dentro de un uuid5, no en la tabla)
+IDEMPOTENCY_KEY_MAX_LENGTH = 255
+
+# Espacio de nombres fijo: cambiarlo haría que los reintentos en curso generen otro analysis_id
+ANALYSIS_NAMESPACE = uuid.UUID('6f1c8e2a-93b4-4d0e-9a57-2c1d0b7e4f10')
+
+
+def analysis_id_for(user_id, idempotency_key):
+    """analysis_id determinístico: la misma (user_id, clave) da siempre el mismo id."""
+    return str(uuid.uuid5(ANALYSIS_NAMESPACE, f"{user_id}\n{idempotency_key}"))
+
+
+class IdempotencyCache:
+    """
+    Resultados recientes por clave, con TTL y tamaño acotado. Corre en el event loop del worker,
+    así que no necesita locks.
+    """
+
+    def __init__(self, ttl=IDEMPOTENCY_CACHE_TTL, max_size=IDEMPOTENCY_CACHE_SIZE):
+        self.ttl = ttl
+        self.max_size = max_size
+        self.entries = OrderedDict()  # clave -> (expira_en, future con el resultado)
+
+    def _expire(self, now):
+        # Las entradas están en orden de creación; una todavía en curso corta el recorrido
+        while self.entries:
+            expires, future = next(iter(self.entries.values()))
+            if not future.done() or (expires > now and len(self.entries) <= self.max_size):
+                break
+            self.entries.popitem(last=False)
+
+    async def run(self, key, operation):
+        """
+        Ejecuta operation() (una corutina que devuelve {'success': ...}) una sola vez por clave.
+        Devuelve (resultado, repetido). repetido=True si el resultado viene de un intento anterior.
+        """
+        while True:
+            now = time.monotonic()
+            self._expire(now)
+            entry = self.entries.get(key)
+            if entry is None or entry[0] <= now:
+                break
+            result = await asyncio.shield(entry[1])
+            if result is not None:
+                return result, True
+            # El intento original falló: este lo ejecuta de nuevo
+
+        future = asyncio.get_running_loop().create_future()
+        self.entries[key] = (now + self.ttl, future)
+        self.entries.move_to_end(key)
+        result = None
+        try:
+            result = await operation()
+        finally:
+            succeeded = isinstance(result, dict) and result.get('success')
+            if not succeeded and self.entries.get(key, (None, None))[1] is future:
+                del self.entries[key]
+            future.set_result(result if succeeded else None)
+        return result, False
@@ -0,0 +1,156 @@
+"""
+Logging compartido de la API y los módulos de datos.
+
+Los registros salen como JSON (una línea por registro) a stderr. El hilo que llama solo encola
+el LogRecord: el armado del mensaje, el JSON y la escritura ocurren en el hilo de un
+QueueListener, así que un request nunca bloquea en I/O de logs. Con el nivel DEBUG apagado,
+logger.debug("...", args) descarta el registro antes de formatear nada.
+
+Variables de entorno:
+    LOG_LEVEL               DEBUG | INFO | WARNING | ERROR (por defecto INFO)
+    LOG_FORMAT              json | text (por defecto json)
+    LOG_DEBUG_SAMPLE_RATE   fracción de los registros DEBUG que se conservan (por defecto 1.0)
+"""
+
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import sys
+import threading
+from datetime import datetime, timezone
+
+LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO').upper()
+LOG_FORMAT = os.getenv('LOG_FORMAT', 'json').lower()
+LOG_DEBUG_SAMPLE_RATE = float(os.getenv('LOG_DEBUG_SAMPLE_RATE', '1.0'))
+ROOT_LOGGER = 'clutch'
+
+# Atributos propios de LogRecord: todo lo demás viene de extra={...} y va al JSON
+_RECORD_ATTRIBUTES = set(vars(logging.LogRecord('', 0, '', 0, '', None, None))) | {'message', 'asctime', 'taskName'}
+
+_configured = False
+_configure_lock = threading.Lock()
+_listener = None
+_queue_handler = None
+
+
+class JsonFormatter(logging.Formatter):
+    """Un objeto JSON por registro: ts, level, logger, msg, los campos de extra y la traza si hay excepción."""
+
+    def format(self, record):
+        payload = {
+            'ts': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'msg': record.getMessage(),
+        }
+        for key, value in record.__dict__.items():
+            if key not in _RECORD_ATTRIBUTES and not key.startswith('_'):
+                payload[key] = value
+        if record.exc_text:
+            payload['exc'] = record.exc_text
+        return json.dumps(payload, ensure_ascii=False, default=str)
+
+
+class StderrHandler(logging.StreamHandler):
+    """StreamHandler que resuelve sys.stderr en cada escritura (sigue a redirect_stderr y a los tests)."""
+
+    def __init__(self):
+        super().__init__(sys.stderr)
+
+    @property
+    def stream(self):
+        return sys.stderr
+
+    @stream.setter
+    def stream(self, value):
+        pass
+
+
+class DebugSamplingFilter(logging.Filter):
+    """Conserva solo una fracción de los registros DEBUG; los demás niveles pasan siempre."""
+
+    def __init__(self, rate):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record):
+        return record.levelno > logging.DEBUG or self.rate >= 1.0 or random.random() < self.rate
+
+
+class DeferredQueueHandler(logging.handlers.QueueHandler):
+    """
+    QueueHandler que no formatea en el hilo que llama (QueueHandler.prepare sí lo hace):
+    msg y args viajan tal cual y el listener arma el mensaje. Solo la traza de una excepción
+    se convierte a texto acá, mientras el frame todavía existe.
+    """
+
+    def prepare(self, record):
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+def configure_logging():
+    """Configura una sola vez por proceso el logger 'clutch' con la cola y el listener."""
+    global _configured, _listener, _queue_handler
+    with _configure_lock:
+        if _configured:
+            return
+        stream_handler = StderrHandler()
+        if LOG_FORMAT == 'text':
+            stream_handler.setFormatter(logging.Formatter('%(asctime)s %(levelname)s %(name)s: %(message)s'))
+        else:
+            stream_handler.setFormatter(JsonFormatter())
+        log_queue = queue.SimpleQueue()
+        queue_handler = DeferredQueueHandler(log_queue)
+        queue_handler.addFilter(DebugSamplingFilter(LOG_DEBUG_SAMPLE_RATE))
+
+        root = logging.getLogger(ROOT_LOGGER)
+        root.setLevel(getattr(logging, LOG_LEVEL, logging.INFO))
+        root.addHandler(queue_handler)
+        root.propagate = False
+
+        _listener = logging.handlers.QueueListener(log_queue, stream_handler)
+        _listener.start()
+        # Vacía la cola al salir para no perder los últimos registros
+        atexit.register(_stop_listener)
+        if hasattr(os, 'register_at_fork'):
+            os.register_at_fork(after_in_child=lambda: _restart_in_child(queue_handler, stream_handler))
+        _queue_handler = queue_handler
+        _configured = True
+
+
+def _stop_listener():
+    if _listener is not None:
+        _listener.stop()
+
+
+def _restart_in_child(queue_handler, stream_handler):
+    """
+    Un proceso hijo creado con fork (p. ej. el pool de audio_transcoder) hereda la cola pero no
+    el hilo del listener: se le da una cola y un listener propios.
+    """
+    global _listener
+    queue_handler.queue = queue.SimpleQueue()
+    _listener = logging.handlers.QueueListener(queue_handler.queue, stream_handler)
+    _listener.start()
+
+
+def add_filter(record_filter):
+    """
+    Agrega un filtro al handler de la cola. Corre en el hilo que loguea, antes de encolar: sirve
+    para copiar al registro datos del contexto actual (p. ej. trace_id en tracing.py).
+    """
+    configure_logging()
+    _queue_handler.addFilter(record_filter)
+
+
+def get_logger(name):
+    """Logger 'clutch.<name>' listo para usar: logger.info("mensaje %s", valor, extra={...})."""
+    configure_logging()
+    return logging.getLogger(f"{ROOT_LOGGER}.{name}")
@@ -1,14 +1,94 @@
-from fastapi import FastAPI, UploadFile, File, Form, HTTPException
+from fastapi import FastAPI, UploadFile, File, Form, Header, HTTPException, Request
+from fastapi.responses import FileResponse, JSONResponse, Response
 from fastapi.middleware.cors import CORSMiddleware
-from dynamodb_config import save_analysis_complete, get_analyses_by_user
+from pydantic import BaseModel
+from typing import Dict, List
+from contextlib import asynccontextmanager
+import admission
+import aws_clients
+import async_storage
+import dynamodb_config
+from dynamodb_config import get_analysis_by_id
 from s3_config import s3_manager
+import metrics
+import tracing
+import pdf_cache
+import audio_transcoder
+import idempotency
 import asyncio
 import json
+import os
+import re
+import time
+import uuid
+from log_config import get_logger
 
-app = FastAPI()
+logger = get_logger('api')
+
+tracing.set_service_name('clutch-api')
+
+# Métricas: operaciones de DynamoDB medidas y clientes de AWS instrumentados apenas se crean
+save_analysis_complete = metrics.track_storage('save_analysis_complete', dynamodb_config.save_analysis_complete)
+get_analyses_by_user = metrics.track_storage('get_analyses_by_user', dynamodb_config.get_analyses_by_user)
+save_analysis_complete_async = metrics.track_storage('save_analysis_complete', async_storage.save_analysis_complete)
+get_analyses_by_user_async = metrics.track_storage('get_analyses_by_user', async_storage.get_analyses_by_user)
+write_analysis_items = metrics.track_storage('write_analysis_items', dynamodb_config.write_analysis_items)
+write_analysis_items_async = metrics.track_storage('write_analysis_items', async_storage.write_analysis_items)
+get_existing_analyses = metrics.track_storage('get_existing_analyses', dynamodb_config.get_existing_analyses)
+get_existing_analyses_async = metrics.track_storage('get_existing_analyses', async_storage.get_existing_analyses)
+aws_clients.on_client_created(metrics.instrument_boto_client)
+# Trazas: un span por solicitud (hijo del header traceparent) y uno por llamada a AWS
+aws_clients.on_client_created(tracing.instrument_boto_client)
+# Resultados recientes por Idempotency-Key (por worker)
+idempotency_cache = idempotency.IdempotencyCache()
+
+
+async def warm_up(app):
+    """
+    Crea los clientes de AWS del worker y abre una conexión por servicio (DescribeTable y un HEAD
+    en el bucket), para que el primer request no pague credenciales, descubrimiento de endpoint ni TLS.
+    """
+    started = time.perf_counter()
+    dynamodb_enabled = bool(dynamodb_config.DYNAMODB_REGION and dynamodb_config.DYNAMODB_TABLE_NAME)
+    dynamodb_ok, s3_ok, async_ok = await asyncio.gather(
+        metrics.to_thread(dynamodb_config.init_dynamodb),
+        metrics.to_thread(s3_manager.warm_up),
+        async_storage.warm_up()
+    )
+    checks = {
+        'dynamodb': ('ok' if dynamodb_ok else 'error') if dynamodb_enabled else 'disabled',
+        's3': ('ok' if s3_ok else 'error') if s3_manager.available else 'disabled',
+        'aws_async': ('ok' if async_ok else 'error') if async_storage.active() else 'disabled',
+    }
+    app.state.readiness = {
+        'ready': 'error' not in checks.values(),
+        'checks': checks,
+        'warmup_seconds': round(time.perf_counter() - started, 3),
+    }
+    logger.info("Warm-up terminado", extra=app.state.readiness)
+
+
+@asynccontextmanager
+async def lifespan(app):
+    # /ready responde 503 hasta que termine el warm-up; el worker igual atiende mientras tanto
+    app.state.readiness = {'ready': False, 'checks': {}}
+    # Clientes de aiobotocore para los handlers de ingesta e historial (si está instalado)
+    await async_storage.start()
+    warm_up_task = asyncio.create_task(warm_up(app))
+    yield
+    warm_up_task.cancel()
+    await async_storage.close()
+    audio_transcoder.shutdown_transcode_pool()
+
+
+app = FastAPI(lifespan=lifespan)
 
 # Configurar límites para archivos grandes
-app.max_request_size = 50 * 1024 * 1024  # 50MB
+app.max_request_size = admission.INGEST_MAX_BODY_BYTES  # 50MB por defecto
+
+# Rechaza con 413/429/503 la ingesta que excede los límites antes de leer el cuerpo.
+# Queda dentro de CORS, métricas y trazas: los rechazos llevan headers CORS y se miden.
+app.add_middleware(admission.AdmissionMiddleware)
 
 # Permitir CORS para pruebas desde el origen del frontend
 app.add_middleware(
@@ -18,48 +98,209 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+app.add_middleware(metrics.MetricsMiddleware)
+app.add_middleware(tracing.TracingMiddleware)
 
 @app.get("/")
 def read_root():
     return {"status": "ok", "message": "Clutch API online"}
 
+@app.get("/ready")
+def ready():
+    """Listo para recibir tráfico: warm-up terminado y sin errores en los servicios configurados."""
+    readiness = getattr(app.state, 'readiness', {'ready': False, 'checks': {}})
+    return JSONResponse(readiness, status_code=200 if readiness['ready'] else 503)
+
+@app.get("/metrics")
+def get_metrics():
+    body, content_type = metrics.render_metrics()
+    return Response(content=body, media_type=content_type)
+
+async def head_audio(key):
+    if async_storage.active():
+        return await async_storage.head_audio(key)
+    return await metrics.to_thread(s3_manager.head_audio, key)
+
+async def object_exists(key):
+    """HEAD de una key; 503 si S3 no respondió (throttling, permisos, red) en lugar de darla por ausente."""
+    try:
+        if async_storage.active():
+            return await async_storage.object_exists(key)
+        return await metrics.to_thread(s3_manager.object_exists, key)
+    except Exception:
+        raise HTTPException(status_code=503, detail="No se pudo consultar S3, reintentar más tarde")
+
+async def find_existing_audio(data, user_id, extension):
+    try:
+        if async_storage.active():
+            return await async_storage.find_existing_audio(data, user_id, extension)
+        return await metrics.to_thread(s3_manager.find_existing_audio, data, user_id, extension)
+    except Exception:
+        raise HTTPException(status_code=503, detail="No se pudo consultar S3, reintentar más tarde")
+
 @app.post("/guardar-analisis/")
 async def guardar_analisis(
+    response: Response,
     user_id: str = Form(...),
     analysis_text: str = Form(...),
     transcription: str = Form(...),
     tts_preferences: str = Form(...),
     user_personality_test: str = Form(...),
     player_audio: UploadFile = File(None),
-    coach_audio: UploadFile = File(None)
+    coach_audio: UploadFile = File(None),
+    analysis_id: str = Form(None),
+    player_audio_key: str = Form(None),
+    coach_audio_key: str = Form(None),
+    structured_analysis: str = Form(None),
+    username: str = Form(None),
+    fecha_analisis: str = Form(None),
+    wpm: float = Form(None),
+    wpm_by_segment: str = Form(None),
+    loudness_by_second: str = Form(None),
+    idempotency_key: str = Header(None, alias='Idempotency-Key'),
+    x_user_id: str = Header(None, alias='X-User-Id')
 ):
-    print(">>>>> [MAIN] Request received in /guardar-analisis/")
-    print(f"       user_id: {user_id}")
-    print(f"       tts_preferences (raw): {tts_preferences}")
-    print(f"       user_personality_test (raw): {user_personality_test}")
+    logger.info("Request received in /guardar-analisis/", extra={'user_id': user_id, 'analysis_id': analysis_id})
+    if not user_matches_header(x_user_id, user_id):
+        raise HTTPException(status_code=400, detail="user_id no coincide con el header X-User-Id")
+    request_span = tracing.current_span()
+    if request_span is not None:
+        request_span.set_attribute('clutch.user_id', user_id)
+        request_span.set_attribute('clutch.analysis_id', analysis_id)
+    logger.debug("tts_preferences (raw): %s | user_personality_test (raw): %s", tts_preferences, user_personality_test)
 
     # Parsear tts_preferences
     try:
         tts_prefs = json.loads(tts_preferences) if tts_preferences else {}
     except Exception as e:
-        print(f"[ERROR] No se pudo parsear tts_preferences: {e}")
+        logger.warning("No se pudo parsear tts_preferences: %s", e, extra={'user_id': user_id})
         tts_prefs = {}
 
     # Parsear user_personality_test
     try:
         personality_test = json.loads(user_personality_test) if user_personality_test else []
     except Exception as e:
-        print(f"[ERROR] No se pudo parsear user_personality_test: {e}")
+        logger.warning("No se pudo parsear user_personality_test: %s", e, extra={'user_id': user_id})
         personality_test = []
+    report_metrics = parse_report_metrics(wpm, wpm_by_segment, loudness_by_second)
+
+    if idempotency_key:
+        if len(idempotency_key) > idempotency.IDEMPOTENCY_KEY_MAX_LENGTH:
+            raise HTTPException(status_code=400, detail="Idempotency-Key demasiado larga")
+        # Todos los reintentos con la misma clave escriben (una sola vez) el mismo analysis_id
+        analysis_id = idempotency.analysis_id_for(user_id, idempotency_key)
+        if request_span is not None:
+            request_span.set_attribute('clutch.analysis_id', analysis_id)
+
+    async def store():
+        return await store_analysis(
+            user_id, analysis_text, transcription, tts_prefs, personality_test, player_audio, coach_audio,
+            analysis_id, player_audio_key, coach_audio_key, structured_analysis, username, fecha_analisis,
+            report_metrics=report_metrics,
+            # Un analysis_id que viene de la solicitud nunca pisa un análisis ya guardado
+            idempotent=bool(analysis_id)
+        )
+
+    if idempotency_key:
+        result, replayed = await idempotency_cache.run(analysis_id, store)
+        if replayed:
+            response.headers['Idempotent-Replayed'] = 'true'
+            result = dict(result, duplicate=True)
+    else:
+        result = await store()
+
+    logger.info("Analysis saved", extra={'user_id': user_id, 'analysis_id': result.get('analysis_id'),
+                                         'success': result.get('success'), 'duplicate': result.get('duplicate', False)})
+    return result
+
+async def store_analysis(user_id, analysis_text, transcription, tts_prefs, personality_test, player_audio, coach_audio,
+                         analysis_id, player_audio_key, coach_audio_key, structured_analysis, username, fecha_analisis,
+                         report_metrics=None, idempotent=False):
+    """Verifica/deduplica/transcodifica los audios y guarda el análisis (cuerpo de /guardar-analisis/)."""
+    save_kwargs = await prepare_analysis(
+        user_id, analysis_text, transcription, tts_prefs, personality_test, player_audio, coach_audio,
+        analysis_id, player_audio_key, coach_audio_key, structured_analysis, username, fecha_analisis,
+        report_metrics
+    )
+    save_kwargs['idempotent'] = idempotent
+    # Guardar en DynamoDB: con la capa asíncrona en el event loop, si no en un hilo
+    if async_storage.active():
+        result = await save_analysis_complete_async(**save_kwargs)
+    else:
+        result = await metrics.to_thread(save_analysis_complete, **save_kwargs)
+    if result.get('conflict'):
+        raise HTTPException(status_code=409, detail=result['error'])
+
+    # Echo para debug
+    result["echo_tts_preferences"] = tts_prefs
+    result["echo_user_personality_test"] = personality_test
+
+    return result
+
+async def prepare_analysis(user_id, analysis_text, transcription, tts_prefs, personality_test, player_audio, coach_audio,
+                           analysis_id, player_audio_key, coach_audio_key, structured_analysis, username, fecha_analisis,
+                           report_metrics=None):
+    """
+    Verifica las keys de audio, deduplica y transcodifica los audios recibidos. Devuelve los
+    argumentos de save_analysis_complete (y de prepare_analysis_item). HTTPException si una key no es válida.
+    report_metrics es el resultado de parse_report_metrics.
+    """
+    # Audios subidos directamente a S3 vía /upload-slots/: verificar con HEAD
+    for key in (player_audio_key, coach_audio_key):
+        if not key:
+            continue
+        if not key.startswith(f"audios/{user_id}/"):
+            raise HTTPException(status_code=400, detail=f"Key de audio inválida para el usuario: {key}")
+        if not await head_audio(key):
+            raise HTTPException(status_code=400, detail=f"El audio no existe en S3: {key}")
 
     player_audio_bytes = await player_audio.read() if player_audio else None
     coach_audio_bytes = await coach_audio.read() if coach_audio else None
-    print(f">>>>> [MAIN] Player audio read: {len(player_audio_bytes) if player_audio_bytes else 'No'} bytes")
-    print(f">>>>> [MAIN] Coach audio read: {len(coach_audio_bytes) if coach_audio_bytes else 'No'} bytes")
+    metrics.observe_upload('player_audio', len(player_audio_bytes) if player_audio_bytes else 0)
+    metrics.observe_upload('coach_audio', len(coach_audio_bytes) if coach_audio_bytes else 0)
+    logger.debug("Audio read: player=%s bytes, coach=%s bytes",
+                 len(player_audio_bytes) if player_audio_bytes else 0, len(coach_audio_bytes) if coach_audio_bytes else 0)
+
+    # Deduplicación por contenido: si el audio ya está en S3 se referencia la key existente
+    # y no se transcodifica ni se vuelve a subir. El nombre es el sha256 del audio recibido (la
+    # fuente), también cuando se guarda transcodificado; si no existe, se sube sin repetir el HEAD.
+    target_format = audio_transcoder.OPUS_EXTENSION if audio_transcoder.TRANSCODE_ENABLED else "mp3"
+    player_audio_filename = None
+    coach_audio_filename = None
+    if s3_manager.available and player_audio_bytes and not player_audio_key:
+        player_audio_filename, exists = await find_existing_audio(player_audio_bytes, user_id, target_format)
+        if exists:
+            player_audio_key, player_audio_bytes = s3_manager.audio_key(user_id, player_audio_filename), None
+            logger.info("Player audio already stored, reusing %s", player_audio_key)
+    if s3_manager.available and coach_audio_bytes and not coach_audio_key:
+        coach_audio_filename, exists = await find_existing_audio(coach_audio_bytes, user_id, target_format)
+        if exists:
+            coach_audio_key, coach_audio_bytes = s3_manager.audio_key(user_id, coach_audio_filename), None
+            logger.info("Coach audio already stored, reusing %s", coach_audio_key)
+
+    # Transcodificación opcional a Opus mono (en un pool de procesos, fuera del event loop)
+    audio_format = "mp3"
+    player_original_bytes = None
+    coach_original_bytes = None
+    if audio_transcoder.TRANSCODE_ENABLED and (player_audio_bytes or coach_audio_bytes):
+        with tracing.span('transcode_opus'):
+            player_opus, coach_opus = await asyncio.gather(
+                audio_transcoder.transcode_to_opus_async(player_audio_bytes),
+                audio_transcoder.transcode_to_opus_async(coach_audio_bytes)
+            )
+        # Solo se usa Opus si todos los audios recibidos se transcodificaron bien
+        if (player_opus or not player_audio_bytes) and (coach_opus or not coach_audio_bytes):
+            if audio_transcoder.KEEP_ORIGINAL:
+                player_original_bytes, coach_original_bytes = player_audio_bytes, coach_audio_bytes
+            player_audio_bytes, coach_audio_bytes = player_opus, coach_opus
+            audio_format = audio_transcoder.OPUS_EXTENSION
+            logger.debug("Audio transcoded to Opus: player=%s bytes, coach=%s bytes",
+                         len(player_opus) if player_opus else 0, len(coach_opus) if coach_opus else 0)
+    if audio_format != target_format:
+        # Sin transcodificar: el nombre se calcula sobre el MP3 al guardarlo
+        player_audio_filename = coach_audio_filename = None
 
-    # Guardar en DynamoDB
-    result = await asyncio.to_thread(
-        save_analysis_complete,
+    return dict(
         user_id=user_id,
         analysis_text=analysis_text,
         player_audio_data=player_audio_bytes,
@@ -67,14 +308,248 @@ async def guardar_analisis(
         base_filename=player_audio.filename if player_audio else f"analysis_{user_id}_{int(__import__('time').time())}.mp3",
         transcription=transcription,
         tts_preferences=tts_prefs,
-        user_personality_test=personality_test
+        user_personality_test=personality_test,
+        player_audio_key=player_audio_key,
+        coach_audio_key=coach_audio_key,
+        analysis_id=analysis_id,
+        audio_format=audio_format,
+        player_original_audio_data=player_original_bytes,
+        coach_original_audio_data=coach_original_bytes,
+        player_audio_filename=player_audio_filename,
+        coach_audio_filename=coach_audio_filename,
+        structured_analysis=structured_analysis,
+        username=username,
+        fecha_analisis=fecha_analisis,
+        **(report_metrics or {})
     )
 
-    # Echo para debug
-    result["echo_tts_preferences"] = tts_prefs
-    result["echo_user_personality_test"] = personality_test
+def user_matches_header(header_user_id, user_id):
+    """
+    AdmissionMiddleware limita la ingesta por el header X-User-Id: si viene, tiene que ser el
+    user_id que se guarda, o cambiarlo en cada solicitud evitaría el límite por usuario.
+    """
+    return not header_user_id or header_user_id == user_id
+
+def parse_report_metrics(wpm, wpm_by_segment, loudness_by_second):
+    """
+    Métricas de audio del reporte PDF recibidas con el análisis (las series como JSON o ya
+    parseadas). Devuelve los argumentos wpm/wmp_by_segment/loudness_by_second de
+    save_analysis_complete; igual que tts_preferences, un valor que no se puede parsear queda vacío.
+    """
+    def parse(value, kind):
+        try:
+            value = json.loads(value) if isinstance(value, str) else value
+        except ValueError:
+            return None
+        return value if isinstance(value, kind) else None
 
-    print(">>>>> [MAIN] Analysis saved, returning result.")
+    segments = parse(wpm_by_segment, dict) or {}
+    loudness = parse(loudness_by_second, list) or []
+    if not all(isinstance(value, (int, float)) and not isinstance(value, bool) for value in loudness):
+        loudness = []
+    try:
+        wpm = float(wpm) if wpm is not None else 0.0
+    except (TypeError, ValueError):
+        wpm = 0.0
+    return {'wpm': wpm, 'wmp_by_segment': segments, 'loudness_by_second': loudness}
+
+# /guardar-analisis/batch: análisis por solicitud y análisis preparándose a la vez (HEAD,
+# deduplicación, transcodificación y subida a S3)
+INGEST_BATCH_MAX_ITEMS = int(os.getenv('INGEST_BATCH_MAX_ITEMS', '500'))
+INGEST_BATCH_CONCURRENCY = max(1, int(os.getenv('INGEST_BATCH_CONCURRENCY', '8')))
+BATCH_REQUIRED_FIELDS = ('user_id', 'analysis_text', 'transcription')
+
+@app.post("/guardar-analisis/batch")
+async def guardar_analisis_batch(request: Request):
+    """
+    Guarda muchos análisis en una sola solicitud (backfills, cierre de un torneo).
+
+    El cuerpo es un manifiesto NDJSON: una línea JSON por análisis con los campos de
+    /guardar-analisis/ (tts_preferences y user_personality_test como objeto/lista o texto JSON)
+    y un idempotency_key opcional, del que sale su analysis_id (no se acepta uno elegido por el
+    cliente: BatchWriteItem no admite condiciones y pisaría un análisis existente). Los audios van por key (subidos antes con /upload-slots/) o,
+    con multipart/form-data, como partes del mismo cuerpo: el manifiesto va en la parte
+    'manifest' y player_audio/coach_audio de cada línea nombran la parte de su audio (cada parte
+    se usa en una sola línea).
+
+    Los análisis se preparan y sus audios se suben de a INGEST_BATCH_CONCURRENCY; los items se
+    escriben con BatchWriteItem de a 25. Responde siempre con un resultado por línea, en orden:
+    un análisis que falla no impide guardar los demás.
+    """
+    parts = {}
+    if request.headers.get('content-type', '').startswith('multipart/form-data'):
+        # Starlette limita cada campo de texto a 1 MiB: el manifiesto puede llegar al máximo del cuerpo
+        form = await request.form(max_files=2 * INGEST_BATCH_MAX_ITEMS, max_part_size=admission.INGEST_MAX_BODY_BYTES)
+        manifest = form.get('manifest')
+        if manifest is not None and not isinstance(manifest, str):
+            manifest = await manifest.read()
+        parts = {name: value for name, value in form.multi_items() if name != 'manifest' and not isinstance(value, str)}
+    else:
+        manifest = await request.body()
+    try:
+        if isinstance(manifest, bytes):
+            manifest = manifest.decode('utf-8')
+    except UnicodeDecodeError:
+        raise HTTPException(status_code=400, detail="El manifiesto debe estar en UTF-8")
+    lines = [line for line in (manifest or '').splitlines() if line.strip()]
+    if not lines:
+        raise HTTPException(status_code=400, detail="El manifiesto está vacío")
+    if len(lines) > INGEST_BATCH_MAX_ITEMS:
+        raise HTTPException(status_code=400, detail=f"El lote supera el máximo de {INGEST_BATCH_MAX_ITEMS} análisis")
+    request_span = tracing.current_span()
+    if request_span is not None:
+        request_span.set_attribute('clutch.batch_size', len(lines))
+
+    results = [None] * len(lines)
+    staged = {}  # índice -> (argumentos de prepare_analysis, idempotente)
+    seen_ids = set()
+    # Cada parte de audio se lee una sola vez (hasta EOF): una segunda línea que la nombra se guardaría sin audio
+    used_parts = set()
+    for index, line in enumerate(lines):
+        try:
+            args, idempotent = parse_batch_entry(line, parts)
+        except ValueError as e:
+            results[index] = batch_result(index, error=str(e))
+            continue
+        if not user_matches_header(request.headers.get('x-user-id'), args['user_id']):
+            results[index] = batch_result(index, error="user_id no coincide con el header X-User-Id")
+            continue
+        if args['analysis_id'] in seen_ids:
+            results[index] = batch_result(index, error="analysis_id repetido en el lote")
+            continue
+        line_parts = [id(args[role]) for role in ('player_audio', 'coach_audio') if args[role] is not None]
+        if len(set(line_parts)) < len(line_parts) or used_parts.intersection(line_parts):
+            results[index] = batch_result(index, error="Una parte de audio solo puede usarse en una línea del lote")
+            continue
+        used_parts.update(line_parts)
+        if args['analysis_id']:
+            seen_ids.add(args['analysis_id'])
+        staged[index] = (args, idempotent)
+
+    # BatchWriteItem no admite condiciones: los reintentos idempotentes que ya están guardados
+    # se resuelven antes, con el resultado original y sin volver a subir los audios
+    idempotent_ids = [args['analysis_id'] for args, idempotent in staged.values() if idempotent]
+    if idempotent_ids:
+        if async_storage.active():
+            existing = await get_existing_analyses_async(idempotent_ids)
+        else:
+            existing = await metrics.to_thread(get_existing_analyses, idempotent_ids)
+        for index, (args, idempotent) in list(staged.items()):
+            if not idempotent:
+                continue
+            if not existing['success']:
+                results[index] = batch_result(index, error=existing['error'])
+                del staged[index]
+            elif args['analysis_id'] in existing['data']:
+                item = existing['data'][args['analysis_id']]
+                results[index] = batch_result(index, item, duplicate=True)
+                del staged[index]
+
+    limit = asyncio.Semaphore(INGEST_BATCH_CONCURRENCY)
+
+    async def stage(index, args):
+        async with limit:
+            try:
+                save_kwargs = await prepare_analysis(**args)
+                if async_storage.active():
+                    return await async_storage.prepare_analysis_item(**save_kwargs)
+                return await metrics.to_thread(dynamodb_config.prepare_analysis_item, **save_kwargs)
+            except HTTPException as e:
+                results[index] = batch_result(index, error=e.detail)
+            except Exception as e:
+                logger.error("Error preparando un análisis del lote: %s", e, extra={'user_id': args['user_id'], 'index': index})
+                results[index] = batch_result(index, error=f"Error preparando el análisis: {e}")
+
+    indexes = list(staged)
+    items = await asyncio.gather(*(stage(index, staged[index][0]) for index in indexes))
+    ready = [(index, item) for index, item in zip(indexes, items) if item is not None]
+    if ready:
+        if async_storage.active():
+            written = await write_analysis_items_async([item for _, item in ready])
+        else:
+            written = await metrics.to_thread(write_analysis_items, [item for _, item in ready])
+        for (index, item), error in zip(ready, written['errors']):
+            results[index] = batch_result(index, item, error=error)
+
+    saved = sum(1 for result in results if result['success'])
+    logger.info("Batch saved", extra={'items': len(results), 'saved': saved, 'failed': len(results) - saved})
+    return {'success': saved == len(results), 'total': len(results), 'saved': saved,
+            'failed': len(results) - saved, 'results': results}
+
+def parse_batch_entry(line, parts):
+    """
+    Una línea del manifiesto de /guardar-analisis/batch. Devuelve (argumentos de prepare_analysis,
+    idempotente); ValueError si la línea no es válida.
+    """
+    try:
+        entry = json.loads(line)
+    except ValueError:
+        raise ValueError("La línea no es JSON válido")
+    if not isinstance(entry, dict):
+        raise ValueError("La línea debe ser un objeto JSON")
+    missing = [field for field in BATCH_REQUIRED_FIELDS if not isinstance(entry.get(field), str)]
+    if missing:
+        raise ValueError(f"Faltan campos: {', '.join(missing)}")
+    audio = {}
+    for role in ('player_audio', 'coach_audio'):
+        part_name = entry.get(role)
+        if part_name and part_name not in parts:
+            raise ValueError(f"No se recibió la parte '{part_name}' de {role}")
+        audio[role] = parts.get(part_name) if part_name else None
+
+    # Mismo criterio que /guardar-analisis/: un valor que no se puede parsear queda vacío
+    tts_prefs = entry.get('tts_preferences') or {}
+    personality_test = entry.get('user_personality_test') or []
+    try:
+        tts_prefs = json.loads(tts_prefs) if isinstance(tts_prefs, str) else tts_prefs
+    except ValueError:
+        tts_prefs = {}
+    try:
+        personality_test = json.loads(personality_test) if isinstance(personality_test, str) else personality_test
+    except ValueError:
+        personality_test = []
+
+    user_id = entry['user_id']
+    analysis_id = None
+    idempotency_key = entry.get('idempotency_key')
+    if idempotency_key:
+        if len(str(idempotency_key)) > idempotency.IDEMPOTENCY_KEY_MAX_LENGTH:
+            raise ValueError("idempotency_key demasiado larga")
+        analysis_id = idempotency.analysis_id_for(user_id, idempotency_key)
+    # El lote se escribe sin condición: solo los ids derivados del idempotency_key (que se
+    # verifican antes de escribir) o generados acá son seguros
+    if entry.get('analysis_id') and entry['analysis_id'] != analysis_id:
+        raise ValueError("analysis_id no se acepta en el lote: usar idempotency_key")
+    args = dict(
+        user_id=user_id,
+        analysis_text=entry['analysis_text'],
+        transcription=entry['transcription'],
+        tts_prefs=tts_prefs,
+        personality_test=personality_test,
+        player_audio=audio['player_audio'],
+        coach_audio=audio['coach_audio'],
+        analysis_id=analysis_id,
+        player_audio_key=entry.get('player_audio_key'),
+        coach_audio_key=entry.get('coach_audio_key'),
+        structured_analysis=entry.get('structured_analysis'),
+        username=entry.get('username'),
+        fecha_analisis=entry.get('fecha_analisis'),
+        report_metrics=parse_report_metrics(entry.get('wpm'), entry.get('wpm_by_segment'), entry.get('loudness_by_second')),
+    )
+    return args, bool(idempotency_key)
+
+def batch_result(index, item=None, error='', duplicate=False):
+    """Resultado de una línea del lote, con los campos de la respuesta de /guardar-analisis/."""
+    result = {
+        'index': index,
+        'success': item is not None and not error,
+        'analysis_id': item['id'] if item is not None else None,
+        'player_s3_url': (item or {}).get('player_audio_url') or '',
+        'coach_s3_url': (item or {}).get('coach_audio_url') or '',
+        'error': error,
+    }
+    if duplicate:
+        result['duplicate'] = True
     return result
 
 @app.get("/analisis/{user_id}")
@@ -82,21 +557,132 @@ async def obtener_analisis_por_usuario(user_id: str):
     """
     Obtiene todos los análisis para un user_id específico.
     """
-    print(f">>>>> [MAIN] Request received in /analisis/{user_id}")
     
-    # Ejecuta la función síncrona de DynamoDB en un hilo separado
-    result = await asyncio.to_thread(get_analyses_by_user, user_id)
+    if async_storage.active():
+        result = await get_analyses_by_user_async(user_id)
+    else:
+        # Sin la capa asíncrona, la función síncrona de DynamoDB corre en un hilo separado
+        result = await metrics.to_thread(get_analyses_by_user, user_id)
     
     if not result['success']:
         # Si hubo un error en la capa de datos, devuelve un error HTTP
         raise HTTPException(status_code=500, detail=result.get('error', 'Error interno del servidor.'))
         
-    print(f">>>>> [MAIN] Found {len(result.get('data', []))} analyses for user {user_id}.")
+    logger.debug("Found %d analyses for user %s", len(result.get('data', [])), user_id)
     return result
 
+@app.get("/reports/{analysis_id}.pdf")
+async def get_report_pdf(analysis_id: str):
+    """
+    Devuelve el reporte PDF de un análisis. Se renderiza una sola vez y luego se sirve desde pdf_cache.
+    """
+    result = await metrics.to_thread(get_analysis_by_id, analysis_id)
+    if not result['success']:
+        raise HTTPException(status_code=503, detail=result.get('error', 'Error interno del servidor.'))
+    item = result.get('data')
+    if not item:
+        raise HTTPException(status_code=404, detail="Análisis no encontrado")
+
+    try:
+        pdf_path = await metrics.to_thread(
+            pdf_cache.ensure_cached_pdf,
+            item.get('analysis_text', ''),
+            item.get('structured_analysis', ''),
+            item.get('username') or 'Usuario Desconocido',
+            item.get('user_id', 'ID_Desconocido'),
+            item.get('fecha_analisis') or item.get('timestamp', ''),
+            dynamodb_config.report_metrics(item)
+        )
+    except Exception:
+        logger.exception("No se pudo generar el PDF de %s", analysis_id)
+        raise HTTPException(status_code=500, detail="No se pudo generar el reporte PDF")
+    return FileResponse(pdf_path, media_type="application/pdf", filename=f"{analysis_id}.pdf")
+
 @app.get("/get-audio-url/")
-async def get_audio_url(user_id: str, filename: str):
-    url = s3_manager.generate_presigned_url(user_id, filename)
+async def get_audio_url(user_id: str, filename: str, expires_in: int = 300):
+    url = s3_manager.generate_presigned_url(user_id, filename, expires_in)
     if not url:
         raise HTTPException(status_code=404, detail="Audio not found or error generating URL")
     return {"url": url}
+
+# Tipos de audio aceptados en las subidas directas y su extensión
+UPLOAD_CONTENT_TYPES = {"audio/mpeg": "mp3", "audio/ogg": "ogg"}
+SHA256_HEX = re.compile(r'[0-9a-f]{64}')
+
+class UploadSlotsRequest(BaseModel):
+    user_id: str
+    files: List[str] = ["player", "coach"]
+    content_type: str = "audio/mpeg"
+    # sha256 (hex) de cada audio: la key queda direccionada por contenido, como en la API
+    sha256: Dict[str, str] = {}
+
+@app.post("/upload-slots/")
+async def upload_slots(request: UploadSlotsRequest):
+    """
+    Devuelve políticas de POST prefirmado para subir los audios directamente a S3,
+    sin pasar por la API. Las keys resultantes se envían luego a /guardar-analisis/.
+    Con el sha256 de un audio la key es audios/{user_id}/{sha256}.{ext}; si ese objeto ya está en
+    S3 el slot viene con exists=True y sin política, y el cliente no lo vuelve a subir. El hash lo
+    declara el cliente: un hash falso solo afecta al prefijo de su propio usuario.
+    """
+    if not s3_manager.available:
+        raise HTTPException(status_code=503, detail="S3 no está disponible")
+    invalid = [name for name in request.files if name not in ("player", "coach")]
+    if invalid:
+        raise HTTPException(status_code=400, detail=f"Tipos de audio no soportados: {invalid}")
+    extension = UPLOAD_CONTENT_TYPES.get(request.content_type)
+    if not extension:
+        raise HTTPException(status_code=400, detail=f"Content-Type no soportado: {request.content_type}")
+    invalid = [name for name, digest in request.sha256.items() if not SHA256_HEX.fullmatch(digest)]
+    if invalid:
+        raise HTTPException(status_code=400, detail=f"sha256 inválido para: {invalid}")
+    analysis_id = str(uuid.uuid4())
+    slots = {}
+    for name in request.files:
+        digest = request.sha256.get(name)
+        if digest:
+            # Mismo nombre que s3_manager.content_filename: un audio repetido no se vuelve a subir
+            filename = f"{digest}.{extension}"
+            key = s3_manager.audio_key(request.user_id, filename)
+            if await object_exists(key):
+                slots[name] = {'key': key, 'exists': True}
+                continue
+        else:
+            filename = f"{name}_{analysis_id}.{extension}"
+        slot = s3_manager.generate_upload_slot(request.user_id, filename, request.content_type)
+        if not slot:
+            raise HTTPException(status_code=500, detail="Error generando la política de subida")
+        slots[name] = slot
+    return {"analysis_id": analysis_id, "slots": slots}
+
+# Máximo de archivos por solicitud en /get-audio-urls/
+MAX_PRESIGN_BATCH = 200
+
+class AudioRef(BaseModel):
+    user_id: str
+    filename: str
+
+class AudioUrlsRequest(BaseModel):
+    files: List[AudioRef]
+    expires_in: int = 300
+
+@app.post("/get-audio-urls/")
+async def get_audio_urls(request: AudioUrlsRequest):
+    """
+    Genera URLs prefirmadas para muchos audios en una sola solicitud.
+    Devuelve los resultados en el mismo orden que 'files'.
+    """
+    if len(request.files) > MAX_PRESIGN_BATCH:
+        raise HTTPException(status_code=413, detail=f"Máximo {MAX_PRESIGN_BATCH} archivos por solicitud")
+    if not s3_manager.available:
+        raise HTTPException(status_code=503, detail="S3 no está disponible")
+    urls = s3_manager.generate_presigned_urls(
+        [(f.user_id, f.filename) for f in request.files],
+        request.expires_in
+    )
+    return {
+        "urls": [
+            {"user_id": f.user_id, "filename": f.filename, "url": url or None}
+            for f, url in zip(request.files, urls)
+        ]
+    }
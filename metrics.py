@@ -0,0 +1,163 @@
+"""
+Métricas Prometheus de la API (GET /metrics).
+
+Bajo gunicorn cada worker es un proceso distinto: con PROMETHEUS_MULTIPROC_DIR definido
+(lo hace gunicorn.conf.py) prometheus_client escribe los valores en archivos mmap compartidos
+y /metrics los agrega entre todos los workers. Sin esa variable se usa el registro normal del
+proceso (p. ej. uvicorn con un solo worker).
+
+Todo lo que se mide por solicitud es un incremento u observación en memoria compartida, sin
+locks entre procesos ni llamadas de red.
+"""
+
+import asyncio
+import functools
+import inspect
+import os
+import time
+
+from prometheus_client import CONTENT_TYPE_LATEST, CollectorRegistry, Counter, Gauge, Histogram, generate_latest
+from prometheus_client import REGISTRY, multiprocess
+
+MULTIPROCESS = bool(os.getenv('PROMETHEUS_MULTIPROC_DIR'))
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+UPLOAD_BUCKETS = tuple(64 * 1024 * 4 ** i for i in range(7))  # 64 KiB .. 256 MiB
+
+HTTP_REQUESTS = Counter('clutch_http_requests_total', 'Solicitudes HTTP atendidas', ['method', 'route', 'status'])
+HTTP_LATENCY = Histogram('clutch_http_request_duration_seconds', 'Duración de las solicitudes HTTP', ['method', 'route'], buckets=LATENCY_BUCKETS)
+HTTP_IN_FLIGHT = Gauge('clutch_http_requests_in_flight', 'Solicitudes HTTP en curso', multiprocess_mode='livesum')
+UPLOAD_BYTES = Histogram('clutch_upload_bytes', 'Tamaño de los audios recibidos', ['field'], buckets=UPLOAD_BUCKETS)
+AWS_LATENCY = Histogram('clutch_aws_call_duration_seconds', 'Duración de las llamadas a AWS (incluye reintentos de botocore)', ['service', 'operation'], buckets=LATENCY_BUCKETS)
+AWS_ERRORS = Counter('clutch_aws_call_errors_total', 'Llamadas a AWS que terminaron en error', ['service', 'operation'])
+STORAGE_LATENCY = Histogram('clutch_storage_operation_duration_seconds', 'Duración de las operaciones de dynamodb_config', ['operation'], buckets=LATENCY_BUCKETS)
+STORAGE_ERRORS = Counter('clutch_storage_operation_errors_total', 'Operaciones de dynamodb_config sin éxito', ['operation'])
+THREADPOOL_QUEUED = Gauge('clutch_threadpool_queued', 'Tareas de to_thread esperando un hilo libre', multiprocess_mode='livesum')
+THREADPOOL_ACTIVE = Gauge('clutch_threadpool_active', 'Tareas de to_thread ejecutándose', multiprocess_mode='livesum')
+ADMISSION_REJECTED = Counter('clutch_admission_rejected_total', 'Solicitudes de ingesta rechazadas antes de leer el cuerpo', ['reason'])
+INGEST_INFLIGHT_BYTES = Gauge('clutch_ingest_inflight_bytes', 'Bytes de cuerpo de las solicitudes de ingesta en curso', multiprocess_mode='livesum')
+
+
+class MetricsMiddleware:
+    """Middleware ASGI: cuenta solicitudes y mide su latencia por ruta (la plantilla, no la URL)."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+        status = 500
+        started = time.perf_counter()
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message['type'] == 'http.response.start':
+                status = message['status']
+            await send(message)
+
+        HTTP_IN_FLIGHT.inc()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            HTTP_IN_FLIGHT.dec()
+            route = scope.get('route')
+            route_path = getattr(route, 'path', 'unmatched')
+            HTTP_LATENCY.labels(scope['method'], route_path).observe(time.perf_counter() - started)
+            HTTP_REQUESTS.labels(scope['method'], route_path, str(status)).inc()
+
+
+def render_metrics():
+    """Devuelve (cuerpo, content-type) con las métricas de todos los workers."""
+    if MULTIPROCESS:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return generate_latest(registry), CONTENT_TYPE_LATEST
+
+
+async def to_thread(func, /, *args, **kwargs):
+    """asyncio.to_thread que además registra cuántas tareas esperan un hilo y cuántas corren."""
+    THREADPOOL_QUEUED.inc()
+
+    def run():
+        THREADPOOL_QUEUED.dec()
+        THREADPOOL_ACTIVE.inc()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            THREADPOOL_ACTIVE.dec()
+
+    return await asyncio.to_thread(run)
+
+
+def track_storage(operation, func):
+    """
+    Envuelve una función de dynamodb_config (o una corutina de async_storage) que devuelve
+    {'success': ...} midiendo duración y errores.
+    """
+    def record(started, result):
+        STORAGE_LATENCY.labels(operation).observe(time.perf_counter() - started)
+        if result is None or not result.get('success'):
+            STORAGE_ERRORS.labels(operation).inc()
+        return result
+
+    if inspect.iscoroutinefunction(func):
+        @functools.wraps(func)
+        async def async_wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            result = None
+            try:
+                result = await func(*args, **kwargs)
+            finally:
+                record(started, result)
+            return result
+        return async_wrapper
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        started = time.perf_counter()
+        result = None
+        try:
+            result = func(*args, **kwargs)
+        finally:
+            record(started, result)
+        return result
+    return wrapper
+
+
+def observe_upload(field, size):
+    if size:
+        UPLOAD_BYTES.labels(field).observe(size)
+
+
+def _before_call(model, context, **kwargs):
+    context['clutch_started'] = time.perf_counter()
+    # after-call-error no recibe el modelo de la operación: se guarda acá
+    context['clutch_operation'] = (model.service_model.service_name, model.name)
+
+
+def _after_call(context, http_response=None, parsed=None, exception=None, **kwargs):
+    started = context.pop('clutch_started', None)
+    operation = context.pop('clutch_operation', None)
+    if operation is None:
+        return
+    if started is not None:
+        AWS_LATENCY.labels(*operation).observe(time.perf_counter() - started)
+    status = getattr(http_response, 'status_code', 200) if exception is None else None
+    # Un 404 (p. ej. HEAD de deduplicación sobre una key nueva) es una respuesta, no una falla
+    if exception is not None or (status is not None and status >= 400 and status != 404):
+        AWS_ERRORS.labels(*operation).inc()
+
+
+def instrument_boto_client(client):
+    """Registra hooks de botocore en un cliente para medir latencia y errores de cada operación."""
+    if client is None or getattr(client, '_clutch_instrumented', False):
+        return
+    events = client.meta.events
+    events.register('before-call.*.*', _before_call)
+    events.register('after-call.*.*', _after_call)
+    events.register('after-call-error.*.*', _after_call)
+    client._clutch_instrumented = True
@@ -0,0 +1,176 @@
+"""
+Cache de reportes PDF renderizados.
+
+Reenviar un reporte (el usuario lo pide de nuevo, falló el DM de Discord, descarga desde
+el dashboard) volvía a renderizarlo desde cero. Los PDFs se indexan por un hash del
+contenido del análisis más la versión de la plantilla, y se guardan en un directorio
+local con política LRU y, opcionalmente, en S3 bajo el prefijo reports/.
+
+Cambiar cualquier cosa del layout de pdf_report exige subir PDF_TEMPLATE_VERSION
+para que los reportes cacheados con la plantilla anterior dejen de servirse.
+"""
+
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+
+import tracing
+from log_config import get_logger
+
+# Subir cuando cambie el aspecto del reporte: invalida todo lo cacheado
+PDF_TEMPLATE_VERSION = '4'
+PDF_CACHE_DIR = os.getenv('PDF_CACHE_DIR', os.path.join(tempfile.gettempdir(), 'clutch_pdf_cache'))
+PDF_CACHE_MAX_BYTES = int(os.getenv('PDF_CACHE_MAX_BYTES', str(256 * 1024 * 1024)))
+# Un PDF escrito o leído hace menos de esto no se desaloja: su ruta puede estar camino de un
+# FileResponse o del streamer del modo servidor (incluso en otro proceso), que lo abren después
+PDF_CACHE_EVICT_GRACE = float(os.getenv('PDF_CACHE_EVICT_GRACE_SECONDS', '300'))
+PDF_CACHE_S3 = os.getenv('PDF_CACHE_S3', 'false').lower() == 'true'
+PDF_CACHE_PREFIX = 'reports'
+
+_evict_lock = threading.Lock()
+logger = get_logger('pdf_cache')
+
+
+def report_cache_key(analysis_text, structured_analysis, username, user_id, fecha_analisis, metrics=None):
+    """Hash estable de todo lo que determina el contenido del PDF."""
+    if not isinstance(structured_analysis, str):
+        structured_analysis = json.dumps(structured_analysis, sort_keys=True, ensure_ascii=False, default=str)
+    payload = json.dumps(
+        [PDF_TEMPLATE_VERSION, analysis_text or '', structured_analysis or '', username, user_id, fecha_analisis, metrics or {}],
+        sort_keys=True, ensure_ascii=False, default=str
+    )
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def _local_path(key):
+    return os.path.join(PDF_CACHE_DIR, f"{key}.pdf")
+
+
+def _s3_key(key):
+    return f"{PDF_CACHE_PREFIX}/{key}.pdf"
+
+
+def _s3_manager():
+    if not PDF_CACHE_S3:
+        return None
+    try:
+        from s3_config import s3_manager
+    except Exception as e:
+        logger.warning("Cache de PDFs sin S3: %s", e)
+        return None
+    return s3_manager if s3_manager.available else None
+
+
+def _touch(path):
+    try:
+        os.utime(path, None)
+    except OSError:
+        pass
+
+
+def _evict():
+    """
+    Borra los PDFs menos usados (mtime más antiguo) hasta quedar bajo PDF_CACHE_MAX_BYTES.
+    Los usados dentro de PDF_CACHE_EVICT_GRACE se conservan aunque el cache quede por encima.
+    """
+    with _evict_lock:
+        try:
+            entries = [entry for entry in os.scandir(PDF_CACHE_DIR) if entry.name.endswith('.pdf')]
+        except FileNotFoundError:
+            return
+        stats = []
+        for entry in entries:
+            try:
+                stats.append((entry.stat().st_mtime, entry.stat().st_size, entry.path))
+            except FileNotFoundError:
+                continue
+        total = sum(size for _, size, _ in stats)
+        in_use_since = time.time() - PDF_CACHE_EVICT_GRACE
+        for mtime, size, path in sorted(stats):
+            if total <= PDF_CACHE_MAX_BYTES or mtime >= in_use_since:
+                break
+            try:
+                # Pudo haberse leído (y tocado) después del scandir
+                if os.stat(path).st_mtime >= in_use_since:
+                    continue
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+
+
+def _write_local(key, write):
+    """Escribe el PDF con write(archivo) directo al directorio del cache, sin copias en memoria."""
+    os.makedirs(PDF_CACHE_DIR, exist_ok=True)
+    # Escritura atómica: varios workers pueden renderizar el mismo reporte a la vez
+    fd, tmp_path = tempfile.mkstemp(dir=PDF_CACHE_DIR, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as tmp_file:
+            write(tmp_file)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+    path = _local_path(key)
+    os.replace(tmp_path, path)
+    _evict()
+    return path
+
+
+def _store_local(key, pdf_bytes):
+    return _write_local(key, lambda pdf_file: pdf_file.write(pdf_bytes))
+
+
+def _upload(key, path):
+    manager = _s3_manager()
+    if manager is not None:
+        with open(path, 'rb') as pdf_file:
+            manager.put_bytes(_s3_key(key), pdf_file, 'application/pdf')
+
+
+def get_cached_pdf_path(key):
+    """Ruta local del PDF cacheado (trayéndolo de S3 si hace falta) o None si no está."""
+    path = _local_path(key)
+    if os.path.exists(path):
+        _touch(path)
+        return path
+    manager = _s3_manager()
+    if manager is not None:
+        pdf_bytes = manager.get_bytes(_s3_key(key))
+        if pdf_bytes:
+            return _store_local(key, pdf_bytes)
+    return None
+
+
+def store_pdf(key, pdf_bytes):
+    """Guarda un PDF recién renderizado en el cache local y, si está habilitado, en S3."""
+    path = _store_local(key, pdf_bytes)
+    _upload(key, path)
+    return path
+
+
+def ensure_cached_pdf(analysis_text, structured_analysis, username, user_id, fecha_analisis, metrics=None):
+    """Devuelve la ruta local del PDF del análisis, renderizándolo solo si no estaba cacheado."""
+    key = report_cache_key(analysis_text, structured_analysis, username, user_id, fecha_analisis, metrics)
+    path = get_cached_pdf_path(key)
+    current = tracing.current_span()
+    if current is not None:
+        current.set_attribute('clutch.pdf_cache_hit', bool(path))
+    if path:
+        return path
+    from pdf_report import create_analysis_pdf
+    # reportlab escribe el documento directo al archivo del cache, sin pasar por un BytesIO
+    path = _write_local(key, lambda pdf_file: create_analysis_pdf(
+        analysis_text, structured_analysis, username, user_id, fecha_analisis, output_path=pdf_file, metrics=metrics
+    ))
+    _upload(key, path)
+    return path
+
+
+def render_analysis_pdf_cached(analysis_text, structured_analysis, username, user_id, fecha_analisis, metrics=None):
+    """Igual que create_analysis_pdf(output_path=None) pero sirviendo bytes cacheados si existen."""
+    path = ensure_cached_pdf(analysis_text, structured_analysis, username, user_id, fecha_analisis, metrics)
+    with open(path, 'rb') as pdf_file:
+        return pdf_file.read()
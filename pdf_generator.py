@@ -1,228 +1,332 @@
 import os
 import sys
 from datetime import datetime
-from reportlab.lib.pagesizes import A4
-from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-from reportlab.lib.units import inch
-from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Image, Table, TableStyle, BaseDocTemplate, PageTemplate, Frame
-from reportlab.lib.colors import HexColor
-from reportlab.lib.enums import TA_CENTER, TA_LEFT, TA_JUSTIFY
-from reportlab.pdfgen import canvas
-from reportlab.lib import colors
 import re
 import json
+import shutil
+import struct
+import threading
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
 
-class BlackBackgroundDocTemplate(SimpleDocTemplate):
-    def __init__(self, *args, **kwargs):
-        super().__init__(*args, **kwargs)
-        frame = Frame(self.leftMargin, self.bottomMargin, self.width, self.height, id='normal')
-        template = PageTemplate(id='black_bg', frames=[frame], onPage=self.draw_custom_background)
-        self.addPageTemplates([template])
-    def draw_custom_background(self, canvas, doc):
-        canvas.saveState()
-        canvas.setFillColor(HexColor('#253151'))  # Fondo azul personalizado en todas las páginas
-        canvas.rect(0, 0, doc.pagesize[0], doc.pagesize[1], fill=1, stroke=0)
-        # Encabezado arriba a la derecha en todas las páginas
-        canvas.setFont('Helvetica', 8)
-        canvas.setFillColor(HexColor('#FDFEFE'))
-        jugador = getattr(doc, 'jugador', '')
-        user_id = getattr(doc, 'user_id', '')
-        fecha_analisis = getattr(doc, 'fecha_analisis', '')
-        header_text = f"Jugador: {jugador}   ID: {user_id}   Fecha: {fecha_analisis}"
-        canvas.drawRightString(doc.pagesize[0] - 40, doc.pagesize[1] - 30, header_text)
-        canvas.restoreState()
-
-def create_analysis_pdf(analysis_text, structured_analysis, username, user_id, fecha_analisis=None, output_path=None):
+# Marco del modo servidor: 4 bytes big-endian con el largo + payload
+FRAME_HEADER = struct.Struct('>I')
+# Tamaño de los bloques con que se copian los PDF a stdout/sockets/zip
+STREAM_CHUNK_SIZE = 64 * 1024
+
+def __getattr__(name):
+    # El layout vive en pdf_report (reportlab) y se importa recién cuando hace falta: un PDF que ya
+    # está en el cache o el proceso principal de --serve/--batch no pagan ese import. Los nombres
+    # de siempre (create_analysis_pdf, clean_text_for_pdf, ...) se siguen resolviendo desde acá.
+    import pdf_report
+    try:
+        return getattr(pdf_report, name)
+    except AttributeError:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}") from None
+
+def render_job_path(data):
+    """
+    Renderiza un trabajo (dict con los mismos campos que la entrada JSON de main) y devuelve la ruta
+    del PDF en el cache de pdf_cache. Un trabajo idéntico a uno ya renderizado no se vuelve a generar.
+    Si el trabajo trae "traceparent", el span del render queda dentro de la traza de la grabación.
+    """
+    import tracing
+    from pdf_cache import ensure_cached_pdf
+    with tracing.span('render_pdf', data.get('traceparent'), **{'clutch.user_id': data.get('user_id')}) as current:
+        pdf_path = ensure_cached_pdf(
+            analysis_text=data.get('analysis_text', ''),
+            structured_analysis=data.get('structured_analysis', ''),
+            username=data.get('username', 'Usuario Desconocido'),
+            user_id=data.get('user_id', 'ID_Desconocido'),
+            fecha_analisis=data.get('fecha_analisis', datetime.now().strftime("%d/%m/%Y - %H:%M")),
+            metrics=data.get('metrics')
+        )
+        current.set_attribute('clutch.pdf_bytes', os.path.getsize(pdf_path))
+        return pdf_path
+
+def render_job(data):
+    """Igual que render_job_path, pero devuelve los bytes del PDF."""
+    with open(render_job_path(data), 'rb') as pdf_file:
+        return pdf_file.read()
+
+def _warm_renderer():
+    """Inicializador de cada proceso del pool: reportlab, estilos y logo quedan listos antes del primer trabajo."""
+    from pdf_report import get_logo_asset, get_pdf_styles
+    get_pdf_styles()
+    get_logo_asset()
+
+def _read_exact(stream, size):
+    data = bytearray()
+    while len(data) < size:
+        chunk = stream.read(size - len(data))
+        if not chunk:
+            return None
+        data += chunk
+    return bytes(data)
+
+def read_frame(stream):
+    """Lee un marco con prefijo de largo. Devuelve None al llegar a EOF."""
+    header = _read_exact(stream, FRAME_HEADER.size)
+    if header is None:
+        return None
+    (length,) = FRAME_HEADER.unpack(header)
+    return _read_exact(stream, length) if length else b''
+
+def write_frame(stream, payload):
+    stream.write(FRAME_HEADER.pack(len(payload)))
+    stream.write(payload)
+
+def write_file_frame(stream, pdf_file, length):
+    """Escribe un marco cuyo payload se copia por bloques desde un archivo abierto de largo conocido."""
+    stream.write(FRAME_HEADER.pack(length))
+    remaining = length
+    while remaining:
+        chunk = pdf_file.read(min(STREAM_CHUNK_SIZE, remaining))
+        if not chunk:
+            raise IOError(f"El PDF terminó {remaining} bytes antes de lo esperado")
+        stream.write(chunk)
+        remaining -= len(chunk)
+
+def serve_stream(reader, writer, executor):
     """
-    Genera un PDF con fondo negro y encabezado en todas las páginas, letras blancas y títulos corregidos.
+    Atiende trabajos desde reader hasta EOF.
+    Cada solicitud es un marco con un JSON (campo opcional "id"). Cada respuesta son dos marcos:
+    un encabezado JSON {"id", "ok", "length", "error"} y los bytes del PDF (vacío si hubo error).
+    Las respuestas se escriben a medida que terminan, no necesariamente en orden. Los procesos del pool
+    devuelven solo la ruta del PDF en el cache y este se copia por bloques al writer.
     """
-    # Asegurar que structured_analysis sea dict para métricas y string para regex
-    structured_analysis_dict = {}
-    structured_analysis_str = ''
-    if isinstance(structured_analysis, str):
+    write_lock = threading.Lock()
+    pending = []
+
+    def respond(job_id, pdf_path=None, error=None):
+        pdf_file = None
+        length = 0
+        if pdf_path is not None:
+            try:
+                pdf_file = open(pdf_path, 'rb')
+                length = os.fstat(pdf_file.fileno()).st_size
+            except OSError as e:
+                error = f"No se pudo leer el PDF generado: {e}"
+        header = json.dumps({'id': job_id, 'ok': error is None, 'length': length, 'error': error}).encode('utf-8')
+        with write_lock:
+            try:
+                write_frame(writer, header)
+                if pdf_file is not None:
+                    write_file_frame(writer, pdf_file, length)
+                else:
+                    write_frame(writer, b'')
+                writer.flush()
+            except (BrokenPipeError, OSError) as e:
+                sys.stderr.write(f"[ERROR] No se pudo enviar la respuesta {job_id}: {e}\n")
+            finally:
+                if pdf_file is not None:
+                    pdf_file.close()
+
+    while True:
+        frame = read_frame(reader)
+        if frame is None:
+            break
         try:
-            structured_analysis_dict = json.loads(structured_analysis)
-        except (json.JSONDecodeError, TypeError):
-            structured_analysis_dict = {}
-        structured_analysis_str = structured_analysis
-    elif isinstance(structured_analysis, dict):
-        structured_analysis_dict = structured_analysis
-        structured_analysis_str = json.dumps(structured_analysis)
-    else:
-        structured_analysis_dict = {}
-        structured_analysis_str = str(structured_analysis)
+            job = json.loads(frame.decode('utf-8'))
+        except (UnicodeDecodeError, json.JSONDecodeError) as e:
+            respond(None, error=f"JSON inválido: {e}")
+            continue
+        job_id = job.get('id')
 
-    if output_path is None:
-        from io import BytesIO
-        buffer = BytesIO()
-        doc = BlackBackgroundDocTemplate(buffer, pagesize=A4)
-    else:
-        doc = BlackBackgroundDocTemplate(output_path, pagesize=A4)
-    # Guardar datos para encabezado en todas las páginas
-    doc.jugador = username
-    doc.user_id = user_id
-    doc.fecha_analisis = fecha_analisis if fecha_analisis else datetime.now().strftime("%d/%m/%Y - %H:%M")
-
-    styles = getSampleStyleSheet()
-    # Estilos adaptados para fondo negro y formato solicitado
-    title_style = ParagraphStyle('Title', fontSize=32, alignment=TA_CENTER, textColor=HexColor('#FFFFFF'), spaceAfter=18, fontName='Helvetica-Bold', case='upper')
-    subtitle_style = ParagraphStyle('Subtitle', fontSize=17, alignment=TA_LEFT, textColor=HexColor('#FFFFFF'), spaceAfter=10, spaceBefore=18, fontName='Helvetica-Bold', case='upper')
-    normal_style = ParagraphStyle('Normal', fontSize=12, alignment=TA_JUSTIFY, leading=16, spaceAfter=8, textColor=HexColor('#FFFFFF'), fontName='Helvetica')
-    card_style = ParagraphStyle('Card', fontSize=12, alignment=TA_LEFT, textColor=HexColor('#FFFFFF'), spaceAfter=4, fontName='Helvetica')
-    highlight_style = ParagraphStyle('Highlight', fontSize=12, alignment=TA_JUSTIFY, textColor=HexColor('#F7DC6F'), backColor=HexColor('#212121'), fontName='Helvetica-Bold')
-    meta_style = ParagraphStyle('Meta', fontSize=9, alignment=TA_CENTER, textColor=HexColor('#BFC9CA'), fontName='Helvetica')
-    conclusion_style = ParagraphStyle('Conclusion', fontSize=14, alignment=TA_CENTER, textColor=HexColor('#58D68D'), spaceBefore=16, spaceAfter=10, fontName='Helvetica-Bold')
-
-    story = []
-
-    # 1. Portada visual
-    logo_path = os.path.join(os.path.dirname(__file__), 'Logo Esports (1500 x 1440 px).png')
-    equipo_logo_path = None
-    avatar_path = None
-    # Buscar logo de equipo/jugador y avatar si están en el input
-    if 'equipo_logo' in structured_analysis_dict:
-        equipo_logo_path = structured_analysis_dict['equipo_logo']
-    if 'avatar' in structured_analysis_dict:
-        avatar_path = structured_analysis_dict['avatar']
-    # Portada: Logo Clutch + logo equipo/jugador
-    portada_imgs = []
-    if os.path.exists(logo_path):
-        portada_imgs.append(Image(logo_path, width=120, height=115))
-    if equipo_logo_path and os.path.exists(equipo_logo_path):
-        portada_imgs.append(Image(equipo_logo_path, width=80, height=80))
-    story.append(Table([[portada_imgs]], hAlign='CENTER', style=[('ALIGN', (0,0), (-1,-1), 'CENTER'), ('VALIGN', (0,0), (-1,-1), 'MIDDLE')]))
-    story.append(Spacer(1, 20))
-
-    # Descripción introductoria
-    intro_text = f"""¡Hola, <b>{username}</b>!<br/><br/>
-He analizado cómo te comunicaste en la última partida. Este informe va más allá de un simple reporte: está diseñado para entender cómo tu personalidad se refleja en el juego.<br/><br/>
-Te mostraré tus fortalezas que aportan al equipo y las áreas donde puedes mejorar para crecer aún más. Con cada partida aprendo más sobre ti y adapto mis recomendaciones para que se ajusten a tu estilo único.<br/><br/>
-Además, podrás acceder a métricas clave como las palabras más repetidas, palabras por minuto, volumen durante la partida y mucho más en <a href='http://www.platform.clutch.cl' color='white'>www.platform.clutch.cl</a>.<br/><br/>
-Este análisis es una herramienta personalizada creada para ayudarte a sacar lo mejor de ti."""
-    story.append(Paragraph(intro_text, normal_style))
-    story.append(Spacer(1, 20))
-
-    # 2. Resumen rápido (match stats)
-    metricas = structured_analysis_dict.get('metricas', [])
-    if metricas:
-        tabla_data = [["Métrica clave", "Valor", "Estado"]] + [[m.get('nombre', ''), m.get('valor', ''), m.get('estado', '')] for m in metricas]
-        story.append(Table(tabla_data, colWidths=[160, 80, 80], style=[('BACKGROUND', (0,0), (-1,0), HexColor('#34495E')), ('TEXTCOLOR', (0,0), (-1,0), colors.white), ('ALIGN', (0,0), (-1,-1), 'CENTER'), ('TEXTCOLOR', (0,1), (-1,-1), colors.white), ('FONTSIZE', (0,0), (-1,-1), 12), ('GRID', (0,0), (-1,-1), 0.5, colors.white)]))
-    else:
-        story.append(Paragraph("No se encontraron métricas específicas.", normal_style))
-    story.append(Spacer(1, 10))
-
-    # 3. Fortalezas
-    story.append(Paragraph("FORTALEZAS", subtitle_style))
-    fortalezas = extract_fortalezas(analysis_text)
-    for fort in fortalezas:
-        story.append(Paragraph(f"✅ {fort}", normal_style))
-    story.append(Spacer(1, 10))
-
-    # 4. Áreas de mejora
-    story.append(Paragraph("ÁREAS DE MEJORA", subtitle_style))
-    mejoras = extract_mejoras(structured_analysis_str)
-    for idx, mejora in enumerate(mejoras, 1):
-        icono = "❌" if "crítico" in mejora.lower() or idx == 1 else "⚠"
-        story.append(Paragraph(f"{icono} {mejora}", normal_style))
-    story.append(Spacer(1, 10))
-
-    # 5. Recomendaciones específicas
-    story.append(Paragraph("RECOMENDACIONES ESPECÍFICAS", subtitle_style))
-    recomendaciones = extract_recomendaciones(structured_analysis_str)
-    for rec in recomendaciones:
-        story.append(Paragraph(f"💡 {rec}", normal_style))
-    story.append(Spacer(1, 10))
-
-    # 6. Observaciones de la IA
-    story.append(Paragraph("OBSERVACIONES DE LA IA", subtitle_style))
-    obs = clean_text_for_pdf(analysis_text)
-    obs = highlight_keywords(obs, ['comunicación', 'callout', 'equipo', 'frustración', 'soluciones', 'coordinación'])
-    story.append(Paragraph(obs, highlight_style))
-    story.append(Spacer(1, 10))
-
-    # 7. Cierre motivacional
-    story.append(Paragraph("CIERRE MOTIVACIONAL", subtitle_style))
-    story.append(Paragraph("En el campo, tu voz es tan importante como tu puntería. <br/><b>#Clutch</b>", conclusion_style))
-    story.append(Spacer(1, 10))
-
-    # Pie de Página
-    story.append(Spacer(1, 20))
-    disclaimer = "Este análisis es generado automáticamente por IA y no reemplaza la evaluación profesional."
-    story.append(Paragraph(disclaimer, meta_style))
-    clutch_url = "https://clutch.cl"
-    if os.path.exists(logo_path):
-        story.append(Image(logo_path, width=40, height=40))
-    story.append(Paragraph(f"Más información en <a href='{clutch_url}' color='white'>{clutch_url}</a>", meta_style))
-
-    doc.build(story)
-    if output_path is None:
-        buffer.seek(0)
-        pdf_bytes = buffer.getvalue()
-        buffer.close()
-        return pdf_bytes
-    else:
-        return output_path
-
-def get_general_evaluation(analysis_text):
-    """Devuelve una evaluación general simple basada en el texto."""
-    text = analysis_text.lower()
-    if any(w in text for w in ['excelente', 'muy bien', 'positivo', 'buena comunicación']):
-        return "Positivo"
-    if any(w in text for w in ['mejorar', 'frustración', 'desacuerdo', 'problema', 'necesita trabajo']):
-        return "Necesita trabajo"
-    return "Neutro"
-
-def extract_fortalezas(analysis_text):
-    """Extrae fortalezas del análisis (simulado, puedes mejorar el algoritmo)."""
-    # Simulación: busca frases positivas
-    frases = re.findall(r'(?:buena comunicación|callout específico|tono positivo|apoyo|coordinación|soluciones)', analysis_text, re.IGNORECASE)
-    if not frases:
-        frases = ["Buena disposición para mejorar", "Capacidad de reconocer aportes del equipo", "Interés en la coordinación"]
-    return frases[:5]
-
-def extract_mejoras(structured_analysis):
-    """Extrae áreas de mejora del análisis estructurado."""
-    aspectos = []
-    match = re.search(r'"Aspectos a mejorar":\s*(.*?)(?="Cómo mejorarlos"|$)', structured_analysis, re.DOTALL | re.IGNORECASE)
-    if match:
-        aspectos_text = match.group(1)
-        aspectos = re.findall(r'[-•]\s*(.+?)(?=\n[-•]|\n\n|$)', aspectos_text, re.DOTALL)
-    if not aspectos:
-        aspectos = ["Evitar expresiones de frustración", "Ser más específico en los callouts", "Mantener información clara"]
-    return [clean_text_for_pdf(a) for a in aspectos]
-
-def extract_recomendaciones(structured_analysis):
-    """Extrae recomendaciones del análisis estructurado."""
-    recomendaciones = []
-    match = re.search(r'"Cómo mejorarlos":\s*(.*?)(?="Análisis detallado"|$)', structured_analysis, re.DOTALL | re.IGNORECASE)
-    if match:
-        rec_text = match.group(1)
-        recomendaciones = re.findall(r'[-•]\s*(.+?)(?=\n[-•]|\n\n|$)', rec_text, re.DOTALL)
-    if not recomendaciones:
-        recomendaciones = [
-            "Post-partida: anotar 1 jugada positiva y 1 lección aprendida.",
-            "Mid-game: mantener un ratio 2:1 de comentarios positivos/negativos.",
-            "Pre-match: definir objetivos de comunicación claros."
+        def on_done(future, job_id=job_id):
+            try:
+                respond(job_id, future.result())
+            except Exception as e:
+                respond(job_id, error=str(e))
+
+        future = executor.submit(render_job_path, job)
+        future.add_done_callback(on_done)
+        pending.append(future)
+        pending = [f for f in pending if not f.done()]
+    for future in pending:
+        try:
+            future.result()
+        except Exception:
+            pass
+
+def serve(argv):
+    """Modo servidor residente: python pdf_generator.py --serve [--socket RUTA | --port N] [--workers N]"""
+    import argparse
+    parser = argparse.ArgumentParser(prog='pdf_generator.py --serve')
+    parser.add_argument('--socket', help='Socket Unix donde escuchar (por defecto stdin/stdout)')
+    parser.add_argument('--port', type=int, help='Puerto TCP local donde escuchar (por defecto stdin/stdout)')
+    parser.add_argument('--workers', type=int, default=int(os.getenv('PDF_RENDER_WORKERS', '2')))
+    args = parser.parse_args(argv)
+
+    executor = ProcessPoolExecutor(max_workers=max(1, args.workers), initializer=_warm_renderer)
+    sys.stderr.write(f"[OK] Servidor de PDF iniciado con {args.workers} procesos\n")
+    try:
+        if args.socket or args.port:
+            import socketserver
+
+            class Handler(socketserver.StreamRequestHandler):
+                def handle(self):
+                    serve_stream(self.rfile, self.wfile, executor)
+
+            if args.socket:
+                if os.path.exists(args.socket):
+                    os.unlink(args.socket)
+                server = socketserver.ThreadingUnixStreamServer(args.socket, Handler)
+            else:
+                server = socketserver.ThreadingTCPServer(('127.0.0.1', args.port), Handler)
+            server.daemon_threads = True
+            with server:
+                server.serve_forever()
+        else:
+            serve_stream(sys.stdin.buffer, sys.stdout.buffer, executor)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        executor.shutdown(wait=True)
+
+def _safe_filename(name):
+    return re.sub(r'[^\w.-]+', '_', str(name)).strip('._') or 'reporte'
+
+def _batch_job_filename(index, job):
+    if job.get('filename'):
+        return _safe_filename(job['filename'])
+    suffix = job.get('analysis_id') or index
+    return _safe_filename(f"{job.get('user_id', 'usuario')}_{suffix}") + '.pdf'
+
+def _unique_filenames(jobs):
+    """Agrega un sufijo _2, _3... a los nombres repetidos para que ningún PDF pise a otro en el directorio o el zip."""
+    used = set()
+    unique = []
+    for job, filename in jobs:
+        stem, ext = os.path.splitext(filename)
+        candidate, copy = filename, 1
+        while candidate in used:
+            copy += 1
+            candidate = f"{stem}_{copy}{ext}"
+        used.add(candidate)
+        unique.append((job, candidate))
+    return unique
+
+def _render_batch_item(job, output_path=None):
+    """Renderiza un reporte o un PDF combinado ({'combine': título, 'analyses': [...]}) en un proceso del pool."""
+    from pdf_report import create_analysis_pdf, create_combined_pdf
+    if 'analyses' in job:
+        return create_combined_pdf(job['analyses'], job['combine'], output_path=output_path)
+    return create_analysis_pdf(
+        analysis_text=job.get('analysis_text', ''),
+        structured_analysis=job.get('structured_analysis', ''),
+        username=job.get('username', 'Usuario Desconocido'),
+        user_id=job.get('user_id', 'ID_Desconocido'),
+        fecha_analisis=job.get('fecha_analisis', datetime.now().strftime("%d/%m/%Y - %H:%M")),
+        output_path=output_path,
+        metrics=job.get('metrics')
+    )
+
+def run_batch(argv):
+    """
+    Modo masivo: lee análisis en JSONL desde stdin y los renderiza en un pool de procesos.
+    python pdf_generator.py --batch (--out-dir DIR | --zip RUTA|-) [--combine TÍTULO] [--group-by CAMPO] [--workers N]
+    """
+    import argparse
+    import zipfile
+    from concurrent.futures import FIRST_COMPLETED, wait as wait_futures
+
+    parser = argparse.ArgumentParser(prog='pdf_generator.py --batch')
+    target = parser.add_mutually_exclusive_group(required=True)
+    target.add_argument('--out-dir', help='Directorio donde escribir un PDF por reporte')
+    target.add_argument('--zip', help="Archivo zip de salida ('-' para stdout)")
+    parser.add_argument('--combine', metavar='TÍTULO', help='Combinar los análisis en un PDF con índice')
+    parser.add_argument('--group-by', help="Con --combine: un PDF combinado por valor de este campo (p. ej. user_id)")
+    parser.add_argument('--workers', type=int, default=int(os.getenv('PDF_RENDER_WORKERS', str(os.cpu_count() or 2))))
+    args = parser.parse_args(argv)
+
+    started = datetime.now()
+    analyses = []
+    for line_number, line in enumerate(sys.stdin.buffer, 1):
+        if not line.strip():
+            continue
+        try:
+            analyses.append(json.loads(line.decode('utf-8')))
+        except (UnicodeDecodeError, json.JSONDecodeError) as e:
+            sys.stderr.write(f"[ERROR] Línea {line_number} ignorada: {e}\n")
+
+    if args.combine:
+        groups = {}
+        for data in analyses:
+            group = str(data.get(args.group_by, 'sin_grupo')) if args.group_by else args.combine
+            groups.setdefault(group, []).append(data)
+        jobs = [
+            ({'combine': f"{args.combine} - {group}" if args.group_by else args.combine, 'analyses': items},
+             _safe_filename(f"{args.combine}_{group}" if args.group_by else args.combine) + '.pdf')
+            for group, items in groups.items()
         ]
-    return [clean_text_for_pdf(r) for r in recomendaciones]
-
-def highlight_keywords(text, keywords):
-    """Resalta palabras clave en el texto usando HTML tags para PDF."""
-    for kw in keywords:
-        text = re.sub(rf'({kw})', r'<b>\1</b>', text, flags=re.IGNORECASE)
-    return text
-
-def clean_text_for_pdf(text):
-    if not text:
-        return ""
-    text = text.replace('…', '...').replace('—', '-').replace('–', '-')
-    text = re.sub(r'\*\*(.*?)\*\*', r'\1', text)
-    text = re.sub(r'\*(.*?)\*', r'\1', text)
-    text = re.sub(r'`(.*?)`', r'\1', text)
-    text = re.sub(r'[^\w\s\.,;:!?¿¡()\-"\'áéíóúñüÁÉÍÓÚÑÜ✅⭐]', '', text)
-    return text.strip()
+    else:
+        jobs = [(data, _batch_job_filename(index, data)) for index, data in enumerate(analyses, 1)]
+    jobs = _unique_filenames(jobs)
+
+    if args.out_dir:
+        os.makedirs(args.out_dir, exist_ok=True)
+    archive = None
+    staging_dir = None
+    if args.zip:
+        # Cada proceso escribe su PDF en un directorio temporal y el zip lo copia por bloques
+        staging_dir = tempfile.mkdtemp(prefix='clutch_batch_')
+        archive_target = sys.stdout.buffer if args.zip == '-' else open(args.zip, 'wb')
+        # Los PDF ya vienen comprimidos: se guardan sin volver a comprimir
+        archive = zipfile.ZipFile(archive_target, 'w', compression=zipfile.ZIP_STORED)
+
+    rendered = 0
+    failed = 0
+    executor = ProcessPoolExecutor(max_workers=max(1, args.workers), initializer=_warm_renderer)
+    try:
+        # Se limita la cantidad de trabajos en vuelo para no acumular PDFs en memoria
+        max_in_flight = max(1, args.workers) * 2
+        in_flight = {}
+        pending_jobs = iter(jobs)
+        while True:
+            while len(in_flight) < max_in_flight:
+                next_job = next(pending_jobs, None)
+                if next_job is None:
+                    break
+                job, filename = next_job
+                # Cada proceso escribe su archivo directamente; solo la ruta vuelve al proceso principal
+                output_path = os.path.join(args.out_dir or staging_dir, filename)
+                in_flight[executor.submit(_render_batch_item, job, output_path)] = filename
+            if not in_flight:
+                break
+            done, _ = wait_futures(in_flight, return_when=FIRST_COMPLETED)
+            for future in done:
+                filename = in_flight.pop(future)
+                try:
+                    result = future.result()
+                except Exception as e:
+                    failed += 1
+                    sys.stderr.write(f"[ERROR] No se pudo generar {filename}: {e}\n")
+                    continue
+                if archive is not None:
+                    archive.write(result, filename)
+                    os.remove(result)
+                rendered += 1
+    finally:
+        executor.shutdown(wait=True)
+        if archive is not None:
+            archive.close()
+            if args.zip != '-':
+                archive_target.close()
+            shutil.rmtree(staging_dir, ignore_errors=True)
+
+    elapsed = (datetime.now() - started).total_seconds()
+    sys.stderr.write(f"[OK] {rendered} PDF generados ({failed} con error) a partir de {len(analyses)} análisis en {elapsed:.1f}s\n")
 
 def main():
+    import tracing
+    tracing.set_service_name('clutch-pdf')
+    if len(sys.argv) > 1 and sys.argv[1] == '--serve':
+        serve(sys.argv[2:])
+        return
+    if len(sys.argv) > 1 and sys.argv[1] == '--batch':
+        run_batch(sys.argv[2:])
+        return
     try:
         # Leer datos desde stdin como bytes y decodificar como UTF-8 para manejar tildes
         input_bytes = sys.stdin.buffer.read()
@@ -238,22 +342,13 @@ def main():
             return
         
         data = json.loads(input_data)
-        analysis_text = data.get('analysis_text', '')
-        structured_analysis = data.get('structured_analysis', '')
         username = data.get('username', 'Usuario Desconocido')
-        user_id = data.get('user_id', 'ID_Desconocido')
-        fecha_analisis = data.get('fecha_analisis', datetime.now().strftime("%d/%m/%Y - %H:%M"))
-        
-        pdf_bytes = create_analysis_pdf(
-            analysis_text=analysis_text,
-            structured_analysis=structured_analysis,
-            username=username,
-            user_id=user_id,
-            fecha_analisis=fecha_analisis,
-            output_path=None
-        )
-        sys.stdout.buffer.write(pdf_bytes)
-        sys.stderr.write(f"[OK] PDF generado exitosamente para {username} ({len(pdf_bytes)} bytes)\n")
+        pdf_path = render_job_path(data)
+        # El PDF se copia por bloques desde el cache: nunca se arma una segunda copia en memoria
+        with open(pdf_path, 'rb') as pdf_file:
+            shutil.copyfileobj(pdf_file, sys.stdout.buffer, STREAM_CHUNK_SIZE)
+        sys.stdout.buffer.flush()
+        sys.stderr.write(f"[OK] PDF generado exitosamente para {username} ({os.path.getsize(pdf_path)} bytes)\n")
     except json.JSONDecodeError as e:
         sys.stderr.write(f"[ERROR] Error parseando JSON: {e}\n")
     except Exception as e:
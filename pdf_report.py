@@ -0,0 +1,512 @@
+"""
+Layout de los reportes PDF con reportlab: plantillas de página, estilos, imágenes, gráficos de
+métricas y armado del contenido de cada reporte.
+
+pdf_generator.py (CLI, modo servidor y modo masivo) importa este módulo recién al renderizar, así
+lanzar el script no carga reportlab en los caminos que no lo necesitan.
+"""
+
+import os
+import re
+import functools
+import hashlib
+import json
+import tempfile
+from datetime import datetime
+from reportlab.lib.pagesizes import A4
+from reportlab.lib.styles import ParagraphStyle
+from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Image, Table, PageTemplate, Frame, PageBreak
+from reportlab.platypus.tableofcontents import TableOfContents
+from reportlab.graphics.shapes import Drawing, Line, PolyLine, String
+from reportlab.lib.colors import HexColor
+from reportlab.lib.enums import TA_CENTER, TA_LEFT, TA_JUSTIFY
+from reportlab.lib import colors
+from reportlab import rl_config
+
+LOGO_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'Logo Esports (1500 x 1440 px).png')
+# Logos de equipo/jugador: structured_analysis solo puede nombrar un archivo de este directorio
+# (el reporte también se renderiza en la API con datos guardados por el cliente)
+TEAM_LOGO_DIR = os.getenv('PDF_TEAM_LOGO_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'team_logos'))
+PAGE_BACKGROUND = '#253151'
+# Variantes pre-escaladas de imágenes: resolución objetivo y directorio de cache
+ASSET_RENDER_DPI = int(os.getenv('PDF_ASSET_DPI', '144'))
+ASSET_CACHE_DIR = os.getenv('PDF_ASSET_CACHE_DIR', os.path.join(tempfile.gettempdir(), 'clutch_pdf_assets'))
+# Streams binarios en el PDF: ASCII85 solo agrega ~25% de tamaño a imágenes y contenido
+rl_config.useA85 = 0
+# Gráficos de métricas: puntos máximos por serie tras el diezmado min/max
+CHART_MAX_POINTS = int(os.getenv('PDF_CHART_MAX_POINTS', '240'))
+CHART_WIDTH = 440
+CHART_HEIGHT = 130
+
+class BlackBackgroundDocTemplate(SimpleDocTemplate):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        frame = Frame(self.leftMargin, self.bottomMargin, self.width, self.height, id='normal')
+        template = PageTemplate(id='black_bg', frames=[frame], onPage=self.draw_custom_background)
+        self.addPageTemplates([template])
+    def draw_custom_background(self, canvas, doc):
+        self.draw_background(canvas, doc)
+        self.draw_header(canvas, doc)
+    def draw_background(self, canvas, doc):
+        canvas.saveState()
+        canvas.setFillColor(HexColor(PAGE_BACKGROUND))  # Fondo azul personalizado en todas las páginas
+        canvas.rect(0, 0, doc.pagesize[0], doc.pagesize[1], fill=1, stroke=0)
+        canvas.restoreState()
+    def draw_header(self, canvas, doc):
+        # Encabezado arriba a la derecha en todas las páginas
+        canvas.saveState()
+        canvas.setFont('Helvetica', 8)
+        canvas.setFillColor(HexColor('#FDFEFE'))
+        jugador = getattr(doc, 'jugador', '')
+        user_id = getattr(doc, 'user_id', '')
+        fecha_analisis = getattr(doc, 'fecha_analisis', '')
+        header_text = f"Jugador: {jugador}   ID: {user_id}   Fecha: {fecha_analisis}"
+        canvas.drawRightString(doc.pagesize[0] - 40, doc.pagesize[1] - 30, header_text)
+        canvas.restoreState()
+
+class CombinedReportDocTemplate(BlackBackgroundDocTemplate):
+    """
+    Varios análisis en un solo PDF con índice. El encabezado se dibuja al terminar cada página
+    para mostrar los datos de la sección que aparece en ella.
+    """
+    cover_meta = ('', '', '')
+    def draw_custom_background(self, canvas, doc):
+        self.draw_background(canvas, doc)
+    def beforeDocument(self):
+        # multiBuild hace varias pasadas: cada una parte con los datos de la portada
+        self.jugador, self.user_id, self.fecha_analisis = self.cover_meta
+    def afterPage(self):
+        self.draw_header(self.canv, self)
+    def afterFlowable(self, flowable):
+        section_meta = getattr(flowable, 'section_meta', None)
+        if section_meta:
+            self.jugador, self.user_id, self.fecha_analisis = section_meta
+        toc_entry = getattr(flowable, 'toc_entry', None)
+        if toc_entry:
+            text, key = toc_entry
+            self.canv.bookmarkPage(key)
+            self.canv.addOutlineEntry(text, key, level=0)
+            self.notify('TOCEntry', (0, text, self.page, key))
+
+@functools.lru_cache(maxsize=None)
+def get_pdf_styles():
+    """Construye una sola vez por proceso los estilos del reporte (fondo oscuro, letras blancas)."""
+    return {
+        'title': ParagraphStyle('Title', fontSize=32, alignment=TA_CENTER, textColor=HexColor('#FFFFFF'), spaceAfter=18, fontName='Helvetica-Bold', case='upper'),
+        'subtitle': ParagraphStyle('Subtitle', fontSize=17, alignment=TA_LEFT, textColor=HexColor('#FFFFFF'), spaceAfter=10, spaceBefore=18, fontName='Helvetica-Bold', case='upper'),
+        'normal': ParagraphStyle('Normal', fontSize=12, alignment=TA_JUSTIFY, leading=16, spaceAfter=8, textColor=HexColor('#FFFFFF'), fontName='Helvetica'),
+        'card': ParagraphStyle('Card', fontSize=12, alignment=TA_LEFT, textColor=HexColor('#FFFFFF'), spaceAfter=4, fontName='Helvetica'),
+        'highlight': ParagraphStyle('Highlight', fontSize=12, alignment=TA_JUSTIFY, textColor=HexColor('#F7DC6F'), backColor=HexColor('#212121'), fontName='Helvetica-Bold'),
+        'meta': ParagraphStyle('Meta', fontSize=9, alignment=TA_CENTER, textColor=HexColor('#BFC9CA'), fontName='Helvetica'),
+        'conclusion': ParagraphStyle('Conclusion', fontSize=14, alignment=TA_CENTER, textColor=HexColor('#58D68D'), spaceBefore=16, spaceAfter=10, fontName='Helvetica-Bold'),
+    }
+
+def get_image_asset(source_path, width, height, background=PAGE_BACKGROUND):
+    """
+    Devuelve la ruta de una variante pre-escalada de source_path para dibujarla a width x height puntos.
+    La variante se aplana sobre el color de fondo y se guarda como JPEG, que reportlab embebe tal cual
+    sin volver a decodificar ni comprimir. Se genera una sola vez por (ruta, mtime, tamaño) y se reutiliza.
+    Devuelve None si el archivo no existe.
+    """
+    try:
+        stat = os.stat(source_path)
+    except OSError:
+        return None
+    return _build_image_asset(os.path.abspath(source_path), stat.st_mtime_ns, stat.st_size, width, height, background)
+
+@functools.lru_cache(maxsize=64)
+def _build_image_asset(source_path, mtime_ns, size, width, height, background):
+    scale = ASSET_RENDER_DPI / 72.0
+    target = (max(1, round(width * scale)), max(1, round(height * scale)))
+    cache_key = hashlib.sha1(f"{source_path}:{mtime_ns}:{size}:{target}:{background}".encode('utf-8')).hexdigest()[:16]
+    asset_path = os.path.join(ASSET_CACHE_DIR, f"{cache_key}.jpg")
+    if os.path.exists(asset_path):
+        return asset_path
+    from PIL import Image as PILImage
+    os.makedirs(ASSET_CACHE_DIR, exist_ok=True)
+    with PILImage.open(source_path) as source:
+        source.draft('RGB', target)
+        image = source.convert('RGBA')
+        image.thumbnail(target, PILImage.LANCZOS)
+    flattened = PILImage.new('RGB', image.size, background)
+    flattened.paste(image, mask=image.getchannel('A'))
+    # Escritura atómica: varios procesos del pool pueden generar la misma variante a la vez
+    fd, tmp_path = tempfile.mkstemp(dir=ASSET_CACHE_DIR, suffix='.jpg')
+    with os.fdopen(fd, 'wb') as tmp_file:
+        flattened.save(tmp_file, 'JPEG', quality=90, optimize=True)
+    os.replace(tmp_path, asset_path)
+    return asset_path
+
+def resolve_team_logo(name):
+    """
+    Ruta del logo de equipo nombrado en structured_analysis ('equipo_logo'), solo si es un archivo
+    dentro de TEAM_LOGO_DIR. Rutas absolutas, '..' o enlaces que salen del directorio dan None.
+    """
+    if not isinstance(name, str) or not name:
+        return None
+    base = os.path.realpath(TEAM_LOGO_DIR)
+    path = os.path.realpath(os.path.join(base, name))
+    if os.path.dirname(path) != base or not os.path.isfile(path):
+        return None
+    return path
+
+def get_logo_asset():
+    """Variante del logo Clutch usada en todo el reporte (tamaño de la portada, la mayor colocación)."""
+    return get_image_asset(LOGO_PATH, 120, 115)
+
+def decimate_min_max(values, max_points=CHART_MAX_POINTS):
+    """
+    Reduce una serie a ~max_points puntos (índice, valor) conservando el mínimo y el máximo de cada
+    tramo, de modo que los picos y silencios siguen visibles aunque la partida dure horas.
+    """
+    count = len(values)
+    if count <= max_points:
+        return list(enumerate(values))
+    buckets = max(1, max_points // 2)
+    points = []
+    for bucket in range(buckets):
+        start = bucket * count // buckets
+        end = (bucket + 1) * count // buckets
+        low = min(range(start, end), key=values.__getitem__)
+        high = max(range(start, end), key=values.__getitem__)
+        for index in sorted({low, high}):
+            points.append((index, values[index]))
+    return points
+
+def _minute_series(wpm_by_segment):
+    """{'Minuto 1': 40, 'Minuto 2': 55, ...} -> [40, 55, ...] ordenado por minuto."""
+    def minute_number(key):
+        try:
+            return int(str(key).rsplit(' ', 1)[-1])
+        except ValueError:
+            return 0
+    return [float(wpm_by_segment[key]) for key in sorted(wpm_by_segment, key=minute_number)]
+
+def build_timeline_chart(values, title, x_label, color, y_min=None, y_max=None, width=CHART_WIDTH, height=CHART_HEIGHT):
+    """
+    Dibuja una serie temporal como gráfico vectorial de reportlab (sin imágenes rasterizadas).
+    values se diezma con decimate_min_max antes de dibujarse.
+    """
+    points = decimate_min_max(values)
+    low = min(values) if y_min is None else y_min
+    high = max(values) if y_max is None else y_max
+    if high <= low:
+        high = low + 1
+    left, bottom, top = 34, 16, 18
+    plot_width = width - left - 4
+    plot_height = height - bottom - top
+    last_index = max(1, len(values) - 1)
+    grid_color = HexColor('#5D6D7E')
+
+    drawing = Drawing(width, height)
+    drawing.add(String(0, height - 12, title, fontName='Helvetica-Bold', fontSize=10, fillColor=colors.white))
+    for step in range(3):
+        level = low + (high - low) * step / 2
+        y = bottom + plot_height * step / 2
+        drawing.add(Line(left, y, left + plot_width, y, strokeColor=grid_color, strokeWidth=0.4))
+        drawing.add(String(left - 4, y - 3, f"{level:.0f}", fontName='Helvetica', fontSize=7, fillColor=HexColor('#BFC9CA'), textAnchor='end'))
+    coords = []
+    for index, value in points:
+        coords.append(left + plot_width * index / last_index)
+        coords.append(bottom + plot_height * (min(max(value, low), high) - low) / (high - low))
+    if len(coords) == 2:
+        coords.extend(coords)
+    drawing.add(PolyLine(coords, strokeColor=HexColor(color), strokeWidth=1.2, strokeLineJoin=1))
+    drawing.add(String(left, 2, "0", fontName='Helvetica', fontSize=7, fillColor=HexColor('#BFC9CA')))
+    drawing.add(String(left + plot_width, 2, x_label, fontName='Helvetica', fontSize=7, fillColor=HexColor('#BFC9CA'), textAnchor='end'))
+    return drawing
+
+def build_metric_summary(metrics):
+    """Filas del "Resumen rápido" a partir de las métricas de audio del análisis."""
+    rows = []
+    wpm_series = _minute_series(metrics.get('wpm_by_segment') or {})
+    if metrics.get('wpm'):
+        rows.append({'nombre': 'Palabras por minuto', 'valor': f"{float(metrics['wpm']):.0f}", 'estado': ''})
+    if wpm_series:
+        rows.append({'nombre': 'Pico de palabras/min', 'valor': f"{max(wpm_series):.0f}", 'estado': ''})
+    loudness = metrics.get('loudness_by_second') or []
+    if loudness:
+        rows.append({'nombre': 'Volumen medio', 'valor': f"{sum(loudness) / len(loudness):.0f} dB", 'estado': ''})
+        rows.append({'nombre': 'Volumen máximo', 'valor': f"{max(loudness):.0f} dB", 'estado': ''})
+    return rows
+
+def build_metric_charts(metrics):
+    """Gráficos de WPM por minuto y volumen por segundo; lista vacía si no hay datos."""
+    charts = []
+    wpm_series = _minute_series(metrics.get('wpm_by_segment') or {})
+    if wpm_series:
+        charts.append(build_timeline_chart(wpm_series, "Palabras por minuto", f"{len(wpm_series)} min", '#58D68D', y_min=0))
+    loudness = [float(value) for value in metrics.get('loudness_by_second') or []]
+    if loudness:
+        charts.append(build_timeline_chart(loudness, "Volumen (dBFS)", f"{len(loudness) / 60:.0f} min", '#F7DC6F', y_min=-60, y_max=0))
+    return charts
+
+def build_analysis_story(analysis_text, structured_analysis, username, metrics=None):
+    """
+    Construye los flowables de un reporte de análisis (portada, fortalezas, mejoras, recomendaciones, cierre).
+    metrics ({'wpm', 'wpm_by_segment', 'loudness_by_second'}) agrega el resumen y los gráficos de la partida.
+    """
+    metrics = metrics or {}
+    # Asegurar que structured_analysis sea dict para métricas y string para regex
+    structured_analysis_dict = {}
+    structured_analysis_str = ''
+    if isinstance(structured_analysis, str):
+        try:
+            structured_analysis_dict = json.loads(structured_analysis)
+        except (json.JSONDecodeError, TypeError):
+            structured_analysis_dict = {}
+        structured_analysis_str = structured_analysis
+    elif isinstance(structured_analysis, dict):
+        structured_analysis_dict = structured_analysis
+        structured_analysis_str = json.dumps(structured_analysis)
+    else:
+        structured_analysis_dict = {}
+        structured_analysis_str = str(structured_analysis)
+
+    styles = get_pdf_styles()
+    subtitle_style = styles['subtitle']
+    normal_style = styles['normal']
+    highlight_style = styles['highlight']
+    meta_style = styles['meta']
+    conclusion_style = styles['conclusion']
+
+    story = []
+
+    # 1. Portada visual
+    # Una sola variante del logo para ambas colocaciones: reportlab la guarda como un único XObject
+    logo_asset = get_logo_asset()
+    equipo_logo_path = None
+    avatar_path = None
+    # Buscar logo de equipo/jugador y avatar si están en el input
+    if 'equipo_logo' in structured_analysis_dict:
+        equipo_logo_path = resolve_team_logo(structured_analysis_dict['equipo_logo'])
+    if 'avatar' in structured_analysis_dict:
+        avatar_path = structured_analysis_dict['avatar']
+    # Portada: Logo Clutch + logo equipo/jugador
+    portada_imgs = []
+    if logo_asset:
+        portada_imgs.append(Image(logo_asset, width=120, height=115))
+    if equipo_logo_path:
+        portada_imgs.append(Image(equipo_logo_path, width=80, height=80))
+    story.append(Table([[portada_imgs]], hAlign='CENTER', style=[('ALIGN', (0,0), (-1,-1), 'CENTER'), ('VALIGN', (0,0), (-1,-1), 'MIDDLE')]))
+    story.append(Spacer(1, 20))
+
+    # Descripción introductoria
+    intro_text = f"""¡Hola, <b>{username}</b>!<br/><br/>
+He analizado cómo te comunicaste en la última partida. Este informe va más allá de un simple reporte: está diseñado para entender cómo tu personalidad se refleja en el juego.<br/><br/>
+Te mostraré tus fortalezas que aportan al equipo y las áreas donde puedes mejorar para crecer aún más. Con cada partida aprendo más sobre ti y adapto mis recomendaciones para que se ajusten a tu estilo único.<br/><br/>
+Además, podrás acceder a métricas clave como las palabras más repetidas, palabras por minuto, volumen durante la partida y mucho más en <a href='http://www.platform.clutch.cl' color='white'>www.platform.clutch.cl</a>.<br/><br/>
+Este análisis es una herramienta personalizada creada para ayudarte a sacar lo mejor de ti."""
+    story.append(Paragraph(intro_text, normal_style))
+    story.append(Spacer(1, 20))
+
+    # 2. Resumen rápido (match stats)
+    metricas = structured_analysis_dict.get('metricas') or build_metric_summary(metrics)
+    if metricas:
+        tabla_data = [["Métrica clave", "Valor", "Estado"]] + [[m.get('nombre', ''), m.get('valor', ''), m.get('estado', '')] for m in metricas]
+        story.append(Table(tabla_data, colWidths=[160, 80, 80], style=[('BACKGROUND', (0,0), (-1,0), HexColor('#34495E')), ('TEXTCOLOR', (0,0), (-1,0), colors.white), ('ALIGN', (0,0), (-1,-1), 'CENTER'), ('TEXTCOLOR', (0,1), (-1,-1), colors.white), ('FONTSIZE', (0,0), (-1,-1), 12), ('GRID', (0,0), (-1,-1), 0.5, colors.white)]))
+    else:
+        story.append(Paragraph("No se encontraron métricas específicas.", normal_style))
+    story.append(Spacer(1, 10))
+    for chart in build_metric_charts(metrics):
+        story.append(chart)
+        story.append(Spacer(1, 8))
+
+    # 3. Fortalezas
+    story.append(Paragraph("FORTALEZAS", subtitle_style))
+    fortalezas = extract_fortalezas(analysis_text)
+    for fort in fortalezas:
+        story.append(Paragraph(f"✅ {fort}", normal_style))
+    story.append(Spacer(1, 10))
+
+    # 4. Áreas de mejora
+    story.append(Paragraph("ÁREAS DE MEJORA", subtitle_style))
+    mejoras = extract_mejoras(structured_analysis_str)
+    for idx, mejora in enumerate(mejoras, 1):
+        icono = "❌" if "crítico" in mejora.lower() or idx == 1 else "⚠"
+        story.append(Paragraph(f"{icono} {mejora}", normal_style))
+    story.append(Spacer(1, 10))
+
+    # 5. Recomendaciones específicas
+    story.append(Paragraph("RECOMENDACIONES ESPECÍFICAS", subtitle_style))
+    recomendaciones = extract_recomendaciones(structured_analysis_str)
+    for rec in recomendaciones:
+        story.append(Paragraph(f"💡 {rec}", normal_style))
+    story.append(Spacer(1, 10))
+
+    # 6. Observaciones de la IA
+    story.append(Paragraph("OBSERVACIONES DE LA IA", subtitle_style))
+    obs = clean_text_for_pdf(analysis_text)
+    obs = highlight_keywords(obs, ['comunicación', 'callout', 'equipo', 'frustración', 'soluciones', 'coordinación'])
+    story.append(Paragraph(obs, highlight_style))
+    story.append(Spacer(1, 10))
+
+    # 7. Cierre motivacional
+    story.append(Paragraph("CIERRE MOTIVACIONAL", subtitle_style))
+    story.append(Paragraph("En el campo, tu voz es tan importante como tu puntería. <br/><b>#Clutch</b>", conclusion_style))
+    story.append(Spacer(1, 10))
+
+    # Pie de Página
+    story.append(Spacer(1, 20))
+    disclaimer = "Este análisis es generado automáticamente por IA y no reemplaza la evaluación profesional."
+    story.append(Paragraph(disclaimer, meta_style))
+    clutch_url = "https://clutch.cl"
+    if logo_asset:
+        story.append(Image(logo_asset, width=40, height=40))
+    story.append(Paragraph(f"Más información en <a href='{clutch_url}' color='white'>{clutch_url}</a>", meta_style))
+
+    return story
+
+def create_analysis_pdf(analysis_text, structured_analysis, username, user_id, fecha_analisis=None, output_path=None, metrics=None):
+    """
+    Genera un PDF con fondo negro y encabezado en todas las páginas, letras blancas y títulos corregidos.
+    output_path puede ser una ruta o un archivo abierto en modo binario; sin output_path devuelve los bytes.
+    """
+    if output_path is None:
+        from io import BytesIO
+        buffer = BytesIO()
+        doc = BlackBackgroundDocTemplate(buffer, pagesize=A4)
+    else:
+        doc = BlackBackgroundDocTemplate(output_path, pagesize=A4)
+    # Guardar datos para encabezado en todas las páginas
+    doc.jugador = username
+    doc.user_id = user_id
+    doc.fecha_analisis = fecha_analisis if fecha_analisis else datetime.now().strftime("%d/%m/%Y - %H:%M")
+
+    doc.build(build_analysis_story(analysis_text, structured_analysis, username, metrics))
+    if output_path is None:
+        buffer.seek(0)
+        pdf_bytes = buffer.getvalue()
+        buffer.close()
+        return pdf_bytes
+    else:
+        return output_path
+
+def create_combined_pdf(analyses, title, output_path=None):
+    """
+    Combina varios análisis (dicts con los campos de entrada de main) en un solo PDF:
+    portada con índice y una sección por análisis.
+    """
+    styles = get_pdf_styles()
+    toc_style = ParagraphStyle('TOC', fontSize=12, leading=18, textColor=HexColor('#FFFFFF'), fontName='Helvetica')
+    section_style = ParagraphStyle('Section', parent=styles['subtitle'], fontSize=20, alignment=TA_CENTER)
+
+    if output_path is None:
+        from io import BytesIO
+        buffer = BytesIO()
+        doc = CombinedReportDocTemplate(buffer, pagesize=A4)
+    else:
+        doc = CombinedReportDocTemplate(output_path, pagesize=A4)
+    doc.cover_meta = (title, f"{len(analyses)} análisis", datetime.now().strftime("%d/%m/%Y - %H:%M"))
+
+    story = []
+    logo_asset = get_logo_asset()
+    if logo_asset:
+        story.append(Image(logo_asset, width=120, height=115))
+    story.append(Paragraph(title, styles['title']))
+    story.append(Paragraph("ÍNDICE", styles['subtitle']))
+    toc = TableOfContents()
+    toc.levelStyles = [toc_style]
+    toc.dotsMinLevel = 0
+    story.append(toc)
+
+    for index, data in enumerate(analyses, 1):
+        username = data.get('username', 'Usuario Desconocido')
+        user_id = data.get('user_id', 'ID_Desconocido')
+        fecha_analisis = data.get('fecha_analisis', '')
+        heading_text = f"{username} - {fecha_analisis}" if fecha_analisis else username
+        story.append(PageBreak())
+        heading = Paragraph(heading_text, section_style)
+        heading.section_meta = (username, user_id, fecha_analisis)
+        heading.toc_entry = (heading_text, f"section-{index}")
+        story.append(heading)
+        story.extend(build_analysis_story(
+            data.get('analysis_text', ''),
+            data.get('structured_analysis', ''),
+            username,
+            data.get('metrics')
+        ))
+
+    doc.multiBuild(story)
+    if output_path is None:
+        pdf_bytes = buffer.getvalue()
+        buffer.close()
+        return pdf_bytes
+    return output_path
+
+def get_general_evaluation(analysis_text):
+    """Devuelve una evaluación general simple basada en el texto."""
+    text = analysis_text.lower()
+    if any(w in text for w in ['excelente', 'muy bien', 'positivo', 'buena comunicación']):
+        return "Positivo"
+    if any(w in text for w in ['mejorar', 'frustración', 'desacuerdo', 'problema', 'necesita trabajo']):
+        return "Necesita trabajo"
+    return "Neutro"
+
+# Patrones precompilados: se compilan una sola vez al importar el módulo
+FORTALEZAS_RE = re.compile(r'(?:buena comunicación|callout específico|tono positivo|apoyo|coordinación|soluciones)', re.IGNORECASE)
+MEJORAS_SECTION_RE = re.compile(r'"Aspectos a mejorar":\s*(.*?)(?="Cómo mejorarlos"|$)', re.DOTALL | re.IGNORECASE)
+RECOMENDACIONES_SECTION_RE = re.compile(r'"Cómo mejorarlos":\s*(.*?)(?="Análisis detallado"|$)', re.DOTALL | re.IGNORECASE)
+BULLET_RE = re.compile(r'[-•]\s*(.+?)(?=\n[-•]|\n\n|$)', re.DOTALL)
+# Caracteres que no se muestran en el PDF. Incluye '*' y '`', así que también elimina
+# los delimitadores de markdown (**negrita**, *cursiva*, `código`) conservando su contenido.
+DISALLOWED_CHARS_RE = re.compile(r'[^\w\s\.,;:!?¿¡()\-"\'áéíóúñüÁÉÍÓÚÑÜ✅⭐]+')
+PDF_CHAR_REPLACEMENTS = (('…', '...'), ('—', '-'), ('–', '-'))
+
+def extract_fortalezas(analysis_text):
+    """Extrae fortalezas del análisis (simulado, puedes mejorar el algoritmo)."""
+    # Simulación: busca frases positivas
+    frases = FORTALEZAS_RE.findall(analysis_text)
+    if not frases:
+        frases = ["Buena disposición para mejorar", "Capacidad de reconocer aportes del equipo", "Interés en la coordinación"]
+    return frases[:5]
+
+def extract_mejoras(structured_analysis):
+    """Extrae áreas de mejora del análisis estructurado."""
+    aspectos = []
+    match = MEJORAS_SECTION_RE.search(structured_analysis)
+    if match:
+        aspectos_text = match.group(1)
+        aspectos = BULLET_RE.findall(aspectos_text)
+    if not aspectos:
+        aspectos = ["Evitar expresiones de frustración", "Ser más específico en los callouts", "Mantener información clara"]
+    return [clean_text_for_pdf(a) for a in aspectos]
+
+def extract_recomendaciones(structured_analysis):
+    """Extrae recomendaciones del análisis estructurado."""
+    recomendaciones = []
+    match = RECOMENDACIONES_SECTION_RE.search(structured_analysis)
+    if match:
+        rec_text = match.group(1)
+        recomendaciones = BULLET_RE.findall(rec_text)
+    if not recomendaciones:
+        recomendaciones = [
+            "Post-partida: anotar 1 jugada positiva y 1 lección aprendida.",
+            "Mid-game: mantener un ratio 2:1 de comentarios positivos/negativos.",
+            "Pre-match: definir objetivos de comunicación claros."
+        ]
+    return [clean_text_for_pdf(r) for r in recomendaciones]
+
+@functools.lru_cache(maxsize=32)
+def _keywords_pattern(keywords):
+    # Las palabras más largas primero para que la alternancia prefiera la coincidencia completa
+    alternatives = '|'.join(re.escape(kw) for kw in sorted(keywords, key=len, reverse=True))
+    return re.compile(rf'\b({alternatives})\b', re.IGNORECASE)
+
+def _bold_match(match):
+    # Una función es más rápida que expandir la plantilla r'<b>\1</b>' en cada coincidencia
+    return f"<b>{match.group(1)}</b>"
+
+def highlight_keywords(text, keywords):
+    """Resalta palabras clave en el texto usando HTML tags para PDF (una sola pasada para todas las palabras)."""
+    if not text or not keywords:
+        return text
+    return _keywords_pattern(tuple(keywords)).sub(_bold_match, text)
+
+def clean_text_for_pdf(text):
+    if not text:
+        return ""
+    for old, new in PDF_CHAR_REPLACEMENTS:
+        text = text.replace(old, new)
+    text = DISALLOWED_CHARS_RE.sub('', text)
+    return text.strip()
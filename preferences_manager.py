@@ -1,46 +1,71 @@
-import boto3
 import json
 from datetime import datetime
 import os
 import sys
-from typing import Dict, Optional
+import threading
+import time
+from typing import Dict
 from dotenv import load_dotenv
 from decimal import Decimal
+from log_config import get_logger
 
 # Cargar variables de entorno
 load_dotenv()
 
+logger = get_logger('preferences')
+
 # Configuración de DynamoDB
 DYNAMODB_REGION = os.getenv('AWS_REGION')
 PREFERENCES_TABLE_NAME = "ClutchPreferences"
 
 dynamodb = None
 DYNAMODB_AVAILABLE = False
+_initialized = False
+_init_lock = threading.Lock()
+# Tras un error al conectar se reintenta en una operación posterior, con backoff exponencial
+INIT_RETRY_BASE_DELAY = 1.0
+INIT_RETRY_MAX_DELAY = 60.0
+_init_failures = 0
+_init_retry_at = 0.0
 
-if DYNAMODB_REGION:
-    try:
-        dynamodb = boto3.resource(
-            'dynamodb',
-            region_name=DYNAMODB_REGION,
-            aws_access_key_id=os.getenv('AWS_ACCESS_KEY_ID'),
-            aws_secret_access_key=os.getenv('AWS_SECRET_ACCESS_KEY')
-        )
-        table = dynamodb.Table(PREFERENCES_TABLE_NAME)
-        table.load()  # Verifica que la tabla existe y se puede acceder
-        DYNAMODB_AVAILABLE = True
-        sys.stderr.write(f"✅ Conectado a DynamoDB tabla de preferencias: {PREFERENCES_TABLE_NAME}\n")
-    except Exception as e:
-        sys.stderr.write(f"❌ Error conectando a DynamoDB tabla de preferencias: {e}\n")
-        dynamodb = None
-else:
-    sys.stderr.write("⚠️  DynamoDB no configurado para preferencias.\n")
+
+def init_preferences_table():
+    """
+    Crea el recurso de DynamoDB y verifica la tabla de preferencias en la primera operación, no al
+    importar: clutch.js lanza este script una vez por comando y así boto3 (y la conexión) solo se
+    cargan cuando de verdad se va a leer o escribir. Devuelve DYNAMODB_AVAILABLE.
+    """
+    global dynamodb, DYNAMODB_AVAILABLE, _initialized, _init_failures, _init_retry_at
+    if _initialized or time.monotonic() < _init_retry_at:
+        return DYNAMODB_AVAILABLE
+    with _init_lock:
+        if _initialized or time.monotonic() < _init_retry_at:
+            return DYNAMODB_AVAILABLE
+        if DYNAMODB_REGION:
+            try:
+                import aws_clients
+                resource = aws_clients.create_resource('dynamodb', DYNAMODB_REGION)
+                resource.Table(PREFERENCES_TABLE_NAME).load()  # Verifica que la tabla existe y se puede acceder
+                dynamodb = resource
+                DYNAMODB_AVAILABLE = True
+                _initialized = True
+                logger.info("Conectado a DynamoDB tabla de preferencias: %s", PREFERENCES_TABLE_NAME)
+            except Exception as e:
+                _init_failures += 1
+                delay = min(INIT_RETRY_MAX_DELAY, INIT_RETRY_BASE_DELAY * 2 ** (_init_failures - 1))
+                _init_retry_at = time.monotonic() + delay
+                logger.error("Error conectando a DynamoDB tabla de preferencias (se reintenta en %.0f s): %s", delay, e)
+        else:
+            logger.warning("DynamoDB no configurado para preferencias.")
+            _initialized = True
+    return DYNAMODB_AVAILABLE
 
 
 def save_user_preferences(user_id: str, tts_preferences: dict, user_personality_test: list, profile_id: str = None) -> Dict:
     """
     Guarda las preferencias del usuario en DynamoDB.
     """
-    if not DYNAMODB_AVAILABLE:
+    if not init_preferences_table():
         return {'success': False, 'error': 'DynamoDB no está disponible.'}
 
     try:
@@ -57,12 +82,12 @@ def save_user_preferences(user_id: str, tts_preferences: dict, user_personality_
         }
         
         table.put_item(Item=item)
-        sys.stderr.write(f"✅ Preferencias guardadas para usuario: {user_id}\n")
+        logger.info("Preferencias guardadas para usuario: %s", user_id)
         return {'success': True, 'message': 'Preferencias guardadas correctamente'}
         
     except Exception as e:
         error_message = f"Error al guardar preferencias: {e}"
-        sys.stderr.write(f"❌ {error_message}\n")
+        logger.error(error_message)
         return {'success': False, 'error': error_message}
 
 
@@ -70,7 +95,7 @@ def get_user_preferences(user_id: str) -> Dict:
     """
     Obtiene las preferencias del usuario desde DynamoDB.
     """
-    if not DYNAMODB_AVAILABLE:
+    if not init_preferences_table():
         return {'success': False, 'error': 'DynamoDB no está disponible.'}
 
     try:
@@ -79,7 +104,7 @@ def get_user_preferences(user_id: str) -> Dict:
         
         if 'Item' in response:
             item = response['Item']
-            sys.stderr.write(f"✅ Preferencias encontradas para usuario: {user_id}\n")
+            logger.debug("Preferencias encontradas para usuario: %s", user_id)
             
             # Convertir Decimal a int para user_personality_test
             personality_test = item.get('user_personality_test', [])
@@ -96,12 +121,12 @@ def get_user_preferences(user_id: str) -> Dict:
                 }
             }
         else:
-            sys.stderr.write(f"ℹ️ No se encontraron preferencias para usuario: {user_id}\n")
+            logger.debug("No se encontraron preferencias para usuario: %s", user_id)
             return {'success': False, 'error': 'Usuario no encontrado'}
             
     except Exception as e:
         error_message = f"Error al obtener preferencias: {e}"
-        sys.stderr.write(f"❌ {error_message}\n")
+        logger.error(error_message)
         return {'success': False, 'error': error_message}
 
 
@@ -109,7 +134,7 @@ def update_user_preferences(user_id: str, tts_preferences: dict = None, user_per
     """
     Actualiza las preferencias del usuario en DynamoDB.
     """
-    if not DYNAMODB_AVAILABLE:
+    if not init_preferences_table():
         return {'success': False, 'error': 'DynamoDB no está disponible.'}
 
     try:
@@ -138,12 +163,12 @@ def update_user_preferences(user_id: str, tts_preferences: dict = None, user_per
             ExpressionAttributeValues=expression_values
         )
         
-        sys.stderr.write(f"✅ Preferencias actualizadas para usuario: {user_id}\n")
+        logger.info("Preferencias actualizadas para usuario: %s", user_id)
         return {'success': True, 'message': 'Preferencias actualizadas correctamente'}
         
     except Exception as e:
         error_message = f"Error al actualizar preferencias: {e}"
-        sys.stderr.write(f"❌ {error_message}\n")
+        logger.error(error_message)
         return {'success': False, 'error': error_message}
 
 
@@ -151,25 +176,23 @@ def delete_user_preferences(user_id: str) -> Dict:
     """
     Elimina las preferencias del usuario de DynamoDB.
     """
-    if not DYNAMODB_AVAILABLE:
+    if not init_preferences_table():
         return {'success': False, 'error': 'DynamoDB no está disponible.'}
 
     try:
         table = dynamodb.Table(PREFERENCES_TABLE_NAME)
         table.delete_item(Key={'user_id': user_id})
         
-        sys.stderr.write(f"✅ Preferencias eliminadas para usuario: {user_id}\n")
+        logger.info("Preferencias eliminadas para usuario: %s", user_id)
         return {'success': True, 'message': 'Preferencias eliminadas correctamente'}
         
     except Exception as e:
         error_message = f"Error al eliminar preferencias: {e}"
-        sys.stderr.write(f"❌ {error_message}\n")
+        logger.error(error_message)
         return {'success': False, 'error': error_message}
 
 
 if __name__ == "__main__":
-    import sys
-    import json
     # Permite ejecutar funciones desde la línea de comandos para Node.js
     if len(sys.argv) >= 3:
         action = sys.argv[1]
@@ -1,47 +1,420 @@
-import boto3
+import hashlib
+import itertools
 import os
+import random
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, wait
 from botocore.exceptions import NoCredentialsError
+import aws_clients
+from log_config import get_logger
+
+logger = get_logger('s3')
+
+# Límites de expiración para URLs prefirmadas (SigV4 permite hasta 7 días)
+PRESIGNED_URL_MIN_EXPIRES = 60
+PRESIGNED_URL_MAX_EXPIRES = 7 * 24 * 3600
+# Fracción de expires_in que todavía le tiene que quedar a una URL cacheada para reutilizarla:
+# quien pide una URL de 7 días no recibe una que muere en un minuto
+PRESIGNED_URL_REUSE_FRACTION = float(os.getenv('S3_PRESIGNED_REUSE_FRACTION', '0.5'))
+PRESIGNED_URL_CACHE_SIZE = int(os.getenv('S3_PRESIGNED_CACHE_SIZE', '4096'))
+# Tamaño máximo aceptado en las subidas directas a S3 (mismo límite que la API)
+UPLOAD_SLOT_MAX_BYTES = int(os.getenv('S3_UPLOAD_MAX_BYTES', str(50 * 1024 * 1024)))
+# Subida multipart: por encima del umbral el audio se sube en partes concurrentes.
+# S3 exige partes de al menos 5 MiB (salvo la última).
+MULTIPART_THRESHOLD = int(os.getenv('S3_MULTIPART_THRESHOLD', str(8 * 1024 * 1024)))
+MULTIPART_PART_SIZE = max(5 * 1024 * 1024, int(os.getenv('S3_MULTIPART_PART_SIZE', str(8 * 1024 * 1024))))
+MULTIPART_CONCURRENCY = max(1, int(os.getenv('S3_MULTIPART_CONCURRENCY', '4')))
+MULTIPART_PART_RETRIES = max(1, int(os.getenv('S3_MULTIPART_PART_RETRIES', '3')))
+# Prefijo y clase de almacenamiento para los originales conservados tras transcodificar
+COLD_AUDIO_PREFIX = os.getenv('S3_COLD_AUDIO_PREFIX', 'audios-original')
+COLD_STORAGE_CLASS = os.getenv('S3_COLD_STORAGE_CLASS', 'GLACIER_IR')
+# Cantidad de keys confirmadas como existentes que se recuerdan para evitar HEADs repetidos, y
+# por cuántos segundos (un objeto borrado o expirado por lifecycle deja de darse por existente)
+EXISTING_KEYS_CACHE_SIZE = int(os.getenv('S3_EXISTING_KEYS_CACHE_SIZE', '16384'))
+EXISTING_KEYS_CACHE_TTL = float(os.getenv('S3_EXISTING_KEYS_CACHE_TTL', '3600'))
+# Key (que no tiene por qué existir) que lee warm_up: usa s3:GetObject, que la app ya necesita, en
+# lugar de s3:ListBucket como el HEAD del bucket. Es un GET y no un HEAD porque solo el cuerpo del
+# error distingue una key inexistente de un bucket inexistente o de credenciales inválidas.
+WARM_UP_KEY = 'audios/.warm-up'
+
+def is_not_found(error):
+    """¿El error de un HEAD/GET es un 404 (la key no existe)? Throttling, 403 o red no lo son."""
+    response = getattr(error, 'response', None) or {}
+    return (response.get('Error', {}).get('Code') in ('404', 'NoSuchKey', 'NotFound')
+            or response.get('ResponseMetadata', {}).get('HTTPStatusCode') == 404)
+
+def warm_up_reached(error):
+    """
+    ¿El error del GET de WARM_UP_KEY igual confirma bucket y credenciales? NoSuchKey es lo esperado;
+    sin s3:ListBucket S3 responde AccessDenied a una key inexistente.
+    """
+    response = getattr(error, 'response', None) or {}
+    return response.get('Error', {}).get('Code') in ('NoSuchKey', 'AccessDenied')
+
+def _iter_chunks(source, chunk_size):
+    """
+    Recorre una fuente de audio en bloques de chunk_size bytes.
+    Acepta bytes/bytearray/memoryview, objetos tipo archivo (con read) o iteradores de bytes.
+    """
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        data = bytes(source) if not isinstance(source, bytes) else source
+        for offset in range(0, len(data), chunk_size):
+            yield data[offset:offset + chunk_size]
+        return
+    if hasattr(source, 'read'):
+        while True:
+            chunk = source.read(chunk_size)
+            if not chunk:
+                return
+            yield chunk
+        return
+    pending = bytearray()
+    for piece in source:
+        pending += piece
+        while len(pending) >= chunk_size:
+            yield bytes(pending[:chunk_size])
+            del pending[:chunk_size]
+    if pending:
+        yield bytes(pending)
 
 class S3Manager:
     def __init__(self):
         self.bucket_name = os.getenv('S3_BUCKET_NAME')
         self.region = os.getenv('AWS_REGION')
         self.available = bool(self.bucket_name and self.region)
-        if self.available:
-            self.s3 = boto3.client(
-                's3',
-                region_name=self.region,
-                aws_access_key_id=os.getenv('AWS_ACCESS_KEY_ID'),
-                aws_secret_access_key=os.getenv('AWS_SECRET_ACCESS_KEY')
-            )
+        # Cache de URLs prefirmadas: (key, expires_in) -> (url, expira_en)
+        self._presigned_cache = OrderedDict()
+        self._presigned_lock = threading.Lock()
+        # Pool acotado compartido para subir partes multipart
+        self._part_executor = None
+        self._part_executor_lock = threading.Lock()
+        # Keys de contenido ya confirmadas en S3 (los objetos direccionados por hash no cambian):
+        # key -> instante en que deja de darse por existente
+        self._existing_keys = OrderedDict()
+        self._existing_keys_lock = threading.Lock()
+        # El cliente se crea en warm_up() (arranque de la API) o en el primer uso, no al importar
+        self._s3 = None
+        self._client_lock = threading.Lock()
+
+    @property
+    def s3(self):
+        if self._s3 is None:
+            with self._client_lock:
+                if self._s3 is None:
+                    self._s3 = aws_clients.create_client('s3', self.region)
+        return self._s3
+
+    def warm_up(self):
+        """GET de WARM_UP_KEY: crea el cliente, resuelve credenciales y deja una conexión abierta en el pool."""
+        if not self.available:
+            return False
+        try:
+            self.s3.get_object(Bucket=self.bucket_name, Key=WARM_UP_KEY, Range='bytes=0-0')['Body'].close()
+            return True
+        except Exception as e:
+            if warm_up_reached(e):
+                return True
+            logger.error("Error conectando al bucket %s: %s", self.bucket_name, e)
+            return False
+
+    @staticmethod
+    def audio_key(user_id, filename):
+        return f"audios/{user_id}/{filename}"
+
+    def object_url(self, key):
+        return f"https://{self.bucket_name}.s3.{self.region}.amazonaws.com/{key}"
 
     def upload_audio_from_bytes(self, audio_bytes, user_id, filename):
+        return self.upload_audio(audio_bytes, user_id, filename)
+
+    def upload_audio(self, source, user_id, filename, content_type='audio/mpeg'):
+        """
+        Sube un audio a S3. Hasta MULTIPART_THRESHOLD bytes usa un único put_object;
+        por encima usa multipart con partes concurrentes y reintentos por parte.
+        source puede ser bytes, un objeto tipo archivo o un iterador de bytes.
+        """
         if not self.available:
             return ''
-        key = f"audios/{user_id}/{filename}"
+        return self._upload_object(self.audio_key(user_id, filename), source, content_type)
+
+    def upload_original_audio(self, source, user_id, filename, content_type='audio/mpeg'):
+        """Guarda el audio original en el prefijo frío (COLD_AUDIO_PREFIX) con almacenamiento de bajo costo."""
+        if not self.available:
+            return ''
+        key = f"{COLD_AUDIO_PREFIX}/{user_id}/{filename}"
+        if self.object_exists(key):
+            return self.object_url(key)
+        url = self._upload_object(key, source, content_type, storage_class=COLD_STORAGE_CLASS)
+        if url:
+            self.remember_existing(key)
+        return url
+
+    @staticmethod
+    def content_filename(data, extension):
+        """
+        Nombre direccionado por contenido: sha256 de data más la extensión. La ingesta lo calcula sobre
+        el audio recibido (la fuente): con transcodificación, audios/{user}/{sha256 del MP3}.ogg guarda
+        el Opus de ese MP3, así un audio repetido se detecta antes de transcodificarlo.
+        """
+        return f"{hashlib.sha256(data).hexdigest()}.{extension}"
+
+    def is_known_existing(self, key):
+        """True si la key se confirmó en S3 hace menos de EXISTING_KEYS_CACHE_TTL segundos (sin llamadas de red)."""
+        with self._existing_keys_lock:
+            expires = self._existing_keys.get(key)
+            if expires is None:
+                return False
+            if expires <= time.monotonic():
+                del self._existing_keys[key]
+                return False
+            self._existing_keys.move_to_end(key)
+            return True
+
+    def remember_existing(self, key):
+        with self._existing_keys_lock:
+            self._existing_keys[key] = time.monotonic() + EXISTING_KEYS_CACHE_TTL
+            self._existing_keys.move_to_end(key)
+            while len(self._existing_keys) > EXISTING_KEYS_CACHE_SIZE:
+                self._existing_keys.popitem(last=False)
+
+    def object_exists(self, key):
+        """
+        HEAD barato para saber si un objeto existe. Los resultados positivos quedan en cache (con TTL).
+        Solo un 404 es False: cualquier otro error (throttling, 403, red) se propaga, porque darlo por
+        ausente haría volver a subir el objeto.
+        """
+        if not self.available:
+            return False
+        if self.is_known_existing(key):
+            return True
+        try:
+            self.s3.head_object(Bucket=self.bucket_name, Key=key)
+        except Exception as e:
+            if is_not_found(e):
+                return False
+            logger.error("Error checking S3 object %s: %s", key, e)
+            raise
+        self.remember_existing(key)
+        return True
+
+    def find_existing_audio(self, data, user_id, extension):
+        """
+        Calcula el nombre direccionado por contenido de data y verifica si ya está en S3.
+        Devuelve (filename, existe).
+        """
+        filename = self.content_filename(data, extension)
+        return filename, self.object_exists(self.audio_key(user_id, filename))
+
+    def upload_audio_deduplicated(self, data, user_id, filename=None, content_type='audio/mpeg', extension='mp3', known_absent=False):
+        """
+        Sube un audio bajo una key direccionada por contenido (audios/{user_id}/{sha256}.{ext}, ver
+        content_filename). Si el objeto ya existe no se vuelve a subir. Con known_absent=True el
+        llamador ya verificó filename con find_existing_audio y no se repite el HEAD.
+        Devuelve (url, key, subido).
+        """
+        if not self.available:
+            return '', '', False
+        filename = filename or self.content_filename(data, extension)
+        key = self.audio_key(user_id, filename)
+        if not known_absent and self.object_exists(key):
+            return self.object_url(key), key, False
+        url = self._upload_object(key, data, content_type)
+        if not url:
+            return '', '', False
+        self.remember_existing(key)
+        return url, key, True
+
+    def _upload_object(self, key, source, content_type, storage_class=None):
+        extra_args = {'ContentType': content_type}
+        if storage_class:
+            extra_args['StorageClass'] = storage_class
         try:
-            self.s3.put_object(Bucket=self.bucket_name, Key=key, Body=audio_bytes, ContentType='audio/mpeg')
-            url = f"https://{self.bucket_name}.s3.{self.region}.amazonaws.com/{key}"
-            return url
+            if isinstance(source, (bytes, bytearray, memoryview)) and len(source) <= MULTIPART_THRESHOLD:
+                self.s3.put_object(Bucket=self.bucket_name, Key=key, Body=bytes(source), **extra_args)
+                return self.object_url(key)
+            parts = _iter_chunks(source, MULTIPART_PART_SIZE)
+            # Leer por adelantado hasta superar el umbral para decidir si vale la pena multipart
+            buffered = []
+            total = 0
+            for part in parts:
+                buffered.append(part)
+                total += len(part)
+                if total > MULTIPART_THRESHOLD:
+                    break
+            if total <= MULTIPART_THRESHOLD:
+                self.s3.put_object(Bucket=self.bucket_name, Key=key, Body=b''.join(buffered), **extra_args)
+            else:
+                self._multipart_upload(key, buffered, parts, extra_args)
+            return self.object_url(key)
         except NoCredentialsError:
             return ''
         except Exception as e:
-            print(f"Error uploading to S3: {e}")
+            logger.error("Error uploading to S3: %s", e)
             return ''
 
+    def _get_part_executor(self):
+        with self._part_executor_lock:
+            if self._part_executor is None:
+                self._part_executor = ThreadPoolExecutor(max_workers=MULTIPART_CONCURRENCY, thread_name_prefix='s3-part')
+            return self._part_executor
+
+    def _upload_part(self, key, upload_id, part_number, body):
+        """Sube una parte, reintentando con backoff exponencial sin reiniciar el archivo completo."""
+        for attempt in range(1, MULTIPART_PART_RETRIES + 1):
+            try:
+                response = self.s3.upload_part(
+                    Bucket=self.bucket_name, Key=key, UploadId=upload_id,
+                    PartNumber=part_number, Body=body
+                )
+                return {'PartNumber': part_number, 'ETag': response['ETag']}
+            except Exception as e:
+                if attempt == MULTIPART_PART_RETRIES:
+                    raise
+                delay = (2 ** (attempt - 1)) * 0.5 + random.uniform(0, 0.25)
+                logger.warning("Retrying S3 part %d of %s in %.2fs: %s", part_number, key, delay, e)
+                time.sleep(delay)
+
+    def _multipart_upload(self, key, buffered, parts, extra_args):
+        upload = self.s3.create_multipart_upload(Bucket=self.bucket_name, Key=key, **extra_args)
+        upload_id = upload['UploadId']
+        executor = self._get_part_executor()
+        # Limita las partes en memoria por subida a MULTIPART_CONCURRENCY
+        slots = threading.BoundedSemaphore(MULTIPART_CONCURRENCY)
+        errors = []
+        futures = []
+
+        def on_part_done(future):
+            slots.release()
+            if not future.cancelled() and future.exception():
+                errors.append(future.exception())
+
+        try:
+            for part_number, chunk in enumerate(itertools.chain(buffered, parts), start=1):
+                slots.acquire()
+                if errors:
+                    slots.release()
+                    raise errors[0]
+                future = executor.submit(self._upload_part, key, upload_id, part_number, chunk)
+                future.add_done_callback(on_part_done)
+                futures.append(future)
+            completed = [future.result() for future in futures]
+            self.s3.complete_multipart_upload(
+                Bucket=self.bucket_name, Key=key, UploadId=upload_id,
+                MultipartUpload={'Parts': completed}
+            )
+        except Exception:
+            for future in futures:
+                future.cancel()
+            # Esperar las partes en curso antes de abortar para no dejar partes huérfanas
+            wait(futures)
+            try:
+                self.s3.abort_multipart_upload(Bucket=self.bucket_name, Key=key, UploadId=upload_id)
+            except Exception as abort_error:
+                logger.error("Error aborting multipart upload for %s: %s", key, abort_error)
+            raise
+
     def generate_presigned_url(self, user_id, filename, expires_in=300):
+        """
+        Genera (o reutiliza desde la cache) una URL prefirmada para un audio.
+        Una URL cacheada se reutiliza mientras le quede al menos PRESIGNED_URL_REUSE_FRACTION de expires_in.
+        """
         if not self.available:
             return ''
-        key = f"audios/{user_id}/{filename}"
+        expires_in = max(PRESIGNED_URL_MIN_EXPIRES, min(int(expires_in), PRESIGNED_URL_MAX_EXPIRES))
+        key = self.audio_key(user_id, filename)
+        cache_key = (key, expires_in)
+        min_remaining = expires_in * PRESIGNED_URL_REUSE_FRACTION
+        now = time.time()
+        with self._presigned_lock:
+            cached = self._presigned_cache.get(cache_key)
+            if cached and cached[1] - now >= min_remaining:
+                self._presigned_cache.move_to_end(cache_key)
+                return cached[0]
         try:
             url = self.s3.generate_presigned_url(
                 'get_object',
                 Params={'Bucket': self.bucket_name, 'Key': key},
                 ExpiresIn=expires_in
             )
-            return url
         except Exception as e:
-            print(f"Error generating presigned URL: {e}")
+            logger.error("Error generating presigned URL: %s", e)
             return ''
+        with self._presigned_lock:
+            self._presigned_cache[cache_key] = (url, now + expires_in)
+            self._presigned_cache.move_to_end(cache_key)
+            while len(self._presigned_cache) > PRESIGNED_URL_CACHE_SIZE:
+                self._presigned_cache.popitem(last=False)
+        return url
+
+    def generate_presigned_urls(self, items, expires_in=300):
+        """
+        Genera URLs prefirmadas para varios pares (user_id, filename) en una sola llamada.
+        Devuelve una lista en el mismo orden con la URL o '' si no se pudo generar.
+        """
+        return [self.generate_presigned_url(user_id, filename, expires_in) for user_id, filename in items]
+
+    def generate_upload_slot(self, user_id, filename, content_type='audio/mpeg', max_bytes=UPLOAD_SLOT_MAX_BYTES, expires_in=900):
+        """
+        Genera una política de POST prefirmado para que el cliente suba un audio directamente a S3.
+        La política fija la key, el Content-Type y el rango de tamaño permitido.
+        """
+        if not self.available:
+            return None
+        key = self.audio_key(user_id, filename)
+        try:
+            post = self.s3.generate_presigned_post(
+                Bucket=self.bucket_name,
+                Key=key,
+                Fields={'Content-Type': content_type},
+                Conditions=[
+                    {'Content-Type': content_type},
+                    ['content-length-range', 1, max_bytes]
+                ],
+                ExpiresIn=expires_in
+            )
+            return {'key': key, 'url': post['url'], 'fields': post['fields'], 'max_bytes': max_bytes}
+        except Exception as e:
+            logger.error("Error generating presigned POST: %s", e)
+            return None
+
+    def head_audio(self, key):
+        """
+        Verifica con un HEAD que un objeto existe en S3.
+        Devuelve {'size', 'content_type'} o None si no existe o no se pudo consultar.
+        """
+        if not self.available:
+            return None
+        try:
+            response = self.s3.head_object(Bucket=self.bucket_name, Key=key)
+            return {'size': response.get('ContentLength', 0), 'content_type': response.get('ContentType', '')}
+        except Exception as e:
+            logger.error("Error checking S3 object %s: %s", key, e)
+            return None
+
+    def put_bytes(self, key, data, content_type='application/octet-stream'):
+        """Sube un objeto arbitrario (p. ej. reports/{hash}.pdf) desde bytes o un archivo abierto. Devuelve True si se subió."""
+        if not self.available:
+            return False
+        try:
+            self.s3.put_object(Bucket=self.bucket_name, Key=key, Body=data, ContentType=content_type)
+            self.remember_existing(key)
+            return True
+        except Exception as e:
+            logger.error("Error uploading %s to S3: %s", key, e)
+            return False
+
+    def get_bytes(self, key):
+        """Descarga un objeto completo. Devuelve None si no existe o no se pudo leer."""
+        if not self.available:
+            return None
+        try:
+            response = self.s3.get_object(Bucket=self.bucket_name, Key=key)
+            return response['Body'].read()
+        except Exception as e:
+            if getattr(e, 'response', {}).get('Error', {}).get('Code') not in ('NoSuchKey', '404'):
+                logger.error("Error downloading %s from S3: %s", key, e)
+            return None
 
 s3_manager = S3Manager()
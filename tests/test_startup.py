@@ -0,0 +1,52 @@
+# -*- coding: utf-8 -*-
+"""
+Regresiones de arranque de los scripts que lanza clutch.js.
+
+Reutiliza benchmarks/bench_startup.py: cada entry point tiene que importarse dentro de su
+presupuesto en ms por encima del intérprete vacío, y sin cargar los paquetes pesados que solo
+necesita cuando hace trabajo real (se importan de forma perezosa).
+
+STARTUP_TEST_RUNS cambia la cantidad de corridas por medición (por defecto 7).
+"""
+
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, 'benchmarks'))
+
+import bench_startup  # noqa: E402
+
+RUNS = int(os.getenv('STARTUP_TEST_RUNS', '7'))
+ENV = dict(os.environ, PYTHONPATH=ROOT)
+
+# Paquetes que ningún entry point debe cargar al importarse
+HEAVY_MODULES = ('reportlab', 'boto3', 'botocore', 'openai', 'PIL', 'numpy', 'pydub', 'urllib3')
+
+
+@pytest.fixture(scope='module')
+def baseline():
+    return bench_startup.measure_wall(['-c', 'pass'], RUNS, ENV)
+
+
+@pytest.mark.parametrize('module', sorted(bench_startup.ENTRY_POINTS))
+def test_entry_point_no_carga_paquetes_pesados(module):
+    code = (
+        f"import sys, json, {module}\n"
+        f"print(json.dumps([m for m in {HEAVY_MODULES!r} if m in sys.modules]))"
+    )
+    completed = subprocess.run([sys.executable, '-c', code], cwd=ROOT, env=ENV,
+                               capture_output=True, text=True, check=True)
+    assert json.loads(completed.stdout.strip().splitlines()[-1]) == []
+
+
+@pytest.mark.parametrize('module', sorted(bench_startup.ENTRY_POINTS))
+def test_entry_point_dentro_del_presupuesto(module, baseline):
+    budget = bench_startup.ENTRY_POINTS[module]
+    elapsed = bench_startup.measure_wall(['-c', f'import {module}'], RUNS, ENV)
+    over_ms = (elapsed - baseline) * 1000
+    assert over_ms <= budget, f"{module} tarda {over_ms:.1f} ms sobre el intérprete vacío (presupuesto {budget} ms)"
@@ -0,0 +1,139 @@
+"""
+Compresión de los textos largos de los items de análisis (transcription, analysis_text,
+structured_analysis y la serie loudness_by_second, que se guarda como JSON).
+
+Las sesiones largas acercan el item al límite de 400 KB de DynamoDB, y cada consulta del
+historial paga capacidad de lectura por todo el texto. Un texto de más de
+TEXT_COMPRESSION_THRESHOLD bytes (UTF-8) se guarda como atributo Binary: un byte de formato
+seguido del texto comprimido. Si comprimido todavía supera TEXT_S3_OVERFLOW_BYTES, va a S3
+(texts/{user_id}/{analysis_id}/{campo}) y el atributo guarda solo el puntero.
+
+Formato (primer byte del Binary):
+    b'z'  zlib
+    b's'  zstd (DYNAMODB_TEXT_CODEC=zstd, requiere el paquete zstandard; sin él se usa zlib)
+    b'@'  puntero a S3: el resto es la key, y el objeto tiene uno de los formatos anteriores
+
+Un atributo String es texto plano: los items anteriores y los textos cortos se leen sin cambios.
+get_analyses_by_user y get_analysis_by_id (y sus versiones asíncronas) devuelven siempre str.
+"""
+
+import os
+import zlib
+
+from log_config import get_logger
+
+logger = get_logger('text_compression')
+
+COMPRESSED_FIELDS = ('transcription', 'analysis_text', 'structured_analysis', 'loudness_by_second')
+TEXT_COMPRESSION_THRESHOLD = int(os.getenv('DYNAMODB_TEXT_COMPRESSION_THRESHOLD', '1024'))
+# Tres textos en el límite suman 300 KB (loudness_by_second comprimido ocupa pocos KB): queda margen
+# para el resto del item dentro de los 400 KB
+TEXT_S3_OVERFLOW_BYTES = int(os.getenv('DYNAMODB_TEXT_S3_OVERFLOW_BYTES', str(100 * 1024)))
+TEXT_CODEC = os.getenv('DYNAMODB_TEXT_CODEC', 'zlib').lower()
+TEXT_OVERFLOW_PREFIX = 'texts'
+
+FORMAT_ZLIB = b'z'
+FORMAT_ZSTD = b's'
+FORMAT_S3 = b'@'
+
+_zstd = None
+
+
+def _zstandard():
+    """Módulo zstandard (importado la primera vez), o None si no está instalado."""
+    global _zstd
+    if _zstd is None:
+        try:
+            import zstandard
+            _zstd = zstandard
+        except ImportError:
+            logger.warning("zstandard no está instalado: los textos se comprimen con zlib.")
+            _zstd = False
+    return _zstd or None
+
+
+def compress_text(text):
+    """Texto -> byte de formato + texto UTF-8 comprimido."""
+    data = text.encode('utf-8')
+    if TEXT_CODEC == 'zstd' and _zstandard():
+        return FORMAT_ZSTD + _zstandard().ZstdCompressor().compress(data)
+    return FORMAT_ZLIB + zlib.compress(data)
+
+
+def decompress_text(blob):
+    """Inversa de compress_text. ValueError si el formato no se reconoce."""
+    blob = bytes(blob)
+    marker, payload = blob[:1], blob[1:]
+    if marker == FORMAT_ZLIB:
+        return zlib.decompress(payload).decode('utf-8')
+    if marker == FORMAT_ZSTD:
+        if not _zstandard():
+            raise ValueError("El texto está comprimido con zstd y zstandard no está instalado")
+        return _zstandard().ZstdDecompressor().decompress(payload).decode('utf-8')
+    raise ValueError(f"Formato de texto comprimido desconocido: {marker!r}")
+
+
+def overflow_key(user_id, analysis_id, field):
+    return f"{TEXT_OVERFLOW_PREFIX}/{user_id}/{analysis_id}/{field}"
+
+
+def encode_item_texts(item):
+    """
+    Comprime en el item los textos que superan el umbral. Los que aun comprimidos superan
+    TEXT_S3_OVERFLOW_BYTES quedan como puntero a S3 y se devuelven como [(campo, key, blob)]:
+    el llamador debe subir cada blob a su key (y, si no puede, volver a poner el blob en el item).
+    """
+    overflow = []
+    for field in COMPRESSED_FIELDS:
+        value = item.get(field)
+        if not isinstance(value, str):
+            continue
+        size = len(value.encode('utf-8'))
+        if size <= TEXT_COMPRESSION_THRESHOLD:
+            continue
+        blob = compress_text(value)
+        if len(blob) >= size and size <= TEXT_S3_OVERFLOW_BYTES:
+            # No se comprime (p. ej. texto ya comprimido): queda como String
+            continue
+        if len(blob) > TEXT_S3_OVERFLOW_BYTES:
+            key = overflow_key(item['user_id'], item['id'], field)
+            item[field] = FORMAT_S3 + key.encode('utf-8')
+            overflow.append((field, key, blob))
+        else:
+            item[field] = blob
+    return overflow
+
+
+def decode_item_texts(item):
+    """
+    Descomprime en el item los textos guardados como Binary (también acepta boto3 Binary).
+    Devuelve [(campo, key)] de los que están en S3: el llamador los descarga y completa con
+    resolve_overflow. Mientras tanto esos campos quedan como ''.
+    """
+    overflow = []
+    for field in COMPRESSED_FIELDS:
+        value = item.get(field)
+        if value is None or isinstance(value, str):
+            continue
+        blob = bytes(getattr(value, 'value', value))
+        if blob[:1] == FORMAT_S3:
+            item[field] = ''
+            overflow.append((field, blob[1:].decode('utf-8')))
+            continue
+        try:
+            item[field] = decompress_text(blob)
+        except Exception as e:
+            logger.error("No se pudo descomprimir %s del análisis %s: %s", field, item.get('id'), e)
+            item[field] = ''
+    return overflow
+
+
+def resolve_overflow(item, field, key, blob):
+    """Completa un campo que estaba en S3 con el objeto descargado (None si no se pudo)."""
+    if blob is None:
+        logger.error("No se pudo leer %s del análisis %s desde S3 (%s)", field, item.get('id'), key)
+        return
+    try:
+        item[field] = decompress_text(blob)
+    except Exception as e:
+        logger.error("No se pudo descomprimir %s del análisis %s: %s", field, item.get('id'), e)
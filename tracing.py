@@ -0,0 +1,349 @@
+"""
+Trazas de una grabación a través del bot, el procesador, OpenAI, el generador de PDF, la API y AWS.
+
+El contexto viaja en formato W3C traceparent ("00-<trace_id>-<span_id>-01"): como argumento
+de línea de comandos o variable TRACEPARENT para los scripts, como campo "traceparent" en los
+trabajos de pdf_generator y como header traceparent en la API. Cada proceso abre spans hijos
+del contexto recibido y los exporta en formato OTLP/JSON (el mismo que escribe el file exporter
+del OpenTelemetry Collector): una línea ExportTraceServiceRequest por lote en TRACE_EXPORT_FILE.
+
+Sin TRACE_EXPORT_FILE los spans se crean igual (para propagar el contexto) pero no se escriben.
+La escritura ocurre en un hilo propio, nunca en el hilo del request.
+"""
+
+import atexit
+import contextvars
+import functools
+import inspect
+import json
+import logging
+import os
+import queue
+import re
+import secrets
+import threading
+import time
+from contextlib import contextmanager
+
+from log_config import add_filter
+
+TRACE_EXPORT_FILE = os.getenv('TRACE_EXPORT_FILE')
+SERVICE_NAME = os.getenv('OTEL_SERVICE_NAME', 'clutch')
+EXPORT_BATCH_SIZE = 512
+
+# Valores de SpanKind y StatusCode de OTLP
+KIND_INTERNAL, KIND_SERVER, KIND_CLIENT = 1, 2, 3
+STATUS_UNSET, STATUS_OK, STATUS_ERROR = 0, 1, 2
+
+TRACEPARENT_RE = re.compile(r'^00-([0-9a-f]{32})-([0-9a-f]{16})-[0-9a-f]{2}$')
+
+_current_span = contextvars.ContextVar('clutch_current_span', default=None)
+
+
+class Span:
+    __slots__ = ('name', 'trace_id', 'span_id', 'parent_id', 'kind', 'start_ns', 'end_ns', 'attributes', 'status', 'status_message')
+
+    def __init__(self, name, trace_id, parent_id=None, kind=KIND_INTERNAL, attributes=None):
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = secrets.token_hex(8)
+        self.parent_id = parent_id
+        self.kind = kind
+        self.start_ns = time.time_ns()
+        self.end_ns = None
+        self.attributes = dict(attributes) if attributes else {}
+        self.status = STATUS_UNSET
+        self.status_message = None
+
+    @property
+    def traceparent(self):
+        return f"00-{self.trace_id}-{self.span_id}-01"
+
+    def set_attribute(self, key, value):
+        if value is not None:
+            self.attributes[key] = value
+
+    def set_error(self, message):
+        self.status = STATUS_ERROR
+        self.status_message = str(message)[:500]
+
+    def end(self):
+        if self.end_ns is None:
+            self.end_ns = time.time_ns()
+            _exporter.export(self)
+
+
+def parse_traceparent(value):
+    """Devuelve (trace_id, span_id) de un traceparent válido, o None."""
+    match = TRACEPARENT_RE.match((value or '').strip().lower())
+    if not match or match.group(1) == '0' * 32 or match.group(2) == '0' * 16:
+        return None
+    return match.group(1), match.group(2)
+
+
+def current_span():
+    return _current_span.get()
+
+
+def current_traceparent():
+    span = _current_span.get()
+    return span.traceparent if span else None
+
+
+def start_span(name, parent=None, kind=KIND_INTERNAL, attributes=None):
+    """
+    Crea un span (sin activarlo). parent puede ser un Span, un traceparent o None; con None se usa
+    el span activo y, si no hay ninguno, el span inicia una traza nueva.
+    """
+    if isinstance(parent, str):
+        parent = parse_traceparent(parent)
+    elif parent is None and _current_span.get() is not None:
+        parent = _current_span.get()
+    if isinstance(parent, Span):
+        return Span(name, parent.trace_id, parent.span_id, kind, attributes)
+    if parent:
+        return Span(name, parent[0], parent[1], kind, attributes)
+    return Span(name, secrets.token_hex(16), None, kind, attributes)
+
+
+@contextmanager
+def span(name, parent=None, kind=KIND_INTERNAL, **attributes):
+    """Abre un span hijo del activo (o de parent), lo deja activo dentro del bloque y lo cierra al salir."""
+    current = start_span(name, parent, kind, attributes)
+    token = _current_span.set(current)
+    try:
+        yield current
+    except BaseException as e:
+        current.set_error(f"{type(e).__name__}: {e}")
+        raise
+    finally:
+        _current_span.reset(token)
+        current.end()
+
+
+def traced(name):
+    """
+    Decorador: ejecuta la función (o corutina) dentro de un span; un resultado {'success': False}
+    lo marca como error.
+    """
+    def check_result(current, result):
+        if isinstance(result, dict) and result.get('success') is False:
+            current.set_error(result.get('error') or 'success=False')
+        return result
+
+    def decorate(func):
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                with span(name) as current:
+                    return check_result(current, await func(*args, **kwargs))
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(name) as current:
+                return check_result(current, func(*args, **kwargs))
+        return wrapper
+    return decorate
+
+
+def set_service_name(name):
+    """Nombre del servicio en el recurso OTLP (uno por proceso: bot, procesador, pdf, api)."""
+    global SERVICE_NAME
+    if not os.getenv('OTEL_SERVICE_NAME'):
+        SERVICE_NAME = name
+
+
+def _attribute_value(value):
+    if isinstance(value, bool):
+        return {'boolValue': value}
+    if isinstance(value, int):
+        return {'intValue': str(value)}
+    if isinstance(value, float):
+        return {'doubleValue': value}
+    return {'stringValue': str(value)}
+
+
+def _otlp_span(item):
+    data = {
+        'traceId': item.trace_id,
+        'spanId': item.span_id,
+        'name': item.name,
+        'kind': item.kind,
+        'startTimeUnixNano': str(item.start_ns),
+        'endTimeUnixNano': str(item.end_ns),
+        'attributes': [{'key': key, 'value': _attribute_value(value)} for key, value in item.attributes.items()],
+        'status': {'code': item.status},
+    }
+    if item.parent_id:
+        data['parentSpanId'] = item.parent_id
+    if item.status_message:
+        data['status']['message'] = item.status_message
+    return data
+
+
+def otlp_line(spans):
+    """Un ExportTraceServiceRequest en JSON (una línea) con los spans dados."""
+    request = {'resourceSpans': [{
+        'resource': {'attributes': [
+            {'key': 'service.name', 'value': {'stringValue': SERVICE_NAME}},
+            {'key': 'process.pid', 'value': {'intValue': str(os.getpid())}},
+        ]},
+        'scopeSpans': [{'scope': {'name': 'clutch.tracing'}, 'spans': [_otlp_span(item) for item in spans]}],
+    }]}
+    return json.dumps(request, ensure_ascii=False, separators=(',', ':')) + '\n'
+
+
+class _FileExporter:
+    """
+    Encola los spans terminados y un hilo los agrega al archivo por lotes. Cada lote es una sola
+    escritura con O_APPEND, así varios procesos pueden compartir el archivo sin mezclar líneas.
+    El hilo se (re)crea en el primer span de cada proceso, lo que cubre los hijos de fork.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.pid = None
+        self.queue = None
+        self.thread = None
+        self.lock = threading.Lock()
+
+    def export(self, item):
+        if not self.path:
+            return
+        if self.pid != os.getpid():
+            self._start()
+        self.queue.put(item)
+
+    def _start(self):
+        with self.lock:
+            if self.pid == os.getpid():
+                return
+            self.queue = queue.SimpleQueue()
+            self.thread = threading.Thread(target=self._run, args=(self.queue,), name='trace-exporter', daemon=True)
+            self.thread.start()
+            self.pid = os.getpid()
+            atexit.register(self.shutdown)
+            # Los procesos de multiprocessing terminan sin correr atexit, pero sí sus finalizadores
+            from multiprocessing import util
+            util.Finalize(None, self.shutdown, exitpriority=10)
+
+    def _run(self, pending):
+        while True:
+            batch = [pending.get()]
+            while len(batch) < EXPORT_BATCH_SIZE:
+                try:
+                    batch.append(pending.get_nowait())
+                except queue.Empty:
+                    break
+            stop = None in batch
+            spans = [item for item in batch if item is not None]
+            if spans:
+                try:
+                    fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+                    try:
+                        os.write(fd, otlp_line(spans).encode('utf-8'))
+                    finally:
+                        os.close(fd)
+                except OSError as e:
+                    logging.getLogger('clutch.tracing').warning("No se pudieron exportar %d spans: %s", len(spans), e)
+            if stop:
+                return
+
+    def shutdown(self):
+        """Escribe lo pendiente y detiene el hilo (idempotente)."""
+        if self.pid != os.getpid() or self.thread is None or not self.thread.is_alive():
+            return
+        self.queue.put(None)
+        self.thread.join(timeout=5)
+
+
+_exporter = _FileExporter(TRACE_EXPORT_FILE)
+
+
+def flush():
+    _exporter.shutdown()
+
+
+class TraceContextFilter(logging.Filter):
+    """Agrega trace_id y span_id a los registros emitidos dentro de un span."""
+
+    def filter(self, record):
+        current = _current_span.get()
+        if current is not None:
+            record.trace_id = current.trace_id
+            record.span_id = current.span_id
+        return True
+
+
+add_filter(TraceContextFilter())
+
+
+class TracingMiddleware:
+    """Middleware ASGI: un span SERVER por solicitud, hijo del header traceparent si viene."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+        traceparent = None
+        for name, value in scope.get('headers', ()):
+            if name == b'traceparent':
+                traceparent = value.decode('latin-1')
+                break
+        status = 500
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message['type'] == 'http.response.start':
+                status = message['status']
+            await send(message)
+
+        with span(scope['method'], traceparent, KIND_SERVER, **{'http.request.method': scope['method'], 'url.path': scope['path']}) as current:
+            try:
+                await self.app(scope, receive, send_wrapper)
+            finally:
+                route_path = getattr(scope.get('route'), 'path', None)
+                if route_path:
+                    current.name = f"{scope['method']} {route_path}"
+                    current.set_attribute('http.route', route_path)
+                current.set_attribute('http.response.status_code', status)
+                if status >= 500:
+                    current.set_error(f"HTTP {status}")
+
+
+def _before_call(model, context, **kwargs):
+    # Solo dentro de una traza: las llamadas sueltas (p. ej. partes multipart en otro hilo) no abren trazas nuevas
+    if _current_span.get() is None:
+        return
+    service = model.service_model.service_name
+    context['clutch_span'] = start_span(f"{service}.{model.name}", kind=KIND_CLIENT, attributes={
+        'rpc.system': 'aws-api', 'rpc.service': service, 'rpc.method': model.name,
+    })
+
+
+def _after_call(context, http_response=None, exception=None, **kwargs):
+    current = context.pop('clutch_span', None)
+    if current is None:
+        return
+    status = getattr(http_response, 'status_code', None)
+    current.set_attribute('http.response.status_code', status)
+    if exception is not None:
+        current.set_error(f"{type(exception).__name__}: {exception}")
+    elif status is not None and status >= 400 and status != 404:
+        current.set_error(f"HTTP {status}")
+    current.end()
+
+
+def instrument_boto_client(client):
+    """Registra hooks de botocore para abrir un span CLIENT por cada llamada a AWS."""
+    if client is None or getattr(client, '_clutch_traced', False):
+        return
+    events = client.meta.events
+    events.register('before-call.*.*', _before_call)
+    events.register('after-call.*.*', _after_call)
+    events.register('after-call-error.*.*', _after_call)
+    client._clutch_traced = True